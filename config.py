@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-import configparser
+from dataclasses import dataclass, field
 import os
 import random
 import subprocess
@@ -14,6 +14,11 @@ logging.basicConfig(level=logging.INFO, stream=sys.stdout,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Validators for a single '/'-delimited topic segment. parse_mqtt_device_topic() splits the topic
+# and checks fixed positions, so no pattern ever has to backtrack across the whole topic string.
+_SEGMENT_CHARS_RE = re.compile(r'[a-zA-Z0-9_-]+')
+_RELAY_SEGMENT_RE = re.compile(r'relay[a-zA-Z0-9]+')
+
 # --- Globals ---
 # These are loaded from the config file.
 highest_existing_device_instance = -1
@@ -24,14 +29,237 @@ highest_tank_sensor_idx_in_file = -1
 highest_virtual_battery_idx_in_file = -1
 highest_pv_charger_idx_in_file = -1
 discovered_modules_and_topics_global = {}
+_discovery_topics = {}  # Raw topics seen during discovery, filled by on_message()
+# Parsed (section_kind, key, entry) per section name, filled by load_existing_config_data().
+# Whatever changes or removes a section calls _invalidate_section() so only that one is parsed again.
+_section_cache = {}
+_changed_sections = set()  # Sections invalidated since the LoadedState was last brought up to date
+_module_subsections = {}  # Relay module index -> {name: None} of its switch_/input_ sections
+_device_list_cache = None  # build_device_list() result, reset whenever the LoadedState changes
 
 
 # --- Existing functions (unchanged) ---
+_SERIAL_RANGE = 10 ** 16
+
+TEMP_SENSOR_TYPES = ('battery', 'fridge', 'room', 'outdoor', 'water heater', 'freezer', 'generic')
+TEMP_SENSOR_TYPES_DISPLAY = ', '.join(TEMP_SENSOR_TYPES)
+_TEMP_SENSOR_TYPES_SET = frozenset(TEMP_SENSOR_TYPES)
+
+INPUT_TYPES = ('disabled', 'door alarm', 'bilge pump', 'bilge alarm', 'burglar alarm', 'smoke alarm', 'fire alarm', 'CO2 alarm')
+INPUT_TYPES_DISPLAY = ', '.join(INPUT_TYPES)
+# Answers are lowercased before the check (and external_devices.py expects 'co2 alarm')
+_INPUT_TYPES_SET = frozenset(input_type.lower() for input_type in INPUT_TYPES)
+
+FLUID_TYPES_MAP = {
+    'fuel': 0, 'fresh water': 1, 'waste water': 2, 'live well': 3,
+    'oil': 4, 'black water': 5, 'gasoline': 6, 'diesel': 7,
+    'lpg': 8, 'lng': 9, 'hydraulic oil': 10, 'raw water': 11
+}
+FLUID_TYPES_DISPLAY = ", ".join(f"'{name}'" for name in FLUID_TYPES_MAP)
+
+DEFAULT_TOPIC = 'path/to/mqtt/topic'
+
+_WS_DROP = str.maketrans('', '', ' \t\r\n')  # Strips all whitespace from a selection like '1, 3'
+
+# (option, prompt label) for each device type's MQTT state topics
+TEMP_TOPIC_KEYS = (
+    ('temperaturestatetopic', 'MQTT temperature state topic'),
+    ('humiditystatetopic', 'MQTT humidity state topic'),
+    ('batterystatetopic', 'MQTT battery state topic'),
+)
+
+TANK_TOPIC_KEYS = (
+    ('levelstatetopic', 'MQTT level state topic'),
+    ('batterystatetopic', 'MQTT battery state topic'),
+    ('temperaturestatetopic', 'MQTT temperature state topic'),
+    ('rawvaluestatetopic', 'MQTT raw value state topic'),
+)
+
+VIRTUAL_BATTERY_TOPIC_KEYS = (
+    ('currentstatetopic', 'MQTT battery current state topic'),
+    ('powerstatetopic', 'MQTT battery power state topic'),
+    ('temperaturestatetopic', 'MQTT temperature state topic'),
+    ('voltagestatetopic', 'MQTT voltage state topic'),
+    ('maxchargecurrentstatetopic', 'MQTT max charge current state topic'),
+    ('maxchargevoltagestatetopic', 'MQTT max charge voltage state topic'),
+    ('maxdischargecurrentstatetopic', 'MQTT max discharge current state topic'),
+    ('socstatetopic', 'MQTT SOC state topic'),
+    ('sohstatetopic', 'MQTT SOH state topic'),
+)
+
+PV_TOPIC_KEYS = (
+    ('batterycurrentstatetopic', 'battery current'),
+    ('batteryvoltagestatetopic', 'battery voltage'),
+    ('maxchargecurrentstatetopic', 'max charge current'),
+    ('maxchargevoltagestatetopic', 'max charge voltage'),
+    ('pvvoltagestatetopic', 'PV voltage'),
+    ('pvpowerstatetopic', 'PV power'),
+    ('chargerstatetopic', 'charger state'),
+    ('loadstatetopic', 'load state'),
+    ('totalyield', 'total user accumulated yield'),
+    ('systemyield', 'total system accumulated yield')
+)
+
+# Global counter option -> prefix of the device sections it counts
+GLOBAL_DEVICE_COUNTERS = (
+    ('numberofmodules', 'Relay_Module_'),
+    ('numberoftempsensors', 'Temp_Sensor_'),
+    ('numberoftanksensors', 'Tank_Sensor_'),
+    ('numberofvirtualbatteries', 'Virtual_Battery_'),
+    ('numberofpvchargers', 'Pv_Charger_'),
+)
+
+# Options filled in when missing from the Global and MQTT sections
+_GLOBAL_DEFAULTS = {option: '0' for option, _ in GLOBAL_DEVICE_COUNTERS}
+_MQTT_DEFAULTS = {'brokeraddress': 'localhost', 'port': '1883', 'username': '', 'password': ''}
+
+# Relay module payload defaults per auto-configured device type
+PAYLOAD_DEFAULTS = {
+    'dingtian': {'on_state': 'ON', 'off_state': 'OFF', 'on_cmd': 'ON', 'off_cmd': 'OFF'},
+    'shelly': {'on_state': '{"output": true}', 'off_state': '{"output": false}', 'on_cmd': 'on', 'off_cmd': 'off'},
+}
+
 def generate_serial():
     """Generates a random 16-digit serial number."""
-    return ''.join([str(random.randint(0, 9)) for _ in range(16)])
+    return f"{random.randrange(_SERIAL_RANGE):016d}"
+
+def _iter_config_sections(config_path):
+    """
+    Yields (section, {option: value}) for each section of an INI file in a single pass.
+    Follows the ConfigParser rules this file relies on: option names are lowercased, '=' or ':'
+    separates name and value, full-line '#'/';' comments are skipped and indented lines continue
+    the previous value. Values are returned as written, i.e. with '%' still escaped as '%%'.
+    """
+    section = None
+    options = {}
+    key = None
+    with open(config_path, 'r', buffering=65536) as configfile:
+        for line_number, line in enumerate(configfile, 1):
+            stripped = line.strip()
+            if not stripped or stripped[0] in '#;':
+                continue
+            if line[0].isspace() and key is not None:
+                options[key] = f"{options[key]}\n{stripped}" if options[key] else stripped
+                continue
+            if stripped[0] == '[' and stripped[-1] == ']':
+                if section is not None:
+                    yield section, options
+                section = stripped[1:-1].strip()
+                options = {}
+                key = None
+                continue
+            eq, colon = stripped.find('='), stripped.find(':')
+            split_at = min(pos for pos in (eq, colon, len(stripped)) if pos >= 0)
+            if section is None or split_at in (0, len(stripped)):
+                logger.warning(f"Ignoring unparsable line {line_number} in {config_path}: {stripped}")
+                key = None
+                continue
+            key = sys.intern(stripped[:split_at].rstrip().lower())
+            options[key] = stripped[split_at + 1:].lstrip()
+    if section is not None:
+        yield section, options
+
+def read_config_file(config_path):
+    """
+    Reads an INI file into a plain {section: {option: value}} dict; all editing happens on the dicts.
+    Option names are interned since they repeat in every device section. '%%' is unescaped to '%'.
+    """
+    config = {}
+    for section, options in _iter_config_sections(config_path):
+        for key, value in options.items():
+            if '%' in value:
+                options[key] = value.replace('%%', '%')
+        # A repeated section header adds to the earlier section rather than replacing it
+        config.setdefault(sys.intern(section), {}).update(options)
+    defaults = config.pop('DEFAULT', None)
+    if defaults:
+        for options in config.values():
+            for key, value in defaults.items():
+                options.setdefault(key, value)
+    return config
+
+def write_config_file(config, config_path):
+    """
+    Writes a {section: {option: value}} dict in the same layout as ConfigParser.write().
+    '%' is written as '%%', since the service reads the file with an interpolating ConfigParser.
+    The text goes to a temporary file next to config_path in one write and then replaces it,
+    so an interrupted save never leaves a truncated config.ini behind.
+    """
+    chunks = []
+    for section, options in config.items():
+        chunks.append(f"[{section}]\n")
+        for key, value in options.items():
+            value = str(value).replace('%', '%%').replace('\n', '\n\t')
+            chunks.append(f"{key} = {value}\n")
+        chunks.append("\n")
+    tmp_path = config_path + '.tmp'
+    with open(tmp_path, 'w') as configfile:
+        configfile.write(''.join(chunks))
+        configfile.flush()
+        os.fsync(configfile.fileno())
+    os.replace(tmp_path, config_path)
+
+_stdin_lines = None  # Iterator over pre-read stdin lines when stdin is not a terminal
+
+def _ask(prompt=''):
+    """
+    input() replacement. When stdin is redirected (scripted runs), all of it is read in one go
+    on first use and answers are handed out line by line; EOFError is raised once they run out.
+    """
+    global _stdin_lines
+    if _stdin_lines is None:
+        if sys.stdin.isatty():
+            return input(prompt)
+        _stdin_lines = iter(sys.stdin.read().splitlines())
+    print(prompt, end='', flush=True)
+    try:
+        return next(_stdin_lines)
+    except StopIteration:
+        raise EOFError from None
+
+def flush_if_dirty(config, config_path, dirty):
+    """Writes the config out if it has unsaved changes. Returns the new dirty flag."""
+    if dirty:
+        update_global_device_counts(config)
+        write_config_file(config, config_path)
+    return False
+
+def _invalidate_section(section):
+    """Drops the cached parse of a section that is about to be changed or removed."""
+    _section_cache.pop(section, None)
+    _changed_sections.add(section)
+
+def update_global_device_counts(config):
+    """Sets the Global numberof* counters from the device sections actually present."""
+    global_section = config.setdefault('Global', {})
+    for option, prefix in GLOBAL_DEVICE_COUNTERS:
+        global_section[option] = str(sum(1 for section in config if section.startswith(prefix)))
+
+def _assign_device_numbers(options, data_from_file, is_new_device_flow, device_instance_counter, device_index_sequencer,
+                           highest_existing_device_instance, highest_existing_device_index):
+    """
+    Sets 'deviceinstance' and 'deviceindex': the next free numbers for a new device, or the stored
+    ones when editing. Returns the (possibly advanced) instance counter and index sequencer.
+    """
+    if is_new_device_flow:
+        options['deviceinstance'] = str(device_instance_counter)
+        options['deviceindex'] = str(device_index_sequencer)
+        return device_instance_counter + 1, device_index_sequencer + 1
+
+    options['deviceinstance'] = str(data_from_file.get('deviceinstance', highest_existing_device_instance + 1))
+    options['deviceindex'] = str(data_from_file.get('deviceindex', highest_existing_device_index + 1))
+    return device_instance_counter, device_index_sequencer
+
+def _prompt_option(options, data_from_file, key, prompt, default):
+    """Prompts for one option, keeping the current (or default) value when the answer is blank."""
+    current = data_from_file.get(key, default)
+    options[key] = _ask(f"{prompt} (current: {current}): ") or current
 
 # --- MQTT Callbacks for Discovery ---
+def _is_ascii_digits(text):
+    """True for a non-empty string of 0-9 only (str.isdigit alone also accepts other unicode digits)."""
+    return text.isdigit() and text.isascii()
+
 def parse_mqtt_device_topic(topic):
     """
     Parses MQTT topics to extract device information (Dingtian or Shelly).
@@ -44,86 +272,149 @@ def parse_mqtt_device_topic(topic):
     component_id: 'r1', '0' (for shelly relay 0), None for general device topics
     full_topic_base: The base path for the device, e.g., 'dingtian/relay1a76f' or 'shellyplus1pm-08f9e0fe4034'
     """
-    logger.debug(f"Attempting to parse topic: {topic}")
-
-    # NEW: Dingtian Input Regex: Flexible 'dingtian' path segment, then 'relay[alphanumeric]', then optional path, then 'out/i[digits]'
-    # User specified that 'out/ix' topics are for digital inputs.
-    dingtian_input_match = re.search(r'(?:^|.*/)([a-zA-Z0-9_-]*dingtian[a-zA-Z0-9_-]*)/(relay[a-zA-Z0-9]+)/(?:.*/)?out/i([0-9]+)$', topic)
-    if dingtian_input_match:
-        path_segment_with_dingtian = dingtian_input_match.group(1)
-        module_serial = dingtian_input_match.group(2)
-        full_topic_base = f"{path_segment_with_dingtian}/{module_serial}"
-        logger.debug(f"Matched Dingtian Input (out/iX): Type=dingtian, Serial={module_serial}, ComponentType=in, ComponentID={dingtian_input_match.group(3)}, Base={full_topic_base}")
-        return 'dingtian', module_serial, 'in', dingtian_input_match.group(3), full_topic_base
-
-
-    # Existing Dingtian Output/Input Regex: Flexible 'dingtian' path segment, then 'relay[alphanumeric]', then optional path, then 'out'|'in', then 'r[digits]'
-    dingtian_match = re.search(r'(?:^|.*/)([a-zA-Z0-9_-]*dingtian[a-zA-Z0-9_-]*)/(relay[a-zA-Z0-9]+)/(?:.*/)?(out|in)/r([0-9]+)$', topic)
-    if dingtian_match:
-        path_segment_with_dingtian = dingtian_match.group(1)
-        module_serial = dingtian_match.group(2)
-        full_topic_base = f"{path_segment_with_dingtian}/{module_serial}"
-        logger.debug(f"Matched Dingtian (out/in/rX): Type=dingtian, Serial={module_serial}, ComponentType={dingtian_match.group(3)}, ComponentID={dingtian_match.group(4)}, Base={full_topic_base}")
-        return 'dingtian', module_serial, dingtian_match.group(3), dingtian_match.group(4), full_topic_base
-
-    # Shelly Regex (Updated for broader path matching and case-insensitivity)
-    shelly_match = re.search(r'(?:^|.*/)(shelly[a-zA-Z0-9_-]+)(?:/.*)?/status/switch:([0-9]+)$', topic, re.IGNORECASE)
-    if shelly_match:
-        module_serial = shelly_match.group(1)
-        full_topic_base = module_serial
-        component_id = shelly_match.group(2)
-        component_type = 'relay'
-        logger.debug(f"Matched Shelly: Type=shelly, Serial={module_serial}, ComponentType={component_type}, Component_ID={component_id}, Base={full_topic_base}")
-        return 'shelly', module_serial, component_type, component_id, full_topic_base
+    # Most topics on a broker belong to neither vendor; reject them with a plain substring check
+    # before splitting it. Lowercased because Shelly topics are matched case-insensitively.
+    topic_lower = topic.lower()
+    if 'dingtian' not in topic_lower and 'shelly' not in topic_lower:
+        return None, None, None, None, None
+
+    logger.debug("Attempting to parse topic: %s", topic)
+
+    parts = topic.split('/')
+    last_idx = len(parts) - 1
+
+    # Dingtian: '<..dingtian..>/relay<id>/[optional/path/]out/i<n>' is a digital input
+    # (user specified that 'out/ix' topics are for digital inputs), while
+    # '<..dingtian..>/relay<id>/[optional/path/]out|in/r<n>' is a relay output or its command topic.
+    if 'dingtian' in topic and last_idx >= 3:
+        leaf = parts[-1]
+        kind = parts[-2]
+        component_type = None
+        if kind == 'out' and leaf[:1] == 'i' and _is_ascii_digits(leaf[1:]):
+            component_type = 'in'
+        elif kind in ('out', 'in') and leaf[:1] == 'r' and _is_ascii_digits(leaf[1:]):
+            component_type = kind
+        if component_type:
+            # Candidate order mirrors the previous '(?:^|.*/)' regex prefix: the first segment,
+            # then right to left (the greedy '.*/' backtracked from the end of the topic).
+            for i in (0, *range(last_idx - 3, 0, -1)):
+                path_segment_with_dingtian = parts[i]
+                module_serial = parts[i + 1]
+                if ('dingtian' in path_segment_with_dingtian and _SEGMENT_CHARS_RE.fullmatch(path_segment_with_dingtian)
+                        and _RELAY_SEGMENT_RE.fullmatch(module_serial)):
+                    component_id = leaf[1:]
+                    full_topic_base = f"{path_segment_with_dingtian}/{module_serial}"
+                    logger.debug("Matched Dingtian (%s/%sX): Type=dingtian, Serial=%s, ComponentType=%s, ComponentID=%s, Base=%s",
+                                 kind, leaf[:1], module_serial, component_type, component_id, full_topic_base)
+                    return 'dingtian', module_serial, component_type, component_id, full_topic_base
+
+    # Shelly: '<shelly..>/[optional/path/]status/switch:<n>', matched case-insensitively.
+    if last_idx >= 2 and parts[-2].lower() == 'status':
+        leaf = parts[-1]
+        if leaf[:7].lower() == 'switch:' and _is_ascii_digits(leaf[7:]):
+            for i in (0, *range(last_idx - 2, 0, -1)):
+                module_serial = parts[i]
+                if len(module_serial) > 6 and module_serial[:6].lower() == 'shelly' and _SEGMENT_CHARS_RE.fullmatch(module_serial):
+                    full_topic_base = module_serial
+                    component_id = leaf[7:]
+                    component_type = 'relay'
+                    logger.debug("Matched Shelly: Type=shelly, Serial=%s, ComponentType=%s, Component_ID=%s, Base=%s",
+                                 module_serial, component_type, component_id, full_topic_base)
+                    return 'shelly', module_serial, component_type, component_id, full_topic_base
 
     logger.debug("No Dingtian or Shelly pattern matched.")
     return None, None, None, None, None
 
 def on_connect(client, userdata, flags, rc):
     print(f"Connected to MQTT broker with result code {rc}")
+    _subscribe_for_discovery(client)
+
+def _subscribe_for_discovery(client):
     client.subscribe("#")
     print("Subscribed to '#' for device discovery, will filter for 'dingtian' or 'shelly' in topics.")
     print("Please wait....Listening for devices....")
 
 def on_message(client, userdata, msg):
     """Callback for when a PUBLISH message is received from the server."""
-    topic = msg.topic
-    logger.debug(f"Received MQTT message on topic: {topic}")
-    device_type, module_serial, component_type, component_id, full_topic_base = parse_mqtt_device_topic(topic)
-
-    if module_serial:
-        if module_serial not in discovered_modules_and_topics_global:
-            discovered_modules_and_topics_global[module_serial] = {
-                "device_type": device_type,
-                "topics": set(),
-                "base_topic_path": full_topic_base
-            }
-            logger.debug(f"Discovered new module: {device_type} with serial {module_serial}")
-        discovered_modules_and_topics_global[module_serial]["topics"].add(topic)
-        logger.debug(f"Added topic {topic} to module {module_serial}")
-    else:
-        logger.debug(f"Topic '{topic}' did not match any known device patterns.")
+    # Only record the topic here; classification happens once per distinct topic after the
+    # listening window closes (see _classify_discovered_topics()). A dict keeps first-seen order.
+    _discovery_topics[msg.topic] = None
+
+def _classify_discovered_topics():
+    """Parses the buffered discovery topics into discovered_modules_and_topics_global."""
+    for topic in _discovery_topics:
+        device_type, module_serial, component_type, component_id, full_topic_base = parse_mqtt_device_topic(topic)
+
+        if module_serial:
+            if module_serial not in discovered_modules_and_topics_global:
+                discovered_modules_and_topics_global[module_serial] = {
+                    "device_type": device_type,
+                    "parsed_components": {},
+                    "base_topic_path": full_topic_base
+                }
+                logger.debug("Discovered new module: %s with serial %s", device_type, module_serial)
+            # Grouped as {component_type: {component_id: topic}} so configure_relay_module() can count and look up directly.
+            discovered_modules_and_topics_global[module_serial]["parsed_components"].setdefault(component_type, {})[component_id] = topic
+            logger.debug("Added topic %s to module %s", topic, module_serial)
+        else:
+            logger.debug("Topic '%s' did not match any known device patterns.", topic)
 
 # --- Modified Function for MQTT Connection and Discovery ---
 def get_mqtt_broker_info(current_broker_address=None, current_port=None, current_username=None, current_password=None):
     """Prompts user for MQTT broker details, showing existing values as defaults."""
     print("\n--- MQTT Broker Configuration ---")
 
-    broker_address = input(f"Enter MQTT broker address (current: {current_broker_address if current_broker_address else 'localhost'}): ") or (current_broker_address if current_broker_address else '')
-    port = input(f"Enter MQTT port (current: {current_port if current_port else '1883'}): ") or (current_port if current_port else '1883')
-    username = input(f"Enter MQTT username (current: {current_username if current_username else 'not set'}; leave blank if none): ") or (current_username if current_username else '')
+    broker_address = _ask(f"Enter MQTT broker address (current: {current_broker_address if current_broker_address else 'localhost'}): ") or (current_broker_address if current_broker_address else '')
+    port = _ask(f"Enter MQTT port (current: {current_port if current_port else '1883'}): ") or (current_port if current_port else '1883')
+    username = _ask(f"Enter MQTT username (current: {current_username if current_username else 'not set'}; leave blank if none): ") or (current_username if current_username else '')
 
     password_display = '******' if current_password else 'not set'
-    password = input(f"Enter MQTT password (current: {password_display}; leave blank if none): ") or (current_password if current_password else '')
+    password = _ask(f"Enter MQTT password (current: {password_display}; leave blank if none): ") or (current_password if current_password else '')
 
     return broker_address, int(port), username if username else None, password if password else None
 
+_mqtt_client = None  # Discovery client, kept connected for the whole session
+_mqtt_client_settings = None  # (broker_address, port, username, password) it was connected with
+
+def get_mqtt_client(broker_address, port, username, password):
+    """
+    Returns the discovery MQTT client connected to the given broker. The same client is reused for
+    every discovery in the session; it is only replaced when the broker settings change and only
+    reconnected when its connection is down.
+    """
+    global _mqtt_client, _mqtt_client_settings
+    settings = (broker_address, port, username, password)
+    if _mqtt_client is not None and settings != _mqtt_client_settings:
+        close_mqtt_client()
+
+    if _mqtt_client is None:
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
+        if username:
+            client.username_pw_set(username, password)
+        print(f"Connecting to MQTT broker at {broker_address}:{port}...")
+        client.connect(broker_address, port, 60)
+        print("Connected to MQTT broker.")
+        _mqtt_client, _mqtt_client_settings = client, settings
+    elif not _mqtt_client.is_connected():
+        print(f"Reconnecting to MQTT broker at {broker_address}:{port}...")
+        _mqtt_client.reconnect()
+    return _mqtt_client
+
+def close_mqtt_client():
+    """Disconnects and drops the discovery client, if there is one."""
+    global _mqtt_client, _mqtt_client_settings
+    if _mqtt_client is not None:
+        _mqtt_client.disconnect()
+        print("Disconnected from MQTT broker.")
+        _mqtt_client = _mqtt_client_settings = None
+
 def discover_devices_via_mqtt(client):
     """
     Connects to MQTT broker and attempts to discover Dingtian and Shelly devices by listening to topics.
     """
     global discovered_modules_and_topics_global
     discovered_modules_and_topics_global.clear()
+    _discovery_topics.clear()
 
     print("\nAttempting to discover Dingtian and Shelly devices via MQTT by listening to topics...")
     print(" (This requires devices to be actively publishing data on topics containing 'dingtian' or 'shelly'.)")
@@ -131,14 +422,25 @@ def discover_devices_via_mqtt(client):
     client.on_connect = on_connect
     client.on_message = on_message
 
+    # A client reused from an earlier discovery won't see on_connect() again for its connection
+    already_connected = client.is_connected()
+
     client.loop_start()
+    if already_connected:
+        _subscribe_for_discovery(client)
 
     discovery_duration = 60
     print(f"Listening for messages for {discovery_duration} seconds...")
     time.sleep(discovery_duration)
 
+    # Stop the broker from forwarding all traffic to the idle client until the next discovery
+    client.unsubscribe("#")
     client.loop_stop()
 
+    logger.debug("Received %d distinct topics during discovery.", len(_discovery_topics))
+    _classify_discovered_topics()
+    _discovery_topics.clear()
+
     print(f"Found {len(discovered_modules_and_topics_global)} potential Dingtian/Shelly modules.")
     return discovered_modules_and_topics_global
 
@@ -148,7 +450,7 @@ def service_options_menu():
     print("2) Restart service to populate configuration changes")
     print("3) Quit and exit")
 
-    choice = input("Enter your choice (1, 2, or 3): ")
+    choice = _ask("Enter your choice (1, 2, or 3): ")
 
     if choice == '1':
         print("Running: /data/apps/external_devices/install.sh")
@@ -175,6 +477,16 @@ def service_options_menu():
     else:
         print("Invalid choice. Please enter 1, 2, or 3.")
 
+def _excess_sections(config, prefix, count):
+    """Returns the '<prefix><n>' sections with n > count, in ascending order of n."""
+    excess = []
+    for section in config:
+        if section.startswith(prefix):
+            suffix = section[len(prefix):]
+            if suffix.isdigit() and int(suffix) > count:
+                excess.append((int(suffix), section))
+    return [section for _, section in sorted(excess)]
+
 def configure_relay_module(config, existing_relay_modules_by_index, existing_switches_by_module_and_switch_idx,
                            existing_inputs_by_module_and_input_idx, device_instance_counter, device_index_sequencer,
                            auto_configured_serials_to_info, current_module_idx=None, is_new_device_flow=True,
@@ -192,7 +504,9 @@ def configure_relay_module(config, existing_relay_modules_by_index, existing_swi
         module_idx = current_module_idx
         print(f"\n--- Editing Relay Module (Module Index: {module_idx}) ---")
 
-    relay_module_section = f'Relay_Module_{module_idx}'
+    # Section names are interned like the ones read_config_file() produces, so the section cache
+    # and `config` lookups compare by identity whichever side created the name.
+    relay_module_section = sys.intern(f'Relay_Module_{module_idx}')
     module_data_from_file = existing_relay_modules_by_index.get(module_idx, {})
 
     current_serial = module_data_from_file.get('serial', None)
@@ -202,17 +516,17 @@ def configure_relay_module(config, existing_relay_modules_by_index, existing_swi
 
     # Check if this slot should be auto-configured from discovery results
     if is_new_device_flow and auto_configured_serials_to_info:
+        # Serials already claimed by an existing Relay_Module_X in the config, either through its
+        # `moduleserial` field or because its `serial` field happened to be the discovered serial.
+        used_serials = set()
+        for existing_mod_data in existing_relay_modules_by_index.values():
+            used_serials.add(existing_mod_data.get('moduleserial'))
+            used_serials.add(existing_mod_data.get('serial'))
+        used_serials.discard(None)
+
         # Try to find an un-used auto-discovered serial for this new module slot
-        for auto_serial_key in sorted(auto_configured_serials_to_info.keys()):
-            # We need to ensure this auto_serial_key isn't already used in any existing Relay_Module_X in the config
-            # (checked by `moduleserial` field, or if `serial` field happened to be the discovered serial)
-            already_used_in_config = False
-            for existing_mod_data in existing_relay_modules_by_index.values():
-                if (existing_mod_data.get('moduleserial') == auto_serial_key or
-                    existing_mod_data.get('serial') == auto_serial_key):
-                    already_used_in_config = True
-                    break
-            if not already_used_in_config:
+        for auto_serial_key in sorted(auto_configured_serials_to_info):
+            if auto_serial_key not in used_serials:
                 current_serial = generate_serial() # Keep the 'serial' field as a random, unique ID
                 discovered_module_serial_for_slot = auto_serial_key # Store the actual discovered serial here
                 module_info_from_discovery = auto_configured_serials_to_info[auto_serial_key]
@@ -224,60 +538,41 @@ def configure_relay_module(config, existing_relay_modules_by_index, existing_swi
         current_serial = generate_serial()
         logger.debug(f"Generated new serial {current_serial} for Relay Module slot {module_idx}.")
 
-    if not config.has_section(relay_module_section):
-        config.add_section(relay_module_section)
+    # 'dingtian' or 'shelly' when this slot is being auto-configured from discovery, otherwise None
+    auto_type = module_info_from_discovery['device_type'] if is_auto_configured_for_this_slot else None
 
-    config.set(relay_module_section, 'serial', current_serial)
+    _invalidate_section(relay_module_section)
+    module_options = config.setdefault(relay_module_section, {})
+    module_options['serial'] = current_serial
 
     if is_auto_configured_for_this_slot and discovered_module_serial_for_slot:
-        config.set(relay_module_section, 'moduleserial', discovered_module_serial_for_slot)
+        module_options['moduleserial'] = discovered_module_serial_for_slot
     elif module_data_from_file.get('moduleserial'):
-        config.set(relay_module_section, 'moduleserial', module_data_from_file['moduleserial'])
-    else:
-        if config.has_option(relay_module_section, 'moduleserial'):
-            config.remove_option(relay_module_section, 'moduleserial')
-
-    if is_new_device_flow:
-        config.set(relay_module_section, 'deviceinstance', str(device_instance_counter))
-        device_instance_counter += 1
-    else:
-        current_device_instance = module_data_from_file.get('deviceinstance', highest_existing_device_instance + 1)
-        config.set(relay_module_section, 'deviceinstance', str(current_device_instance))
+        module_options['moduleserial'] = module_data_from_file['moduleserial']
+    elif relay_module_section in config:
+        config[relay_module_section].pop('moduleserial', None)
 
-    if is_new_device_flow:
-        config.set(relay_module_section, 'deviceindex', str(device_index_sequencer))
-        device_index_sequencer += 1
-    else:
-        current_device_index = module_data_from_file.get('deviceindex', highest_existing_device_index + 1)
-        config.set(relay_module_section, 'deviceindex', str(current_device_index))
+    device_instance_counter, device_index_sequencer = _assign_device_numbers(
+        module_options, module_data_from_file, is_new_device_flow, device_instance_counter, device_index_sequencer,
+        highest_existing_device_instance, highest_existing_device_index)
 
     current_custom_name = module_data_from_file.get('customname', f'Relay Module {module_idx}')
-    if is_auto_configured_for_this_slot and module_info_from_discovery:
-        config.set(relay_module_section, 'customname', f"{module_info_from_discovery['device_type'].capitalize()} Module {module_idx}")
+    if auto_type:
+        module_options['customname'] = f"{auto_type.capitalize()} Module {module_idx}"
     else:
-        config.set(relay_module_section, 'customname', input(f"Enter custom name for Relay Module {module_idx} (current: {current_custom_name}): ") or current_custom_name)
+        module_options['customname'] = _ask(f"Enter custom name for Relay Module {module_idx} (current: {current_custom_name}): ") or current_custom_name
 
     current_num_switches_for_module = module_data_from_file.get('numberofswitches', 4)
-    if is_auto_configured_for_this_slot and module_info_from_discovery:
-        if module_info_from_discovery['device_type'] == 'dingtian':
-            dingtian_out_switches = set()
-            for t in module_info_from_discovery['topics']:
-                parsed_type, parsed_serial, comp_type, comp_id, _ = parse_mqtt_device_topic(t)
-                if parsed_serial == discovered_module_serial_for_slot and comp_type == 'out' and comp_id:
-                    dingtian_out_switches.add(comp_id)
-            num_switches = len(dingtian_out_switches) if dingtian_out_switches else 1
-        elif module_info_from_discovery['device_type'] == 'shelly':
-            shelly_relays = set()
-            for t in module_info_from_discovery['topics']:
-                parsed_type, parsed_serial, comp_type, comp_id, _ = parse_mqtt_device_topic(t)
-                if parsed_serial == discovered_module_serial_for_slot and comp_type == 'relay' and comp_id:
-                    shelly_relays.add(comp_id)
-            num_switches = len(shelly_relays) if shelly_relays else 1
-        config.set(relay_module_section, 'numberofswitches', str(num_switches))
+    if auto_type:
+        if auto_type == 'dingtian':
+            num_switches = len(module_info_from_discovery['parsed_components'].get('out', {})) or 1
+        elif auto_type == 'shelly':
+            num_switches = len(module_info_from_discovery['parsed_components'].get('relay', {})) or 1
+        module_options['numberofswitches'] = str(num_switches)
     else:
         while True:
             try:
-                num_switches_input = input(f"Enter the number of switches for Relay Module {module_idx} (current: {current_num_switches_for_module if current_num_switches_for_module > 0 else 'not set'}): ")
+                num_switches_input = _ask(f"Enter the number of switches for Relay Module {module_idx} (current: {current_num_switches_for_module if current_num_switches_for_module > 0 else 'not set'}): ")
                 if num_switches_input:
                     num_switches = int(num_switches_input)
                     if num_switches <= 0:
@@ -290,26 +585,21 @@ def configure_relay_module(config, existing_relay_modules_by_index, existing_swi
                     print("Invalid input. Please enter a positive integer for the number of switches.")
             except ValueError:
                 print("Invalid input. Please enter a positive integer for the number of switches.")
-        config.set(relay_module_section, 'numberofswitches', str(num_switches))
+        module_options['numberofswitches'] = str(num_switches)
 
 
     current_num_inputs_for_module = module_data_from_file.get('numberofinputs', 0)
-    if is_auto_configured_for_this_slot and module_info_from_discovery:
-        if module_info_from_discovery['device_type'] == 'dingtian':
-            dingtian_in_inputs = set()
-            for t in module_info_from_discovery['topics']:
-                parsed_type, parsed_serial, comp_type, comp_id, _ = parse_mqtt_device_topic(t)
-                if parsed_serial == discovered_module_serial_for_slot and comp_type == 'in' and comp_id:
-                    dingtian_in_inputs.add(comp_id)
-            num_inputs = len(dingtian_in_inputs)
-            config.set(relay_module_section, 'numberofinputs', str(num_inputs))
-        elif module_info_from_discovery['device_type'] == 'shelly':
+    if auto_type:
+        if auto_type == 'dingtian':
+            num_inputs = len(module_info_from_discovery['parsed_components'].get('in', {}))
+            module_options['numberofinputs'] = str(num_inputs)
+        elif auto_type == 'shelly':
             num_inputs = 0
-            config.set(relay_module_section, 'numberofinputs', str(num_inputs))
+            module_options['numberofinputs'] = str(num_inputs)
     else:
         while True:
             try:
-                num_inputs_input = input(f"Enter the number of inputs for Relay Module {module_idx} (current: {current_num_inputs_for_module}): ")
+                num_inputs_input = _ask(f"Enter the number of inputs for Relay Module {module_idx} (current: {current_num_inputs_for_module}): ")
                 if num_inputs_input:
                     num_inputs = int(num_inputs_input)
                     if num_inputs < 0:
@@ -322,188 +612,157 @@ def configure_relay_module(config, existing_relay_modules_by_index, existing_swi
                     print("Invalid input. Please enter a non-negative integer for the number of inputs.")
             except ValueError:
                 print("Invalid input. Please enter a non-negative integer for the number of inputs.")
-    config.set(relay_module_section, 'numberofinputs', str(num_inputs))
-
-    payload_defaults_dingtian = {'on_state': 'ON', 'off_state': 'OFF', 'on_cmd': 'ON', 'off_cmd': 'OFF'}
-    payload_defaults_shelly = {'on_state': '{"output": true}', 'off_state': '{"output": false}', 'on_cmd': 'on', 'off_cmd': 'off'}
+    module_options['numberofinputs'] = str(num_inputs)
 
-    default_payloads = payload_defaults_dingtian
-    if is_auto_configured_for_this_slot and module_info_from_discovery and module_info_from_discovery['device_type'] == 'shelly':
-        default_payloads = payload_defaults_shelly
+    default_payloads = PAYLOAD_DEFAULTS.get(auto_type, PAYLOAD_DEFAULTS['dingtian'])
 
-    if is_auto_configured_for_this_slot:
-        config.set(relay_module_section, 'mqtt_on_state_payload', default_payloads['on_state'])
-        config.set(relay_module_section, 'mqtt_off_state_payload', default_payloads['off_state'])
-        config.set(relay_module_section, 'mqtt_on_command_payload', default_payloads['on_cmd'])
-        config.set(relay_module_section, 'mqtt_off_command_payload', default_payloads['off_cmd'])
+    if auto_type:
+        module_options['mqtt_on_state_payload'] = default_payloads['on_state']
+        module_options['mqtt_off_state_payload'] = default_payloads['off_state']
+        module_options['mqtt_on_command_payload'] = default_payloads['on_cmd']
+        module_options['mqtt_off_command_payload'] = default_payloads['off_cmd']
     else:
         current_mqtt_on_state_payload = module_data_from_file.get('mqtt_on_state_payload', default_payloads['on_state'])
-        mqtt_on_state_payload = input(f"Enter MQTT ON state payload for Relay Module {module_idx} (current: {current_mqtt_on_state_payload}): ")
-        config.set(relay_module_section, 'mqtt_on_state_payload', mqtt_on_state_payload if mqtt_on_state_payload else current_mqtt_on_state_payload)
+        mqtt_on_state_payload = _ask(f"Enter MQTT ON state payload for Relay Module {module_idx} (current: {current_mqtt_on_state_payload}): ")
+        module_options['mqtt_on_state_payload'] = mqtt_on_state_payload if mqtt_on_state_payload else current_mqtt_on_state_payload
 
         current_mqtt_off_state_payload = module_data_from_file.get('mqtt_off_state_payload', default_payloads['off_state'])
-        mqtt_off_state_payload = input(f"Enter MQTT OFF state payload for Relay Module {module_idx} (current: {current_mqtt_off_state_payload}): ")
-        config.set(relay_module_section, 'mqtt_off_state_payload', mqtt_off_state_payload if mqtt_off_state_payload else current_mqtt_off_state_payload)
+        mqtt_off_state_payload = _ask(f"Enter MQTT OFF state payload for Relay Module {module_idx} (current: {current_mqtt_off_state_payload}): ")
+        module_options['mqtt_off_state_payload'] = mqtt_off_state_payload if mqtt_off_state_payload else current_mqtt_off_state_payload
 
         current_mqtt_on_command_payload = module_data_from_file.get('mqtt_on_command_payload', default_payloads['on_cmd'])
-        mqtt_on_command_payload = input(f"Enter MQTT ON command payload for Relay Module {module_idx} (current: {current_mqtt_on_command_payload}): ")
-        config.set(relay_module_section, 'mqtt_on_command_payload', mqtt_on_command_payload if mqtt_on_command_payload else current_mqtt_on_command_payload)
+        mqtt_on_command_payload = _ask(f"Enter MQTT ON command payload for Relay Module {module_idx} (current: {current_mqtt_on_command_payload}): ")
+        module_options['mqtt_on_command_payload'] = mqtt_on_command_payload if mqtt_on_command_payload else current_mqtt_on_command_payload
 
         current_mqtt_off_command_payload = module_data_from_file.get('mqtt_off_command_payload', default_payloads['off_cmd'])
-        mqtt_off_command_payload = input(f"Enter MQTT OFF command payload for Relay Module {module_idx} (current: {current_mqtt_off_command_payload}): ")
-        config.set(relay_module_section, 'mqtt_off_command_payload', mqtt_off_command_payload if mqtt_off_command_payload else current_mqtt_off_command_payload)
+        mqtt_off_command_payload = _ask(f"Enter MQTT OFF command payload for Relay Module {module_idx} (current: {current_mqtt_off_command_payload}): ")
+        module_options['mqtt_off_command_payload'] = mqtt_off_command_payload if mqtt_off_command_payload else current_mqtt_off_command_payload
 
     # Configure switches for this module
-    num_switches_for_module_section = int(config.get(relay_module_section, 'numberofswitches'))
+    num_switches_for_module_section = num_switches
     for j in range(1, num_switches_for_module_section + 1):
-        switch_section = f'switch_{module_idx}_{j}'
+        switch_section = sys.intern(f'switch_{module_idx}_{j}')
         switch_data_from_file = existing_switches_by_module_and_switch_idx.get((module_idx, j), {})
 
-        if not config.has_section(switch_section):
-            config.add_section(switch_section)
+        _invalidate_section(switch_section)
+        switch_options = config.setdefault(switch_section, {})
 
         auto_discovered_state_topic = None
         auto_discovered_command_topic = None
 
-        if is_auto_configured_for_this_slot and module_info_from_discovery:
+        if auto_type:
             base_topic_path = module_info_from_discovery['base_topic_path']
-            device_type = module_info_from_discovery['device_type']
-
-            if device_type == 'dingtian':
-                for t in module_info_from_discovery['topics']:
-                    parsed_type, parsed_serial, parsed_comp_type, parsed_comp_id, _ = parse_mqtt_device_topic(t)
-                    if parsed_serial == discovered_module_serial_for_slot and parsed_comp_type == 'out' and parsed_comp_id == str(j):
-                        auto_discovered_state_topic = t
-                        auto_discovered_command_topic = t.replace('/out/r', '/in/r', 1)
-                        break
-            elif device_type == 'shelly':
+
+            if auto_type == 'dingtian':
+                auto_discovered_state_topic = module_info_from_discovery['parsed_components'].get('out', {}).get(str(j))
+                if auto_discovered_state_topic:
+                    auto_discovered_command_topic = auto_discovered_state_topic.replace('/out/r', '/in/r', 1)
+            elif auto_type == 'shelly':
                 shelly_switch_idx = j - 1
                 auto_discovered_state_topic = f'{base_topic_path}/status/switch:{shelly_switch_idx}'
                 auto_discovered_command_topic = f'{base_topic_path}/command/switch:{shelly_switch_idx}'
 
         current_switch_custom_name = switch_data_from_file.get('customname', f'switch {j}')
-        config.set(switch_section, 'customname', input(f"Enter custom name for switch {j} (current: {current_switch_custom_name}): ") or current_switch_custom_name)
+        switch_options['customname'] = _ask(f"Enter custom name for switch {j} (current: {current_switch_custom_name}): ") or current_switch_custom_name
 
         current_switch_group = switch_data_from_file.get('group', f'Group{module_idx}')
-        config.set(switch_section, 'group', input(f"Enter group for switch {j} (current: {current_switch_group}): ") or current_switch_group)
+        switch_options['group'] = _ask(f"Enter group for switch {j} (current: {current_switch_group}): ") or current_switch_group
 
 
         current_mqtt_state_topic = switch_data_from_file.get('mqttstatetopic', auto_discovered_state_topic if auto_discovered_state_topic else 'path/to/mqtt/topic')
-        if is_auto_configured_for_this_slot:
-            config.set(switch_section, 'mqttstatetopic', current_mqtt_state_topic)
+        if auto_type:
+            switch_options['mqttstatetopic'] = current_mqtt_state_topic
         else:
-            mqtt_state_topic = input(f"Enter MQTT state topic for switch {j} (current: {current_mqtt_state_topic}): ")
-            config.set(switch_section, 'mqttstatetopic', mqtt_state_topic if mqtt_state_topic else current_mqtt_state_topic)
+            mqtt_state_topic = _ask(f"Enter MQTT state topic for switch {j} (current: {current_mqtt_state_topic}): ")
+            switch_options['mqttstatetopic'] = mqtt_state_topic if mqtt_state_topic else current_mqtt_state_topic
 
         current_mqtt_command_topic = switch_data_from_file.get('mqttcommandtopic', auto_discovered_command_topic if auto_discovered_command_topic else 'path/to/mqtt/topic')
-        if is_auto_configured_for_this_slot:
-            config.set(switch_section, 'mqttcommandtopic', current_mqtt_command_topic)
+        if auto_type:
+            switch_options['mqttcommandtopic'] = current_mqtt_command_topic
         else:
-            mqtt_command_topic = input(f"Enter MQTT command topic for switch {j} (current: {current_mqtt_command_topic}): ")
-            config.set(switch_section, 'mqttcommandtopic', mqtt_command_topic if mqtt_command_topic else current_mqtt_command_topic)
+            mqtt_command_topic = _ask(f"Enter MQTT command topic for switch {j} (current: {current_mqtt_command_topic}): ")
+            switch_options['mqttcommandtopic'] = mqtt_command_topic if mqtt_command_topic else current_mqtt_command_topic
 
     # Clean up excess switches if number of switches was reduced
-    for j in range(num_switches_for_module_section + 1, 100): # Assuming max 99 switches
-        switch_section = f'switch_{module_idx}_{j}'
-        if config.has_section(switch_section):
-            config.remove_section(switch_section)
-            print(f"Removed excess switch section: {switch_section}")
+    for switch_section in _excess_sections(config, f'switch_{module_idx}_', num_switches_for_module_section):
+        del config[switch_section]
+        _invalidate_section(switch_section)
+        print(f"Removed excess switch section: {switch_section}")
 
 
     # Configure inputs for this module
-    num_inputs_for_module_section = int(config.get(relay_module_section, 'numberofinputs'))
+    num_inputs_for_module_section = num_inputs
     for k in range(1, num_inputs_for_module_section + 1):
-        input_section = f'input_{module_idx}_{k}'
+        input_section = sys.intern(f'input_{module_idx}_{k}')
         input_data_from_file = existing_inputs_by_module_and_input_idx.get((module_idx, k), {})
 
-        if not config.has_section(input_section):
-            config.add_section(input_section)
+        _invalidate_section(input_section)
+        input_options = config.setdefault(input_section, {})
 
         current_input_serial = input_data_from_file.get('serial', None)
         if current_input_serial is None:
             current_input_serial = f"input-{module_idx}-{k}"
             logger.debug(f"Generated new serial {current_input_serial} for Relay Module {module_idx}, Input {k}.")
-        config.set(input_section, 'serial', current_input_serial)
+        input_options['serial'] = current_input_serial
 
         # Device instance and index for inputs
-        if is_new_device_flow:
-            config.set(input_section, 'deviceinstance', str(device_instance_counter))
-            device_instance_counter += 1
-        else:
-            current_device_instance = input_data_from_file.get('deviceinstance', highest_existing_device_instance + 1)
-            config.set(input_section, 'deviceinstance', str(current_device_instance))
-
-        if is_new_device_flow:
-            config.set(input_section, 'deviceindex', str(device_index_sequencer))
-            device_index_sequencer += 1
-        else:
-            current_device_index = input_data_from_file.get('deviceindex', highest_existing_device_index + 1)
-            config.set(input_section, 'deviceindex', str(current_device_index))
+        device_instance_counter, device_index_sequencer = _assign_device_numbers(
+            input_options, input_data_from_file, is_new_device_flow, device_instance_counter, device_index_sequencer,
+            highest_existing_device_instance, highest_existing_device_index)
 
 
         current_input_custom_name = input_data_from_file.get('customname', f'Input {k}')
-        if is_auto_configured_for_this_slot and module_info_from_discovery and module_info_from_discovery['device_type'] == 'dingtian':
-            config.set(input_section, 'customname', current_input_serial)
+        if auto_type == 'dingtian':
+            input_options['customname'] = current_input_serial
         else:
-            config.set(input_section, 'customname', input(f"Enter custom name for Input {k} (current: {current_input_custom_name}): ") or current_input_custom_name)
+            input_options['customname'] = _ask(f"Enter custom name for Input {k} (current: {current_input_custom_name}): ") or current_input_custom_name
 
         auto_discovered_input_state_topic = None
-        if is_auto_configured_for_this_slot and module_info_from_discovery and module_info_from_discovery['device_type'] == 'dingtian':
+        if auto_type == 'dingtian':
             base_topic_path = module_info_from_discovery['base_topic_path']
-            for t in module_info_from_discovery['topics']:
-                parsed_type, parsed_serial, parsed_comp_type, parsed_comp_id, _ = parse_mqtt_device_topic(t)
-                if parsed_serial == discovered_module_serial_for_slot and parsed_comp_type == 'in' and parsed_comp_id == str(k):
-                    auto_discovered_input_state_topic = t
-                    break
+            auto_discovered_input_state_topic = module_info_from_discovery['parsed_components'].get('in', {}).get(str(k))
 
         current_mqtt_input_state_topic = input_data_from_file.get('mqttstatetopic', auto_discovered_input_state_topic if auto_discovered_input_state_topic else 'path/to/mqtt/input/topic')
-        if is_auto_configured_for_this_slot and module_info_from_discovery and module_info_from_discovery['device_type'] == 'dingtian':
-            config.set(input_section, 'mqttstatetopic', current_mqtt_input_state_topic)
+        if auto_type == 'dingtian':
+            input_options['mqttstatetopic'] = current_mqtt_input_state_topic
         else:
-            mqtt_input_state_topic = input(f"Enter MQTT state topic for Input {k} (current: {current_mqtt_input_state_topic}): ")
-            config.set(input_section, 'mqttstatetopic', mqtt_input_state_topic if mqtt_input_state_topic else current_mqtt_input_state_topic)
+            mqtt_input_state_topic = _ask(f"Enter MQTT state topic for Input {k} (current: {current_mqtt_input_state_topic}): ")
+            input_options['mqttstatetopic'] = mqtt_input_state_topic if mqtt_input_state_topic else current_mqtt_input_state_topic
 
         current_mqtt_input_on_state_payload = input_data_from_file.get('mqtt_on_state_payload', 'ON')
-        if is_auto_configured_for_this_slot and module_info_from_discovery and module_info_from_discovery['device_type'] == 'dingtian':
-            config.set(input_section, 'mqtt_on_state_payload', 'ON')
+        if auto_type == 'dingtian':
+            input_options['mqtt_on_state_payload'] = 'ON'
         else:
-            mqtt_input_on_state_payload = input(f"Enter MQTT ON state payload for Input {k} (current: {current_mqtt_input_on_state_payload}): ")
-            config.set(input_section, 'mqtt_on_state_payload', mqtt_input_on_state_payload if mqtt_input_on_state_payload else current_mqtt_input_on_state_payload)
+            mqtt_input_on_state_payload = _ask(f"Enter MQTT ON state payload for Input {k} (current: {current_mqtt_input_on_state_payload}): ")
+            input_options['mqtt_on_state_payload'] = mqtt_input_on_state_payload if mqtt_input_on_state_payload else current_mqtt_input_on_state_payload
 
         current_mqtt_input_off_state_payload = input_data_from_file.get('mqtt_off_state_payload', 'OFF')
-        if is_auto_configured_for_this_slot and module_info_from_discovery and module_info_from_discovery['device_type'] == 'dingtian':
-            config.set(input_section, 'mqtt_off_state_payload', 'OFF')
+        if auto_type == 'dingtian':
+            input_options['mqtt_off_state_payload'] = 'OFF'
         else:
-            mqtt_input_off_state_payload = input(f"Enter MQTT OFF state payload for Input {k} (current: {current_mqtt_input_off_state_payload}): ")
-            config.set(input_section, 'mqtt_off_state_payload', mqtt_input_off_state_payload if mqtt_input_off_state_payload else current_mqtt_input_off_state_payload)
+            mqtt_input_off_state_payload = _ask(f"Enter MQTT OFF state payload for Input {k} (current: {current_mqtt_input_off_state_payload}): ")
+            input_options['mqtt_off_state_payload'] = mqtt_input_off_state_payload if mqtt_input_off_state_payload else current_mqtt_input_off_state_payload
 
-        input_types = ['disabled', 'door alarm', 'bilge pump', 'bilge alarm', 'burglar alarm', 'smoke alarm', 'fire alarm', 'CO2 alarm']
         current_input_type = input_data_from_file.get('type', 'disabled')
-        if is_auto_configured_for_this_slot and module_info_from_discovery and module_info_from_discovery['device_type'] == 'dingtian':
-            config.set(input_section, 'type', 'disabled')
+        if auto_type == 'dingtian':
+            input_options['type'] = 'disabled'
         else:
             while True:
-                input_type_input = input(f"Enter type for Input {k} (options: {', '.join(input_types)}; current: {current_input_type}): ")
+                input_type_input = _ask(f"Enter type for Input {k} (options: {INPUT_TYPES_DISPLAY}; current: {current_input_type}): ").lower()
                 if input_type_input:
-                    if input_type_input.lower() in input_types:
-                        config.set(input_section, 'type', input_type_input.lower())
+                    if input_type_input in _INPUT_TYPES_SET:
+                        input_options['type'] = input_type_input
                         break
                     else:
-                        print(f"Invalid type. Please choose from: {', '.join(input_types)}")
+                        print(f"Invalid type. Please choose from: {INPUT_TYPES_DISPLAY}")
                 else:
-                    config.set(input_section, 'type', current_input_type)
+                    input_options['type'] = current_input_type
                     break
     # Clean up excess inputs if number of inputs was reduced
-    for k in range(num_inputs_for_module_section + 1, 100): # Assuming max 99 inputs
-        input_section = f'input_{module_idx}_{k}'
-        if config.has_section(input_section):
-            config.remove_section(input_section)
-            print(f"Removed excess input section: {input_section}")
-
-    # Update Global numberofmodules if adding a new one
-    if is_new_device_flow:
-        current_global_modules = config.getint('Global', 'numberofmodules', fallback=0)
-        config.set('Global', 'numberofmodules', str(current_global_modules + 1))
+    for input_section in _excess_sections(config, f'input_{module_idx}_', num_inputs_for_module_section):
+        del config[input_section]
+        _invalidate_section(input_section)
+        print(f"Removed excess input section: {input_section}")
 
     return device_instance_counter, device_index_sequencer
 
@@ -522,65 +781,42 @@ def configure_temp_sensor(config, existing_temp_sensors_by_index, device_instanc
         sensor_idx = current_sensor_idx
         print(f"\n--- Editing Temperature Sensor (Sensor Index: {sensor_idx}) ---")
 
-    temp_sensor_section = f'Temp_Sensor_{sensor_idx}'
+    temp_sensor_section = sys.intern(f'Temp_Sensor_{sensor_idx}')
     sensor_data_from_file = existing_temp_sensors_by_index.get(sensor_idx, {})
 
-    if not config.has_section(temp_sensor_section):
-        config.add_section(temp_sensor_section)
+    _invalidate_section(temp_sensor_section)
+    config.setdefault(temp_sensor_section, {})
 
-    if is_new_device_flow:
-        config.set(temp_sensor_section, 'deviceinstance', str(device_instance_counter))
-        device_instance_counter += 1
-    else:
-        current_device_instance = sensor_data_from_file.get('deviceinstance', highest_existing_device_instance + 1)
-        config.set(temp_sensor_section, 'deviceinstance', str(current_device_instance))
-
-    if is_new_device_flow:
-        config.set(temp_sensor_section, 'deviceindex', str(device_index_sequencer))
-        device_index_sequencer += 1
-    else:
-        current_device_index = sensor_data_from_file.get('deviceindex', highest_existing_device_index + 1)
-        config.set(temp_sensor_section, 'deviceindex', str(current_device_index))
+    device_instance_counter, device_index_sequencer = _assign_device_numbers(
+        config[temp_sensor_section], sensor_data_from_file, is_new_device_flow, device_instance_counter, device_index_sequencer,
+        highest_existing_device_instance, highest_existing_device_index)
 
 
     current_custom_name = sensor_data_from_file.get('customname', f'Temperature Sensor {sensor_idx}')
-    custom_name = input(f"Enter custom name for Temperature Sensor {sensor_idx} (current: {current_custom_name}): ")
-    config.set(temp_sensor_section, 'customname', custom_name if custom_name else current_custom_name)
+    custom_name = _ask(f"Enter custom name for Temperature Sensor {sensor_idx} (current: {current_custom_name}): ")
+    config[temp_sensor_section]['customname'] = custom_name if custom_name else current_custom_name
 
-    current_serial = sensor_data_from_file.get('serial', generate_serial())
-    if not sensor_data_from_file.get('serial'):
+    current_serial = sensor_data_from_file.get('serial')
+    if not current_serial:
+        current_serial = generate_serial()
         print(f"Generated new serial for Temperature Sensor {sensor_idx}: {current_serial}")
-    config.set(temp_sensor_section, 'serial', current_serial)
+    config[temp_sensor_section]['serial'] = current_serial
 
-    temp_sensor_types = ['battery', 'fridge', 'room', 'outdoor', 'water heater', 'freezer', 'generic']
     current_temp_sensor_type = sensor_data_from_file.get('type', 'generic')
     while True:
-        temp_type_input = input(f"Enter type for Temperature Sensor {sensor_idx} (options: {', '.join(temp_sensor_types)}; current: {current_temp_sensor_type}): ")
+        temp_type_input = _ask(f"Enter type for Temperature Sensor {sensor_idx} (options: {TEMP_SENSOR_TYPES_DISPLAY}; current: {current_temp_sensor_type}): ").lower()
         if temp_type_input:
-            if temp_type_input.lower() in temp_sensor_types:
-                config.set(temp_sensor_section, 'type', temp_type_input.lower())
+            if temp_type_input in _TEMP_SENSOR_TYPES_SET:
+                config[temp_sensor_section]['type'] = temp_type_input
                 break
             else:
-                print(f"Invalid type. Please choose from: {', '.join(temp_sensor_types)}")
+                print(f"Invalid type. Please choose from: {TEMP_SENSOR_TYPES_DISPLAY}")
         else:
-            config.set(temp_sensor_section, 'type', current_temp_sensor_type)
+            config[temp_sensor_section]['type'] = current_temp_sensor_type
             break
 
-    current_temp_state_topic = sensor_data_from_file.get('temperaturestatetopic', 'path/to/mqtt/topic')
-    temp_state_topic = input(f"Enter MQTT temperature state topic for Temperature Sensor {sensor_idx} (current: {current_temp_state_topic}): ")
-    config.set(temp_sensor_section, 'temperaturestatetopic', temp_state_topic if temp_state_topic else current_temp_state_topic)
-
-    current_humidity_state_topic = sensor_data_from_file.get('humiditystatetopic', 'path/to/mqtt/topic')
-    humidity_state_topic = input(f"Enter MQTT humidity state topic for Temperature Sensor {sensor_idx} (current: {current_humidity_state_topic}): ")
-    config.set(temp_sensor_section, 'humiditystatetopic', humidity_state_topic if humidity_state_topic else current_humidity_state_topic)
-
-    current_battery_state_topic = sensor_data_from_file.get('batterystatetopic', 'path/to/mqtt/topic')
-    battery_state_topic = input(f"Enter MQTT battery state topic for Temperature Sensor {sensor_idx} (current: {current_battery_state_topic}): ")
-    config.set(temp_sensor_section, 'batterystatetopic', battery_state_topic if battery_state_topic else current_battery_state_topic)
-
-    if is_new_device_flow:
-        current_global_temp_sensors = config.getint('Global', 'numberoftempsensors', fallback=0)
-        config.set('Global', 'numberoftempsensors', str(current_global_temp_sensors + 1))
+    for key, label in TEMP_TOPIC_KEYS:
+        _prompt_option(config[temp_sensor_section], sensor_data_from_file, key, f"Enter {label} for Temperature Sensor {sensor_idx}", DEFAULT_TOPIC)
 
     return device_instance_counter, device_index_sequencer
 
@@ -589,12 +825,6 @@ def configure_tank_sensor(config, existing_tank_sensors_by_index, device_instanc
                           highest_existing_device_instance=99, highest_existing_device_index=0):
     """Configures a single tank sensor."""
 
-    fluid_types_map = {
-        'fuel': 0, 'fresh water': 1, 'waste water': 2, 'live well': 3,
-        'oil': 4, 'black water': 5, 'gasoline': 6, 'diesel': 7,
-        'lpg': 8, 'lng': 9, 'hydraulic oil': 10, 'raw water': 11
-    }
-
     if is_new_device_flow:
         if existing_tank_sensors_by_index:
             sensor_idx = max(existing_tank_sensors_by_index.keys()) + 1
@@ -605,78 +835,46 @@ def configure_tank_sensor(config, existing_tank_sensors_by_index, device_instanc
         sensor_idx = current_sensor_idx
         print(f"\n--- Editing Tank Sensor (Sensor Index: {sensor_idx}) ---")
 
-    tank_sensor_section = f'Tank_Sensor_{sensor_idx}'
+    tank_sensor_section = sys.intern(f'Tank_Sensor_{sensor_idx}')
     sensor_data_from_file = existing_tank_sensors_by_index.get(sensor_idx, {})
 
-    if not config.has_section(tank_sensor_section):
-        config.add_section(tank_sensor_section)
+    _invalidate_section(tank_sensor_section)
+    config.setdefault(tank_sensor_section, {})
 
-    if is_new_device_flow:
-        config.set(tank_sensor_section, 'deviceinstance', str(device_instance_counter))
-        device_instance_counter += 1
-    else:
-        current_device_instance = sensor_data_from_file.get('deviceinstance', highest_existing_device_instance + 1)
-        config.set(tank_sensor_section, 'deviceinstance', str(current_device_instance))
-
-    if is_new_device_flow:
-        config.set(tank_sensor_section, 'deviceindex', str(device_index_sequencer))
-        device_index_sequencer += 1
-    else:
-        current_device_index = sensor_data_from_file.get('deviceindex', highest_existing_device_index + 1)
-        config.set(tank_sensor_section, 'deviceindex', str(current_device_index))
+    device_instance_counter, device_index_sequencer = _assign_device_numbers(
+        config[tank_sensor_section], sensor_data_from_file, is_new_device_flow, device_instance_counter, device_index_sequencer,
+        highest_existing_device_instance, highest_existing_device_index)
 
 
     current_custom_name = sensor_data_from_file.get('customname', f'Tank Sensor {sensor_idx}')
-    custom_name = input(f"Enter custom name for Tank Sensor {sensor_idx} (current: {current_custom_name}): ")
-    config.set(tank_sensor_section, 'customname', custom_name if custom_name else current_custom_name)
+    custom_name = _ask(f"Enter custom name for Tank Sensor {sensor_idx} (current: {current_custom_name}): ")
+    config[tank_sensor_section]['customname'] = custom_name if custom_name else current_custom_name
 
-    current_serial = sensor_data_from_file.get('serial', generate_serial())
-    if not sensor_data_from_file.get('serial'):
+    current_serial = sensor_data_from_file.get('serial')
+    if not current_serial:
+        current_serial = generate_serial()
         print(f"Generated new serial for Tank Sensor {sensor_idx}: {current_serial}")
-    config.set(tank_sensor_section, 'serial', current_serial)
+    config[tank_sensor_section]['serial'] = current_serial
 
-    current_level_state_topic = sensor_data_from_file.get('levelstatetopic', 'path/to/mqtt/topic')
-    level_state_topic = input(f"Enter MQTT level state topic for Tank Sensor {sensor_idx} (current: {current_level_state_topic}): ")
-    config.set(tank_sensor_section, 'levelstatetopic', level_state_topic if level_state_topic else current_level_state_topic)
+    for key, label in TANK_TOPIC_KEYS:
+        _prompt_option(config[tank_sensor_section], sensor_data_from_file, key, f"Enter {label} for Tank Sensor {sensor_idx}", DEFAULT_TOPIC)
 
-    current_battery_state_topic = sensor_data_from_file.get('batterystatetopic', 'path/to/mqtt/topic')
-    battery_state_topic = input(f"Enter MQTT battery state topic for Tank Sensor {sensor_idx} (current: {current_battery_state_topic}): ")
-    config.set(tank_sensor_section, 'batterystatetopic', battery_state_topic if battery_state_topic else current_battery_state_topic)
-
-    current_temp_state_topic = sensor_data_from_file.get('temperaturestatetopic', 'path/to/mqtt/topic')
-    temp_state_topic = input(f"Enter MQTT temperature state topic for Tank Sensor {sensor_idx} (current: {current_temp_state_topic}): ")
-    config.set(tank_sensor_section, 'temperaturestatetopic', temp_state_topic if temp_state_topic else current_temp_state_topic)
-
-    current_raw_value_state_topic = sensor_data_from_file.get('rawvaluestatetopic', 'path/to/mqtt/topic')
-    raw_value_state_topic = input(f"Enter MQTT raw value state topic for Tank Sensor {sensor_idx} (current: {current_raw_value_state_topic}): ")
-    config.set(tank_sensor_section, 'rawvaluestatetopic', raw_value_state_topic if raw_value_state_topic else current_raw_value_state_topic)
-
-    fluid_types_display = ", ".join([f"'{name}'" for name in fluid_types_map.keys()])
     current_fluid_type_name = sensor_data_from_file.get('fluidtype', 'fresh water')
     while True:
-        fluid_type_input = input(f"Enter fluid type for Tank Sensor {sensor_idx} (options: {fluid_types_display}; current: '{current_fluid_type_name}'): ")
+        fluid_type_input = _ask(f"Enter fluid type for Tank Sensor {sensor_idx} (options: {FLUID_TYPES_DISPLAY}; current: '{current_fluid_type_name}'): ").lower()
         if fluid_type_input:
-            if fluid_type_input.lower() in fluid_types_map:
-                config.set(tank_sensor_section, 'fluidtype', fluid_type_input.lower())
+            if fluid_type_input in FLUID_TYPES_MAP:
+                config[tank_sensor_section]['fluidtype'] = fluid_type_input
                 break
             else:
                 print("Invalid fluid type. Please choose from the available options.")
         else:
-            config.set(tank_sensor_section, 'fluidtype', current_fluid_type_name)
+            config[tank_sensor_section]['fluidtype'] = current_fluid_type_name
             break
 
-    current_raw_value_empty = sensor_data_from_file.get('rawvalueempty', '0')
-    config.set(tank_sensor_section, 'rawvalueempty', input(f"Enter raw value for empty tank (current: {current_raw_value_empty}): ") or current_raw_value_empty)
-
-    current_raw_value_full = sensor_data_from_file.get('rawvaluefull', '240')
-    config.set(tank_sensor_section, 'rawvaluefull', input(f"Enter raw value for full tank (current: {current_raw_value_full}): ") or current_raw_value_full)
-
-    current_capacity = sensor_data_from_file.get('capacity', '0.2')
-    config.set(tank_sensor_section, 'capacity', input(f"Enter tank capacity in m³ (current: {current_capacity}): ") or current_capacity)
-
-    if is_new_device_flow:
-        current_global_tank_sensors = config.getint('Global', 'numberoftanksensors', fallback=0)
-        config.set('Global', 'numberoftanksensors', str(current_global_tank_sensors + 1))
+    _prompt_option(config[tank_sensor_section], sensor_data_from_file, 'rawvalueempty', "Enter raw value for empty tank", '0')
+    _prompt_option(config[tank_sensor_section], sensor_data_from_file, 'rawvaluefull', "Enter raw value for full tank", '240')
+    _prompt_option(config[tank_sensor_section], sensor_data_from_file, 'capacity', "Enter tank capacity in m³", '0.2')
 
     return device_instance_counter, device_index_sequencer
 
@@ -695,79 +893,31 @@ def configure_virtual_battery(config, existing_virtual_batteries_by_index, devic
         battery_idx = current_battery_idx
         print(f"\n--- Editing Virtual Battery (Battery Index: {battery_idx}) ---")
 
-    virtual_battery_section = f'Virtual_Battery_{battery_idx}'
+    virtual_battery_section = sys.intern(f'Virtual_Battery_{battery_idx}')
     battery_data_from_file = existing_virtual_batteries_by_index.get(battery_idx, {})
 
-    if not config.has_section(virtual_battery_section):
-        config.add_section(virtual_battery_section)
-
-    if is_new_device_flow:
-        config.set(virtual_battery_section, 'deviceinstance', str(device_instance_counter))
-        device_instance_counter += 1
-    else:
-        current_device_instance = battery_data_from_file.get('deviceinstance', highest_existing_device_instance + 1)
-        config.set(virtual_battery_section, 'deviceinstance', str(current_device_instance))
+    _invalidate_section(virtual_battery_section)
+    config.setdefault(virtual_battery_section, {})
 
-    if is_new_device_flow:
-        config.set(virtual_battery_section, 'deviceindex', str(device_index_sequencer))
-        device_index_sequencer += 1
-    else:
-        current_device_index = battery_data_from_file.get('deviceindex', highest_existing_device_index + 1)
-        config.set(virtual_battery_section, 'deviceindex', str(current_device_index))
+    device_instance_counter, device_index_sequencer = _assign_device_numbers(
+        config[virtual_battery_section], battery_data_from_file, is_new_device_flow, device_instance_counter, device_index_sequencer,
+        highest_existing_device_instance, highest_existing_device_index)
 
 
     current_custom_name = battery_data_from_file.get('customname', f'Virtual Battery {battery_idx}')
-    custom_name = input(f"Enter custom name for Virtual Battery {battery_idx} (current: {current_custom_name}): ")
-    config.set(virtual_battery_section, 'customname', custom_name if custom_name else current_custom_name)
+    custom_name = _ask(f"Enter custom name for Virtual Battery {battery_idx} (current: {current_custom_name}): ")
+    config[virtual_battery_section]['customname'] = custom_name if custom_name else current_custom_name
 
-    current_serial = battery_data_from_file.get('serial', generate_serial())
-    if not battery_data_from_file.get('serial'):
+    current_serial = battery_data_from_file.get('serial')
+    if not current_serial:
+        current_serial = generate_serial()
         print(f"Generated new serial for Virtual Battery {battery_idx}: {current_serial}")
-    config.set(virtual_battery_section, 'serial', current_serial)
-
-    current_capacity = battery_data_from_file.get('capacityah', '100')
-    capacity = input(f"Enter capacity for Virtual Battery {battery_idx} in Ah (current: {current_capacity}): ")
-    config.set(virtual_battery_section, 'capacityah', capacity if capacity else current_capacity)
-
-    current_current_state_topic = battery_data_from_file.get('currentstatetopic', 'path/to/mqtt/topic')
-    current_state_topic = input(f"Enter MQTT battery current state topic for Virtual Battery {battery_idx} (current: {current_current_state_topic}): ")
-    config.set(virtual_battery_section, 'currentstatetopic', current_state_topic if current_state_topic else current_current_state_topic)
+    config[virtual_battery_section]['serial'] = current_serial
 
-    current_power_state_topic = battery_data_from_file.get('powerstatetopic', 'path/to/mqtt/topic')
-    power_state_topic = input(f"Enter MQTT battery power state topic for Virtual Battery {battery_idx} (current: {current_power_state_topic}): ")
-    config.set(virtual_battery_section, 'powerstatetopic', power_state_topic if power_state_topic else current_power_state_topic)
+    _prompt_option(config[virtual_battery_section], battery_data_from_file, 'capacityah', f"Enter capacity for Virtual Battery {battery_idx} in Ah", '100')
 
-    current_temperature_state_topic = battery_data_from_file.get('temperaturestatetopic', 'path/to/mqtt/topic')
-    temperature_state_topic = input(f"Enter MQTT temperature state topic for Virtual Battery {battery_idx} (current: {current_temperature_state_topic}): ")
-    config.set(virtual_battery_section, 'temperaturestatetopic', temperature_state_topic if temperature_state_topic else current_temperature_state_topic)
-
-    current_voltage_state_topic = battery_data_from_file.get('voltagestatetopic', 'path/to/mqtt/topic')
-    voltage_state_topic = input(f"Enter MQTT voltage state topic for Virtual Battery {battery_idx} (current: {current_voltage_state_topic}): ")
-    config.set(virtual_battery_section, 'voltagestatetopic', voltage_state_topic if voltage_state_topic else current_voltage_state_topic)
-
-    current_max_charge_current_state_topic = battery_data_from_file.get('maxchargecurrentstatetopic', 'path/to/mqtt/topic')
-    max_charge_current_state_topic = input(f"Enter MQTT max charge current state topic for Virtual Battery {battery_idx} (current: {current_max_charge_current_state_topic}): ")
-    config.set(virtual_battery_section, 'maxchargecurrentstatetopic', max_charge_current_state_topic if max_charge_current_state_topic else current_max_charge_current_state_topic)
-
-    current_max_charge_voltage_state_topic = battery_data_from_file.get('maxchargevoltagestatetopic', 'path/to/mqtt/topic')
-    max_charge_voltage_state_topic = input(f"Enter MQTT max charge voltage state topic for Virtual Battery {battery_idx} (current: {current_max_charge_voltage_state_topic}): ")
-    config.set(virtual_battery_section, 'maxchargevoltagestatetopic', max_charge_voltage_state_topic if max_charge_voltage_state_topic else current_max_charge_voltage_state_topic)
-
-    current_max_discharge_current_state_topic = battery_data_from_file.get('maxdischargecurrentstatetopic', 'path/to/mqtt/topic')
-    max_discharge_current_state_topic = input(f"Enter MQTT max discharge current state topic for Virtual Battery {battery_idx} (current: {current_max_discharge_current_state_topic}): ")
-    config.set(virtual_battery_section, 'maxdischargecurrentstatetopic', max_discharge_current_state_topic if max_discharge_current_state_topic else current_max_discharge_current_state_topic)
-
-    current_soc_state_topic = battery_data_from_file.get('socstatetopic', 'path/to/mqtt/topic')
-    soc_state_topic = input(f"Enter MQTT SOC state topic for Virtual Battery {battery_idx} (current: {current_soc_state_topic}): ")
-    config.set(virtual_battery_section, 'socstatetopic', soc_state_topic if soc_state_topic else current_soc_state_topic)
-
-    current_soh_state_topic = battery_data_from_file.get('sohstatetopic', 'path/to/mqtt/topic')
-    soh_state_topic = input(f"Enter MQTT SOH state topic for Virtual Battery {battery_idx} (current: {current_soh_state_topic}): ")
-    config.set(virtual_battery_section, 'sohstatetopic', soh_state_topic if soh_state_topic else current_soh_state_topic)
-
-    if is_new_device_flow:
-        current_global_virtual_batteries = config.getint('Global', 'numberofvirtualbatteries', fallback=0)
-        config.set('Global', 'numberofvirtualbatteries', str(current_global_virtual_batteries + 1))
+    for key, label in VIRTUAL_BATTERY_TOPIC_KEYS:
+        _prompt_option(config[virtual_battery_section], battery_data_from_file, key, f"Enter {label} for Virtual Battery {battery_idx}", DEFAULT_TOPIC)
 
     return device_instance_counter, device_index_sequencer
 
@@ -775,14 +925,13 @@ def configure_global_settings(config, existing_loglevel, existing_mqtt_broker, e
     """Prompts user for global settings including MQTT broker details."""
     print("\n--- Global Settings Configuration ---")
 
-    if not config.has_section('Global'):
-        config.add_section('Global')
+    config.setdefault('Global', {})
 
-    loglevel = input(f"Set logging level to INFO or DEBUG, (current: {existing_loglevel if existing_loglevel else 'INFO'}): ") or (existing_loglevel if existing_loglevel else 'INFO')
-    config.set('Global', 'loglevel', loglevel)
+    loglevel = _ask(f"Set logging level to INFO or DEBUG, (current: {existing_loglevel if existing_loglevel else 'INFO'}): ") or (existing_loglevel if existing_loglevel else 'INFO')
+    config['Global']['loglevel'] = loglevel
 
     # update existing log level after config change
-    existing_loglevel = config.get('Global', 'loglevel', fallback='INFO')
+    existing_loglevel = config.get('Global', {}).get('loglevel', 'INFO')
 
     # MQTT Broker Info
     broker_address, port, username, password = get_mqtt_broker_info(
@@ -791,12 +940,11 @@ def configure_global_settings(config, existing_loglevel, existing_mqtt_broker, e
         current_username=existing_mqtt_username,
         current_password=existing_mqtt_password
     )
-    if not config.has_section('MQTT'):
-        config.add_section('MQTT')
-    config.set('MQTT', 'brokeraddress', broker_address)
-    config.set('MQTT', 'port', str(port))
-    config.set('MQTT', 'username', username if username is not None else '')
-    config.set('MQTT', 'password', password if password is not None else '')
+    config.setdefault('MQTT', {})
+    config['MQTT']['brokeraddress'] = broker_address
+    config['MQTT']['port'] = str(port)
+    config['MQTT']['username'] = username if username is not None else ''
+    config['MQTT']['password'] = password if password is not None else ''
 
 
 
@@ -817,74 +965,265 @@ def configure_pv_charger(config, existing_pv_chargers_by_index, device_instance_
         charger_idx = current_charger_idx
         print(f"\n--- Editing PV Charger (Charger Index: {charger_idx}) ---")
 
-    pv_charger_section = f'Pv_Charger_{charger_idx}'
+    pv_charger_section = sys.intern(f'Pv_Charger_{charger_idx}')
     charger_data = existing_pv_chargers_by_index.get(charger_idx, {})
 
-    if not config.has_section(pv_charger_section):
-        config.add_section(pv_charger_section)
+    _invalidate_section(pv_charger_section)
+    config.setdefault(pv_charger_section, {})
 
     # Sequential instance and index
-    if is_new_device_flow:
-        config.set(pv_charger_section, 'deviceinstance', str(device_instance_counter))
-        device_instance_counter += 1
-    else:
-        current_device_instance = charger_data.get('deviceinstance', highest_existing_device_instance + 1)
-        config.set(pv_charger_section, 'deviceinstance', str(current_device_instance))
-
-    if is_new_device_flow:
-        config.set(pv_charger_section, 'deviceindex', str(device_index_sequencer))
-        device_index_sequencer += 1
-    else:
-        current_device_index = charger_data.get('deviceindex', highest_existing_device_index + 1)
-        config.set(pv_charger_section, 'deviceindex', str(current_device_index))    
+    device_instance_counter, device_index_sequencer = _assign_device_numbers(
+        config[pv_charger_section], charger_data, is_new_device_flow, device_instance_counter, device_index_sequencer,
+        highest_existing_device_instance, highest_existing_device_index)
 
     # Custom name
     current_custom_name = charger_data.get('customname', f'PV Charger {charger_idx}')
-    custom_name = input(f"Enter custom name for PV Charger {charger_idx} (current: {current_custom_name}): ")
-    config.set(pv_charger_section, 'customname', custom_name or current_custom_name)
+    custom_name = _ask(f"Enter custom name for PV Charger {charger_idx} (current: {current_custom_name}): ")
+    config[pv_charger_section]['customname'] = custom_name or current_custom_name
 
     # Serial number (generated if not already assigned)
-    serial = charger_data.get('serial', generate_serial())
-    if not charger_data.get('serial'):
+    serial = charger_data.get('serial')
+    if not serial:
+        serial = generate_serial()
         print(f"Generated new serial for PV Charger {charger_idx}: {serial}")
-    config.set(pv_charger_section, 'serial', serial)
+    config[pv_charger_section]['serial'] = serial
 
     # Required MQTT state topics
-    topic_keys = [
-        ('batterycurrentstatetopic', 'battery current'),
-        ('batteryvoltagestatetopic', 'battery voltage'),
-        ('maxchargecurrentstatetopic', 'max charge current'),
-        ('maxchargevoltagestatetopic', 'max charge voltage'),
-        ('pvvoltagestatetopic', 'PV voltage'),
-        ('pvpowerstatetopic', 'PV power'),
-        ('chargerstatetopic', 'charger state'),
-        ('loadstatetopic', 'load state'),
-        ('totalyield', 'total user accumulated yield'),
-        ('systemyield', 'total system accumulated yield')
-    ]
-
-    for key, label in topic_keys:
-        current_topic = charger_data.get(key, f'path/to/mqtt/topic')
-        topic = input(f"Enter MQTT topic for {label} (current: {current_topic}): ")
-        config.set(pv_charger_section, key, topic or current_topic)
-
-    # Update Global count
-    if is_new_device_flow:
-        current_global_pv_chargers = config.getint('Global', 'numberofpvchargers', fallback=0)
-        config.set('Global', 'numberofpvchargers', str(current_global_pv_chargers + 1))
+    for key, label in PV_TOPIC_KEYS:
+        _prompt_option(config[pv_charger_section], charger_data, key, f"Enter MQTT topic for {label}", DEFAULT_TOPIC)
 
     return device_instance_counter, device_index_sequencer
 
 
-def create_or_edit_config():
+@dataclass(slots=True)
+class LoadedState:
+    """Devices and settings found in the configuration, as used by the edit/remove menus."""
+    highest_existing_device_instance: int = 99
+    highest_existing_device_index: int = 0
+    highest_relay_module_idx_in_file: int = 0
+    highest_temp_sensor_idx_in_file: int = 0
+    highest_tank_sensor_idx_in_file: int = 0
+    highest_virtual_battery_idx_in_file: int = 0
+    highest_pv_charger_idx_in_file: int = 0
+    existing_relay_modules_by_index: dict = field(default_factory=dict)
+    existing_switches_by_module_and_switch_idx: dict = field(default_factory=dict)
+    existing_inputs_by_module_and_input_idx: dict = field(default_factory=dict)
+    existing_temp_sensors_by_index: dict = field(default_factory=dict)
+    existing_tank_sensors_by_index: dict = field(default_factory=dict)
+    existing_virtual_batteries_by_index: dict = field(default_factory=dict)
+    existing_pv_chargers_by_index: dict = field(default_factory=dict)
+    existing_mqtt_broker: str = ''
+    existing_mqtt_port: str = '1883'
+    existing_mqtt_username: str = ''
+    existing_mqtt_password: str = ''
+    existing_loglevel: str = ''
+
+def _parse_indexed_section(section, options):
+    # The section's own options dict is used as the entry, not a copy. The configure_* helpers
+    # read each current value before writing it back, so sharing it with `config` is safe.
+    return int(section.rpartition('_')[2]), options
+
+def _parse_relay_module_section(section, options):
+    module_idx = int(section.rpartition('_')[2])
+    return module_idx, {
+        'serial': options.get('serial', ''),
+        'deviceinstance': int(options.get('deviceinstance') or 0),
+        'deviceindex': int(options.get('deviceindex') or 0),
+        'customname': options.get('customname', f'Relay Module {module_idx}'),
+        'numberofswitches': int(options.get('numberofswitches') or 0),
+        'numberofinputs': int(options.get('numberofinputs') or 0),
+        'mqtt_on_state_payload': options.get('mqtt_on_state_payload', 'ON'),
+        'mqtt_off_state_payload': options.get('mqtt_off_state_payload', 'OFF'),
+        'mqtt_on_command_payload': options.get('mqtt_on_command_payload', 'ON'),
+        'mqtt_off_command_payload': options.get('mqtt_off_command_payload', 'OFF'),
+        'moduleserial': options.get('moduleserial', ''),
+    }
+
+def _parse_switch_section(section, options):
+    module_part, _, switch_part = section[len('switch_'):].partition('_')
+    module_idx = int(module_part)
+    switch_idx = int(switch_part)
+    return (module_idx, switch_idx), {
+        'customname': options.get('customname', f'switch {switch_idx}'),
+        'group': options.get('group', f'Group{module_idx}'),
+        'mqttstatetopic': options.get('mqttstatetopic', 'path/to/mqtt/topic'),
+        'mqttcommandtopic': options.get('mqttcommandtopic', 'path/to/mqtt/topic'),
+    }
+
+def _parse_input_section(section, options):
+    module_part, _, input_part = section[len('input_'):].partition('_')
+    module_idx = int(module_part)
+    input_idx = int(input_part)
+    return (module_idx, input_idx), {
+        'customname': options.get('customname', f'input {input_idx}'),
+        'serial': options.get('serial', ''),
+        'deviceinstance': int(options.get('deviceinstance') or 0),
+        'deviceindex': int(options.get('deviceindex') or 0),
+        'mqttstatetopic': options.get('mqttstatetopic', 'path/to/mqtt/topic'),
+        'mqtt_on_state_payload': options.get('mqtt_on_state_payload', 'ON'),
+        'mqtt_off_state_payload': options.get('mqtt_off_state_payload', 'OFF'),
+        'type': options.get('type', 'disabled'),
+    }
+
+# Section kind (the section name without its trailing index) -> parser returning (key, entry)
+_SECTION_PARSERS = {
+    'Relay_Module': _parse_relay_module_section,
+    'switch': _parse_switch_section,
+    'input': _parse_input_section,
+    'Temp_Sensor': _parse_indexed_section,
+    'Tank_Sensor': _parse_indexed_section,
+    'Virtual_Battery': _parse_indexed_section,
+    'Pv_Charger': _parse_indexed_section,
+}
+
+def _parse_device_section(section, options):
+    """
+    Builds the menu entry for one device section. Returns (section_kind, key, entry), or
+    (None, None, None) for sections that are not devices or whose name is malformed.
+    """
+    # 'Temp_Sensor_3' -> 'Temp_Sensor', 'switch_1_2' -> 'switch'
+    if section[:1].islower():
+        section_kind = section.partition('_')[0]
+    else:
+        section_kind = section.rpartition('_')[0]
+
+    parser = _SECTION_PARSERS.get(section_kind)
+    if parser is None:
+        return None, None, None
+    # The name must end in '_<n>' ('_<module>_<n>' for switches and inputs). Checked up front so
+    # a malformed name doesn't go through int() raising; the try below is for bad option values.
+    index_parts = section[len(section_kind) + 1:].split('_')
+    if len(index_parts) != (2 if section_kind in ('switch', 'input') else 1) or not all(map(_is_ascii_digits, index_parts)):
+        logger.warning(f"Skipping malformed {section_kind} section: {section}")
+        return None, None, None
+    try:
+        key, entry = parser(section, options)
+    except (ValueError, IndexError):
+        logger.warning(f"Skipping malformed {section_kind} section: {section}")
+        return None, None, None
+    return section_kind, key, entry
+
+def _entries_by_kind(state):
+    """Maps each section kind to the LoadedState dict its entries are kept in."""
+    return {
+        'Relay_Module': state.existing_relay_modules_by_index,
+        'switch': state.existing_switches_by_module_and_switch_idx,
+        'input': state.existing_inputs_by_module_and_input_idx,
+        'Temp_Sensor': state.existing_temp_sensors_by_index,
+        'Tank_Sensor': state.existing_tank_sensors_by_index,
+        'Virtual_Battery': state.existing_virtual_batteries_by_index,
+        'Pv_Charger': state.existing_pv_chargers_by_index,
+    }
 
-    # Declare    highest_existing_device_instance = -1
-    highest_existing_device_index = -1
-    highest_relay_module_idx_in_file = -1
-    highest_temp_sensor_idx_in_file = -1
-    highest_tank_sensor_idx_in_file = -1
-    highest_virtual_battery_idx_in_file = -1
-    highest_pv_charger_idx_in_file = -1
+def _store_section(state, entries_by_kind, section, options):
+    """Adds one section to `state`, reusing its cached parse when there is one."""
+    if 'deviceinstance' in options:
+        try:
+            state.highest_existing_device_instance = max(state.highest_existing_device_instance, int(options['deviceinstance']))
+        except ValueError:
+            pass
+    if 'deviceindex' in options:
+        try:
+            state.highest_existing_device_index = max(state.highest_existing_device_index, int(options['deviceindex']))
+        except ValueError:
+            pass
+
+    cached = _section_cache.get(section)
+    if cached is None:
+        cached = _section_cache[section] = _parse_device_section(section, options)
+    section_kind, key, entry = cached
+    if section_kind is None:
+        return
+    entries_by_kind[section_kind][key] = entry
+    if section_kind in ('switch', 'input'):
+        _module_subsections.setdefault(key[0], {})[section] = None
+
+def _update_highest_indexes(state):
+    state.highest_relay_module_idx_in_file = max(state.existing_relay_modules_by_index, default=0)
+    state.highest_temp_sensor_idx_in_file = max(state.existing_temp_sensors_by_index, default=0)
+    state.highest_tank_sensor_idx_in_file = max(state.existing_tank_sensors_by_index, default=0)
+    state.highest_virtual_battery_idx_in_file = max(state.existing_virtual_batteries_by_index, default=0)
+    state.highest_pv_charger_idx_in_file = max(state.existing_pv_chargers_by_index, default=0)
+
+def load_existing_config_data(config):
+    """
+    Collects the devices and settings in `config` into a LoadedState for the menus.
+    Sections already parsed on an earlier call are taken from _section_cache.
+    """
+    state = LoadedState()
+
+    # FIX: Loglevel is no longer read from config for this script's operation.
+    # It is set to DEBUG at the top.
+
+    state.existing_loglevel = config.get('Global', {}).get('loglevel', 'INFO')
+    state.existing_mqtt_broker = config.get('MQTT', {}).get('brokeraddress', 'localhost')
+    state.existing_mqtt_port = config.get('MQTT', {}).get('port', '1883')
+    state.existing_mqtt_username = config.get('MQTT', {}).get('username', '')
+    state.existing_mqtt_password = config.get('MQTT', {}).get('password', '')
+
+    global _device_list_cache
+    entries_by_kind = _entries_by_kind(state)
+    _module_subsections.clear()
+    _changed_sections.clear()
+    _device_list_cache = None
+
+    for section, options in config.items():
+        _store_section(state, entries_by_kind, section, options)
+
+    _update_highest_indexes(state)
+    return state
+
+def refresh_loaded_state(state, config):
+    """
+    Applies the sections changed or removed since `state` was built (see _invalidate_section())
+    to it, so a menu action costs the sections it touched rather than a full reload.
+    """
+    global _device_list_cache
+    if not _changed_sections:
+        return
+    _device_list_cache = None
+    entries_by_kind = _entries_by_kind(state)
+    for section in _changed_sections:
+        options = config.get(section)
+        if options is not None:
+            _store_section(state, entries_by_kind, section, options)
+            continue
+        # Removed: only the kind and key derived from the name are needed
+        section_kind, key, _ = _parse_device_section(section, {})
+        if section_kind is None:
+            continue
+        entries_by_kind[section_kind].pop(key, None)
+        if section_kind in ('switch', 'input'):
+            _module_subsections.get(key[0], {}).pop(section, None)
+    _changed_sections.clear()
+    _update_highest_indexes(state)
+
+def build_device_list(state):
+    """
+    Returns (section, name, idx, dev_type) for every device, as listed by the edit and remove menus.
+    Built once and reused until the LoadedState changes.
+    """
+    global _device_list_cache
+    if _device_list_cache is None:
+        devices = []
+        for idx, data in state.existing_relay_modules_by_index.items():
+            devices.append((f"Relay_Module_{idx}", data.get('customname', f'Relay Module {idx}'), idx, 'relay'))
+
+        for idx, data in state.existing_temp_sensors_by_index.items():
+            devices.append((f"Temp_Sensor_{idx}", data.get('customname', f'Temperature Sensor {idx}'), idx, 'temp'))
+
+        for idx, data in state.existing_tank_sensors_by_index.items():
+            devices.append((f"Tank_Sensor_{idx}", data.get('customname', f'Tank Sensor {idx}'), idx, 'tank'))
+
+        for idx, data in state.existing_pv_chargers_by_index.items():
+            devices.append((f"Pv_Charger_{idx}", data.get('customname', f'PV Charger {idx}'), idx, 'pv'))
+
+        for idx, data in state.existing_virtual_batteries_by_index.items():
+            devices.append((f"Virtual_Battery_{idx}", data.get('customname', f'Virtual Battery {idx}'), idx, 'battery'))
+        _device_list_cache = tuple(devices)
+    return _device_list_cache
+
+def create_or_edit_config():
     """
     Creates or edits a config file based on user input.
     The file will be located in /data/apps/external_devices and named config.ini.
@@ -894,160 +1233,11 @@ def create_or_edit_config():
 
     os.makedirs(config_dir, exist_ok=True)
 
-    config = configparser.ConfigParser()
+    config = {}
     file_exists = os.path.exists(config_path)
 
     editable_devices = []
-    existing_relay_modules_by_index = {}
-    existing_switches_by_module_and_switch_idx = {}
-    existing_inputs_by_module_and_input_idx = {}
-    existing_temp_sensors_by_index = {}
-    existing_tank_sensors_by_index = {}
-    existing_virtual_batteries_by_index = {}
-    existing_pv_chargers_by_index = {}
-
-    highest_relay_module_idx_in_file = 0
-    highest_temp_sensor_idx_in_file = 0
-    highest_tank_sensor_idx_in_file = 0
-    highest_virtual_battery_idx_in_file = 0
-    highest_pv_charger_idx_in_file = 0
-
-    highest_existing_device_instance = 99
-    highest_existing_device_index = 0
-
-    existing_mqtt_broker = ''
-    existing_mqtt_port = '1883'
-    existing_mqtt_username = ''
-    existing_mqtt_password = ''
-    existing_loglevel = ''
-
-    def load_existing_config_data():
-        # FIX: Make it clear we are modifying the global variables.
-        nonlocal highest_existing_device_instance, highest_existing_device_index
-        nonlocal highest_relay_module_idx_in_file, highest_temp_sensor_idx_in_file
-        nonlocal highest_tank_sensor_idx_in_file, highest_virtual_battery_idx_in_file
-        nonlocal highest_pv_charger_idx_in_file
-        nonlocal existing_mqtt_broker, existing_mqtt_port, existing_mqtt_username, existing_mqtt_password
-        nonlocal existing_loglevel
-
-        existing_relay_modules_by_index.clear()
-        existing_switches_by_module_and_switch_idx.clear()
-        existing_inputs_by_module_and_input_idx.clear()
-        existing_temp_sensors_by_index.clear()
-        existing_tank_sensors_by_index.clear()
-        existing_virtual_batteries_by_index.clear()
-        existing_pv_chargers_by_index.clear()
-        
-        config.read(config_path)
-
-        # FIX: Loglevel is no longer read from config for this script's operation.
-        # It is set to DEBUG at the top.
-
-        existing_loglevel = config.get('Global', 'loglevel', fallback='INFO')
-        existing_mqtt_broker = config.get('MQTT', 'brokeraddress', fallback='localhost')
-        existing_mqtt_port = config.get('MQTT', 'port', fallback='1883')
-        existing_mqtt_username = config.get('MQTT', 'username', fallback='')
-        existing_mqtt_password = config.get('MQTT', 'password', fallback='')
-
-        for section in config.sections():
-            if config.has_option(section, 'deviceinstance'):
-                try:
-                    instance = config.getint(section, 'deviceinstance')
-                    if instance > highest_existing_device_instance:
-                        highest_existing_device_instance = instance
-                except ValueError:
-                    pass
-            if config.has_option(section, 'deviceindex'):
-                try:
-                    index = config.getint(section, 'deviceindex')
-                    if index > highest_existing_device_index:
-                        highest_existing_device_index = index
-                except ValueError:
-                    pass
-
-            if section.startswith('Relay_Module_'):
-                try:
-                    module_idx = int(section.split('_')[2])
-                    highest_relay_module_idx_in_file = max(highest_relay_module_idx_in_file, module_idx)
-                    existing_relay_modules_by_index[module_idx] = {
-                        'serial': config.get(section, 'serial', fallback=''),
-                        'deviceinstance': config.getint(section, 'deviceinstance', fallback=0),
-                        'deviceindex': config.getint(section, 'deviceindex', fallback=0),
-                        'customname': config.get(section, 'customname', fallback=f'Relay Module {module_idx}'),
-                        'numberofswitches': config.getint(section, 'numberofswitches', fallback=0),
-                        'numberofinputs': config.getint(section, 'numberofinputs', fallback=0),
-                        'mqtt_on_state_payload': config.get(section, 'mqtt_on_state_payload', fallback='ON'),
-                        'mqtt_off_state_payload': config.get(section, 'mqtt_off_state_payload', fallback='OFF'),
-                        'mqtt_on_command_payload': config.get(section, 'mqtt_on_command_payload', fallback='ON'),
-                        'mqtt_off_command_payload': config.get(section, 'mqtt_off_command_payload', fallback='OFF'),
-                        'moduleserial': config.get(section, 'moduleserial', fallback=''),
-                    }
-                except (ValueError, IndexError):
-                    logger.warning(f"Skipping malformed Relay_Module section: {section}")
-
-            elif section.startswith('switch_'):
-                try:
-                    parts = section.split('_')
-                    module_idx = int(parts[1])
-                    switch_idx = int(parts[2])
-                    existing_switches_by_module_and_switch_idx[(module_idx, switch_idx)] = {
-                        'customname': config.get(section, 'customname', fallback=f'switch {switch_idx}'),
-                        'group': config.get(section, 'group', fallback=f'Group{module_idx}'),
-                        'mqttstatetopic': config.get(section, 'mqttstatetopic', fallback='path/to/mqtt/topic'),
-                        'mqttcommandtopic': config.get(section, 'mqttcommandtopic', fallback='path/to/mqtt/topic'),
-                    }
-                except (ValueError, IndexError):
-                    logger.warning(f"Skipping malformed switch section: {section}")
-
-            elif section.startswith('input_'):
-                try:
-                    parts = section.split('_')
-                    module_idx = int(parts[1])
-                    input_idx = int(parts[2])
-                    existing_inputs_by_module_and_input_idx[(module_idx, input_idx)] = {
-                        'customname': config.get(section, 'customname', fallback=f'input {input_idx}'),
-                        'serial': config.get(section, 'serial', fallback=''),
-                        'deviceinstance': config.getint(section, 'deviceinstance', fallback=0),
-                        'deviceindex': config.getint(section, 'deviceindex', fallback=0),
-                        'mqttstatetopic': config.get(section, 'mqttstatetopic', fallback='path/to/mqtt/topic'),
-                        'mqtt_on_state_payload': config.get(section, 'mqtt_on_state_payload', fallback='ON'),
-                        'mqtt_off_state_payload': config.get(section, 'mqtt_off_state_payload', fallback='OFF'),
-                        'type': config.get(section, 'type', fallback='disabled'),
-                    }
-                except (ValueError, IndexError):
-                    logger.warning(f"Skipping malformed input section: {section}")
-
-            elif section.startswith('Temp_Sensor_'):
-                try:
-                    sensor_idx = int(section.split('_')[2])
-                    highest_temp_sensor_idx_in_file = max(highest_temp_sensor_idx_in_file, sensor_idx)
-                    existing_temp_sensors_by_index[sensor_idx] = {key: val for key, val in config.items(section)}
-                except (ValueError, IndexError):
-                    logger.warning(f"Skipping malformed Temp_Sensor section: {section}")
-
-            elif section.startswith('Tank_Sensor_'):
-                try:
-                    sensor_idx = int(section.split('_')[2])
-                    highest_tank_sensor_idx_in_file = max(highest_tank_sensor_idx_in_file, sensor_idx)
-                    existing_tank_sensors_by_index[sensor_idx] = {key: val for key, val in config.items(section)}
-                except (ValueError, IndexError):
-                    logger.warning(f"Skipping malformed Tank_Sensor section: {section}")
-
-            elif section.startswith('Virtual_Battery_'):
-                try:
-                    battery_idx = int(section.split('_')[2])
-                    highest_virtual_battery_idx_in_file = max(highest_virtual_battery_idx_in_file, battery_idx)
-                    existing_virtual_batteries_by_index[battery_idx] = {key: val for key, val in config.items(section)}
-                except (ValueError, IndexError):
-                    logger.warning(f"Skipping malformed Virtual_Battery section: {section}")
-
-            elif section.startswith('Pv_Charger_'):
-                try:
-                    pv_charger_idx = int(section.split('_')[2])
-                    highest_pv_charger_idx_in_file = max(highest_pv_charger_idx_in_file, pv_charger_idx)
-                    existing_pv_chargers_by_index[pv_charger_idx] = {key: val for key, val in config.items(section)}
-                except (ValueError, IndexError):
-                    logger.warning(f"Skipping malformed Pv_Charger section: {section}")
+    state = LoadedState()
 
     if file_exists:
         print(f"Existing config file found at {config_path}.")
@@ -1057,24 +1247,26 @@ def create_or_edit_config():
             print("2) Create new configuration (WARNING: Existing configuration will be overwritten!)")
             print("3) Delete existing configuration and exit (WARNING: This cannot be undone!)")
 
-            choice = input("Enter your choice (1, 2 or 3): ")
+            choice = _ask("Enter your choice (1, 2 or 3): ")
 
             if choice == '1':
-                load_existing_config_data()
+                config = read_config_file(config_path)
+                _section_cache.clear()
+                state = load_existing_config_data(config)
                 print("Continuing to existing configuration.")
                 break
             elif choice == '2':
-                confirm = input("Are you absolutely sure you want to overwrite the existing configuration file? This cannot be undone! (yes/no): ")
+                confirm = _ask("Are you absolutely sure you want to overwrite the existing configuration file? This cannot be undone! (yes/no): ")
                 if confirm.lower() == 'yes':
                     os.remove(config_path)
                     print(f"Existing configuration file deleted: {config_path}")
                     file_exists = False
-                    config = configparser.ConfigParser()
+                    config = {}
                     break
                 else:
                     print("Creation of new configuration cancelled.")
             elif choice == '3':
-                confirm = input("Are you absolutely sure you want to delete the configuration file? This cannot be undone! (yes/no): ")
+                confirm = _ask("Are you absolutely sure you want to delete the configuration file? This cannot be undone! (yes/no): ")
                 if confirm.lower() == 'yes':
                     os.remove(config_path)
                     print(f"Configuration file deleted: {config_path}")
@@ -1089,65 +1281,49 @@ def create_or_edit_config():
 
 
     # Initialize counters for new devices
-    device_instance_counter = highest_existing_device_instance + 1
-    device_index_sequencer = highest_existing_device_index + 1
-
-    # Ensure Global section exists
-    if not config.has_section('Global'):
-        config.add_section('Global')
-    # Initialize global device counters if not present
-    if not config.has_option('Global', 'numberofmodules'):
-        config.set('Global', 'numberofmodules', '0')
-    if not config.has_option('Global', 'numberoftempsensors'):
-        config.set('Global', 'numberoftempsensors', '0')
-    if not config.has_option('Global', 'numberoftanksensors'):
-        config.set('Global', 'numberoftanksensors', '0')
-    if not config.has_option('Global', 'numberofvirtualbatteries'):
-        config.set('Global', 'numberofvirtualbatteries', '0')
-    if not config.has_option('Global', 'numberofpvchargers'):
-        config.set('Global', 'numberofpvchargers', '0')
+    device_instance_counter = state.highest_existing_device_instance + 1
+    device_index_sequencer = state.highest_existing_device_index + 1
+
+    # Ensure Global section exists, with the global device counters initialized if not present
+    global_section = config.setdefault('Global', {})
+    for key, value in _GLOBAL_DEFAULTS.items():
+        global_section.setdefault(key, value)
     # Set the loglevel in the config file itself
-    config.set('Global', 'loglevel', 'INFO')
+    global_section['loglevel'] = 'INFO'
 
 
-    # Ensure MQTT section exists for global settings
-    if not config.has_section('MQTT'):
-        config.add_section('MQTT')
-    # Pre-populate MQTT values if not existing to avoid errors during initial access
-    if not config.has_option('MQTT', 'brokeraddress'):
-        config.set('MQTT', 'brokeraddress', 'localhost')
-    if not config.has_option('MQTT', 'port'):
-        config.set('MQTT', 'port', '1883')
-    if not config.has_option('MQTT', 'username'):
-        config.set('MQTT', 'username', '')
-    if not config.has_option('MQTT', 'password'):
-        config.set('MQTT', 'password', '')
+    # Ensure MQTT section exists for global settings, pre-populated to avoid errors during initial access
+    mqtt_section = config.setdefault('MQTT', {})
+    for key, value in _MQTT_DEFAULTS.items():
+        mqtt_section.setdefault(key, value)
 
 
     auto_configured_serials_to_info = {}
+    config_dirty = False
 
     while True:
+        # Changes from the previous action are saved once here rather than inside every branch,
+        # so an interrupted session still keeps the work done so far.
+        config_dirty = flush_if_dirty(config, config_path, config_dirty)
+
         print("\n--- Main Configuration Menu ---")
         print("1) Global Settings")
         print("2) Add New Device")
         print("3) Edit Existing Device")
         print("4) Remove Existing Device")
-        print("5) Exit")
+        print("5) Save and Exit")
 
-        main_menu_choice = input("Enter your choice: ")
+        main_menu_choice = _ask("Enter your choice: ")
 
         if main_menu_choice == '1': # Handle Global Settings
-            configure_global_settings(config, existing_loglevel, existing_mqtt_broker, existing_mqtt_port, existing_mqtt_username, existing_mqtt_password)
+            configure_global_settings(config, state.existing_loglevel, state.existing_mqtt_broker, state.existing_mqtt_port, state.existing_mqtt_username, state.existing_mqtt_password)
             # Reload global settings after modification
-            existing_loglevel = config.get('Global', 'loglevel', fallback='INFO')
-            existing_mqtt_broker = config.get('MQTT', 'brokeraddress', fallback='localhost')
-            existing_mqtt_port = config.get('MQTT', 'port', fallback='1883')
-            existing_mqtt_username = config.get('MQTT', 'username', fallback='')
-            existing_mqtt_password = config.get('MQTT', 'password', fallback='')
-            # Auto-save after changing global settings
-            with open(config_path, 'w') as configfile:
-                config.write(configfile)
-            print("Configuration auto-saved.")
+            state.existing_loglevel = config.get('Global', {}).get('loglevel', 'INFO')
+            state.existing_mqtt_broker = config.get('MQTT', {}).get('brokeraddress', 'localhost')
+            state.existing_mqtt_port = config.get('MQTT', {}).get('port', '1883')
+            state.existing_mqtt_username = config.get('MQTT', {}).get('username', '')
+            state.existing_mqtt_password = config.get('MQTT', {}).get('password', '')
+            config_dirty = True
 
         elif main_menu_choice == '2': # Add New Device
             while True:
@@ -1159,58 +1335,45 @@ def create_or_edit_config():
                 print("5) PV Charger")
                 print("6) Back to Main Menu")
 
-                add_device_choice = input("Enter type of device to add: ")
+                add_device_choice = _ask("Enter type of device to add: ")
 
                 if add_device_choice == '1':
                     # Ask for discovery before adding a relay module
-                    discovery_choice = input("\nDo you want to try to discover Dingtian/Shelly modules via MQTT for auto-configuration?(yes/no): ").lower()
+                    discovery_choice = _ask("\nDo you want to try to discover Dingtian/Shelly modules via MQTT for auto-configuration?(yes/no): ").lower()
                     if discovery_choice == 'yes':
-                        mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
                         # Ensure we use the latest broker info from config
-                        broker_address = config.get('MQTT', 'brokeraddress', fallback='localhost')
-                        port = config.getint('MQTT', 'port', fallback=1883)
-                        username = config.get('MQTT', 'username', fallback='')
-                        password = config.get('MQTT', 'password', fallback='')
+                        broker_address = config.get('MQTT', {}).get('brokeraddress', 'localhost')
+                        port = int(config.get('MQTT', {}).get('port', 1883))
+                        username = config.get('MQTT', {}).get('username', '')
+                        password = config.get('MQTT', {}).get('password', '')
 
                         if not broker_address:
                             logger.error("\nMQTT Broker address is not set. Cannot perform discovery.")
                             print("Please configure MQTT details in 'Global Settings' first.")
                             continue
 
-                        if username:
-                            mqtt_client.username_pw_set(username, password)
                         try:
-                            print(f"Connecting to MQTT broker at {broker_address}:{port}...")
-                            mqtt_client.connect(broker_address, port, 60)
-                            print("Connected to MQTT broker.")
+                            mqtt_client = get_mqtt_client(broker_address, port, username, password)
                             all_discovered_modules_with_topics = discover_devices_via_mqtt(mqtt_client)
-                            mqtt_client.disconnect()
-                            print("Disconnected from MQTT broker.")
-
-                            newly_discovered_modules_to_propose = {}
-                            skipped_modules_count = 0
-                            for module_serial, module_info in all_discovered_modules_with_topics.items():
-                                is_already_in_config = False
-                                for existing_mod_data in existing_relay_modules_by_index.values():
-                                    if (existing_mod_data.get('serial') == module_serial or
-                                        existing_mod_data.get('moduleserial') == module_serial):
-                                        is_already_in_config = True
-                                        break
-                                if not is_already_in_config:
-                                    newly_discovered_modules_to_propose[module_serial] = module_info
-                                else:
-                                    skipped_modules_count += 1
+
+                            # Serials already used by a configured module, as its serial or moduleserial
+                            known_serials = {v for m in state.existing_relay_modules_by_index.values()
+                                             for k in ('serial', 'moduleserial') if (v := m.get(k))}
+
+                            candidate_serials = all_discovered_modules_with_topics.keys() - known_serials
+                            skipped_modules_count = len(all_discovered_modules_with_topics) - len(candidate_serials)
+                            newly_discovered_modules_to_propose = {s: all_discovered_modules_with_topics[s] for s in candidate_serials}
                             if skipped_modules_count > 0:
                                 print(f"\nSkipped {skipped_modules_count} discovered modules as they appear to be already configured by serial or moduleserial.")
 
                             if newly_discovered_modules_to_propose:
                                 print("\n--- Newly Discovered Modules (by Serial Number) ---")
-                                discovered_module_serials_list = sorted(list(newly_discovered_modules_to_propose.keys()))
+                                discovered_module_serials_list = sorted(newly_discovered_modules_to_propose)
                                 for i, module_serial in enumerate(discovered_module_serials_list):
                                     module_info = newly_discovered_modules_to_propose[module_serial]
                                     print(f"{i+1}) Device Type: {module_info['device_type'].capitalize()}, Module Serial: {module_serial}")
 
-                                selected_indices_input = input("Enter the number of the module you want to auto-configure (e.g., 1,3 or 'all'; enter to skip): ")
+                                selected_indices_input = _ask("Enter the number of the module you want to auto-configure (e.g., 1,3 or 'all'; enter to skip): ")
                                 selected_serials_for_auto_config = []
 
                                 if selected_indices_input.lower() == 'all':
@@ -1218,9 +1381,11 @@ def create_or_edit_config():
                                 else:
                                     try:
                                         if selected_indices_input:
-                                            indices = [int(x.strip()) - 1 for x in selected_indices_input.split(',')]
+                                            cleaned = selected_indices_input.translate(_WS_DROP)
+                                            indices = [int(x) - 1 for x in cleaned.split(',') if x]
+                                            module_count = len(discovered_module_serials_list)
                                             for idx in indices:
-                                                if 0 <= idx < len(discovered_module_serials_list):
+                                                if 0 <= idx < module_count:
                                                     selected_serials_for_auto_config.append(discovered_module_serials_list[idx])
                                                 else:
                                                     print(f"Warning: Invalid selection number {idx+1} ignored.")
@@ -1238,6 +1403,7 @@ def create_or_edit_config():
                                 print("\nNo new Dingtian or Shelly modules found via MQTT topic discovery to auto-configure.")
                         except Exception as e:
                             logger.error(f"\nCould not connect to MQTT broker or perform discovery: {e}")
+                            close_mqtt_client()
                             print("Proceeding without MQTT discovery for auto-configuration.")
                     else:
                         print("\nSkipping MQTT discovery for auto-configuration.")
@@ -1257,19 +1423,19 @@ def create_or_edit_config():
                             single_module_dict = {serial: info}
                             
                             device_instance_counter, device_index_sequencer = configure_relay_module(
-                                config, existing_relay_modules_by_index, existing_switches_by_module_and_switch_idx,
-                                existing_inputs_by_module_and_input_idx, device_instance_counter, device_index_sequencer,
+                                config, state.existing_relay_modules_by_index, state.existing_switches_by_module_and_switch_idx,
+                                state.existing_inputs_by_module_and_input_idx, device_instance_counter, device_index_sequencer,
                                 single_module_dict, is_new_device_flow=True, 
-                                highest_existing_device_instance=highest_existing_device_instance,
-                                highest_existing_device_index=highest_existing_device_index
+                                highest_existing_device_instance=state.highest_existing_device_instance,
+                                highest_existing_device_index=state.highest_existing_device_index
                             )
                             
-                            # After adding each module, save the file and reload the configuration data.
+                            # Bring the device lists up to date after adding each module.
                             # This is crucial for the next iteration to have the correct state.
-                            with open(config_path, 'w') as configfile:
-                                config.write(configfile)
-                            print(f"Module with serial {serial} configured and saved.")
-                            load_existing_config_data()
+                            config_dirty = True
+                            known_serials.add(serial)
+                            print(f"Module with serial {serial} configured.")
+                            refresh_loaded_state(state, config)
 
                         print("\n--- Finished processing all selected auto-discovered modules. ---")
                         auto_configured_serials_to_info.clear() # Clear the staged items.
@@ -1279,88 +1445,61 @@ def create_or_edit_config():
                     else:
                         print("\nNo modules selected for auto-install. Proceeding with manual configuration for a single module.")
                         device_instance_counter, device_index_sequencer = configure_relay_module(
-                            config, existing_relay_modules_by_index, existing_switches_by_module_and_switch_idx,
-                            existing_inputs_by_module_and_input_idx, device_instance_counter, device_index_sequencer,
+                            config, state.existing_relay_modules_by_index, state.existing_switches_by_module_and_switch_idx,
+                            state.existing_inputs_by_module_and_input_idx, device_instance_counter, device_index_sequencer,
                             auto_configured_serials_to_info, # This will be an empty dict
                             is_new_device_flow=True,
-                            highest_existing_device_instance=highest_existing_device_instance,
-                            highest_existing_device_index=highest_existing_device_index
+                            highest_existing_device_instance=state.highest_existing_device_instance,
+                            highest_existing_device_index=state.highest_existing_device_index
                         )
-                        # Auto-save and reload data after adding the new device
-                        with open(config_path, 'w') as configfile:
-                            config.write(configfile)
-                        print("Configuration auto-saved.")
-                        load_existing_config_data()
+                        # Update device lists after adding the new device
+                        config_dirty = True
+                        refresh_loaded_state(state, config)
 
                 elif add_device_choice == '2':
                     device_instance_counter, device_index_sequencer = configure_temp_sensor(
-                        config, existing_temp_sensors_by_index, device_instance_counter, device_index_sequencer,
+                        config, state.existing_temp_sensors_by_index, device_instance_counter, device_index_sequencer,
                         is_new_device_flow=True,
-                        highest_existing_device_instance=highest_existing_device_instance,
-                        highest_existing_device_index=highest_existing_device_index
+                        highest_existing_device_instance=state.highest_existing_device_instance,
+                        highest_existing_device_index=state.highest_existing_device_index
                     )
-                    with open(config_path, 'w') as configfile:
-                        config.write(configfile)
-                    print("Configuration auto-saved.")
-                    load_existing_config_data()
+                    config_dirty = True
+                    refresh_loaded_state(state, config)
                 elif add_device_choice == '3':
                     device_instance_counter, device_index_sequencer = configure_tank_sensor(
-                        config, existing_tank_sensors_by_index, device_instance_counter, device_index_sequencer,
+                        config, state.existing_tank_sensors_by_index, device_instance_counter, device_index_sequencer,
                         is_new_device_flow=True,
-                        highest_existing_device_instance=highest_existing_device_instance,
-                        highest_existing_device_index=highest_existing_device_index
+                        highest_existing_device_instance=state.highest_existing_device_instance,
+                        highest_existing_device_index=state.highest_existing_device_index
                     )
-                    with open(config_path, 'w') as configfile:
-                        config.write(configfile)
-                    print("Configuration auto-saved.")
-                    load_existing_config_data()
+                    config_dirty = True
+                    refresh_loaded_state(state, config)
                 elif add_device_choice == '4':
                     device_instance_counter, device_index_sequencer = configure_virtual_battery(
-                        config, existing_virtual_batteries_by_index, device_instance_counter, device_index_sequencer,
+                        config, state.existing_virtual_batteries_by_index, device_instance_counter, device_index_sequencer,
                         is_new_device_flow=True,
-                        highest_existing_device_instance=highest_existing_device_instance,
-                        highest_existing_device_index=highest_existing_device_index
+                        highest_existing_device_instance=state.highest_existing_device_instance,
+                        highest_existing_device_index=state.highest_existing_device_index
                     )
-                    with open(config_path, 'w') as configfile:
-                        config.write(configfile)
-                    print("Configuration auto-saved.")
-                    load_existing_config_data()
+                    config_dirty = True
+                    refresh_loaded_state(state, config)
                 elif add_device_choice == '5':
                     device_instance_counter, device_index_sequencer = configure_pv_charger(
-                        config, existing_pv_chargers_by_index, device_instance_counter, device_index_sequencer,
+                        config, state.existing_pv_chargers_by_index, device_instance_counter, device_index_sequencer,
                         is_new_device_flow=True,
-                        highest_existing_device_instance=highest_existing_device_instance,
-                        highest_existing_device_index=highest_existing_device_index
+                        highest_existing_device_instance=state.highest_existing_device_instance,
+                        highest_existing_device_index=state.highest_existing_device_index
                     )
-                    with open(config_path, 'w') as configfile:
-                        config.write(configfile)
-                    print("Configuration auto-saved.")
-                    load_existing_config_data()
+                    config_dirty = True
+                    refresh_loaded_state(state, config)
                 elif add_device_choice == '6':
                     break
                 else:
                     print("Invalid choice. Please select a valid option.")
 
         elif main_menu_choice == '3': # Edit Existing Device
-            # Reload data to ensure we are editing the latest saved version.
-            load_existing_config_data()
-
-            editable_devices = []
-            for idx, data in existing_relay_modules_by_index.items():
-                editable_devices.append((f"Relay_Module_{idx}", data.get('customname', f'Relay Module {idx}'), idx, 'relay'))
-
-            for idx, data in existing_temp_sensors_by_index.items():
-                editable_devices.append((f"Temp_Sensor_{idx}", data.get('customname', f'Temperature Sensor {idx}'), idx, 'temp'))
-
-            for idx, data in existing_tank_sensors_by_index.items():
-                editable_devices.append((f"Tank_Sensor_{idx}", data.get('customname', f'Tank Sensor {idx}'), idx, 'tank'))
-            
-            for idx, data in existing_pv_chargers_by_index.items():
-                editable_devices.append((f"Pv_Charger_{idx}", data.get('customname', f'PV Charger {idx}'), idx, 'pv'))
-
-            for idx, data in existing_virtual_batteries_by_index.items():
-                editable_devices.append((f"Virtual_Battery_{idx}", data.get('customname', f'Virtual Battery {idx}'), idx, 'battery'))
-
+            # `state` is refreshed after every change, so it already matches `config` here.
+            editable_devices = build_device_list(state)
             if not editable_devices:
                 print("\nNo devices to edit.")
                 continue
@@ -1371,7 +1510,7 @@ def create_or_edit_config():
                     print(f"{i+1}) {section} ({name})")
                 print(f"{len(editable_devices)+1}) Back to Main Menu")
 
-                edit_choice = input("Select a device to edit: ")
+                edit_choice = _ask("Select a device to edit: ")
                 try:
                     edit_idx = int(edit_choice) - 1
                     if 0 <= edit_idx < len(editable_devices):
@@ -1379,49 +1518,45 @@ def create_or_edit_config():
                         print(f"Editing {selected_section}...")
                         if dev_type == 'relay':
                             device_instance_counter, device_index_sequencer = configure_relay_module(
-                                config, existing_relay_modules_by_index, existing_switches_by_module_and_switch_idx,
-                                existing_inputs_by_module_and_input_idx, device_instance_counter, device_index_sequencer,
+                                config, state.existing_relay_modules_by_index, state.existing_switches_by_module_and_switch_idx,
+                                state.existing_inputs_by_module_and_input_idx, device_instance_counter, device_index_sequencer,
                                 auto_configured_serials_to_info, current_module_idx=original_idx, is_new_device_flow=False,
-                                highest_existing_device_instance=highest_existing_device_instance,
-                                highest_existing_device_index=highest_existing_device_index
+                                highest_existing_device_instance=state.highest_existing_device_instance,
+                                highest_existing_device_index=state.highest_existing_device_index
                             )
                         elif dev_type == 'temp':
                             device_instance_counter, device_index_sequencer = configure_temp_sensor(
-                                config, existing_temp_sensors_by_index, device_instance_counter, device_index_sequencer,
+                                config, state.existing_temp_sensors_by_index, device_instance_counter, device_index_sequencer,
                                 current_sensor_idx=original_idx, is_new_device_flow=False,
-                                highest_existing_device_instance=highest_existing_device_instance,
-                                highest_existing_device_index=highest_existing_device_index
+                                highest_existing_device_instance=state.highest_existing_device_instance,
+                                highest_existing_device_index=state.highest_existing_device_index
                             )
                         elif dev_type == 'tank':
                             device_instance_counter, device_index_sequencer = configure_tank_sensor(
-                                config, existing_tank_sensors_by_index, device_instance_counter, device_index_sequencer,
+                                config, state.existing_tank_sensors_by_index, device_instance_counter, device_index_sequencer,
                                 current_sensor_idx=original_idx, is_new_device_flow=False,
-                                highest_existing_device_instance=highest_existing_device_instance,
-                                highest_existing_device_index=highest_existing_device_index
+                                highest_existing_device_instance=state.highest_existing_device_instance,
+                                highest_existing_device_index=state.highest_existing_device_index
                             )
                         
                         elif dev_type == 'pv':
                             device_instance_counter, device_index_sequencer = configure_pv_charger(
-                                config, existing_pv_chargers_by_index, device_instance_counter, device_index_sequencer,
+                                config, state.existing_pv_chargers_by_index, device_instance_counter, device_index_sequencer,
                                 current_charger_idx=original_idx, is_new_device_flow=False,
-                                highest_existing_device_instance=highest_existing_device_instance,
-                                highest_existing_device_index=highest_existing_device_index
+                                highest_existing_device_instance=state.highest_existing_device_instance,
+                                highest_existing_device_index=state.highest_existing_device_index
                             )
 
                         elif dev_type == 'battery':
                                 device_instance_counter, device_index_sequencer = configure_virtual_battery(
-                                config, existing_virtual_batteries_by_index, device_instance_counter, device_index_sequencer,
+                                config, state.existing_virtual_batteries_by_index, device_instance_counter, device_index_sequencer,
                                 current_battery_idx=original_idx, is_new_device_flow=False,
-                                highest_existing_device_instance=highest_existing_device_instance,
-                                highest_existing_device_index=highest_existing_device_index
+                                highest_existing_device_instance=state.highest_existing_device_instance,
+                                highest_existing_device_index=state.highest_existing_device_index
                             )
 
-                        # Save the configuration *after* the changes have been made.
-                        with open(config_path, 'w') as configfile:
-                            config.write(configfile)
-                        print("Configuration auto-saved after editing.")
-                        
-                        load_existing_config_data() # Reload data after editing
+                        config_dirty = True
+                        refresh_loaded_state(state, config) # Update device lists after editing
                         break 
                     elif edit_idx == len(editable_devices):
                         break # Back to main menu
@@ -1431,23 +1566,7 @@ def create_or_edit_config():
                     print("Invalid input. Please enter a number.")
 
         elif main_menu_choice == '4': # Remove Existing Device
-            load_existing_config_data() # Ensure we have the latest list of devices
-            removable_devices = []
-            for idx, data in existing_relay_modules_by_index.items():
-                removable_devices.append((f"Relay_Module_{idx}", data.get('customname', f'Relay Module {idx}'), idx, 'relay'))
-
-            for idx, data in existing_temp_sensors_by_index.items():
-                removable_devices.append((f"Temp_Sensor_{idx}", data.get('customname', f'Temperature Sensor {idx}'), idx, 'temp'))
-
-            for idx, data in existing_tank_sensors_by_index.items():
-                removable_devices.append((f"Tank_Sensor_{idx}", data.get('customname', f'Tank Sensor {idx}'), idx, 'tank'))
-
-            for idx, data in existing_pv_chargers_by_index.items():
-                removable_devices.append((f"Pv_Charger_{idx}", data.get('customname', f'PV Charger {idx}'), idx, 'pv'))
-
-            for idx, data in existing_virtual_batteries_by_index.items():
-                removable_devices.append((f"Virtual_Battery_{idx}", data.get('customname', f'Virtual Battery {idx}'), idx, 'battery'))
-
+            removable_devices = build_device_list(state)
             if not removable_devices:
                 print("\nNo devices to remove.")
                 continue
@@ -1458,54 +1577,24 @@ def create_or_edit_config():
                     print(f"{i+1}) {section} ({name})")
                 print(f"{len(removable_devices)+1}) Back to Main Menu")
 
-                remove_choice = input("Select a device to remove: ")
+                remove_choice = _ask("Select a device to remove: ")
                 try:
                     remove_idx = int(remove_choice) - 1
                     if 0 <= remove_idx < len(removable_devices):
                         selected_section, _, original_idx, dev_type = removable_devices[remove_idx]
-                        confirm = input(f"Are you sure you want to remove {selected_section} ({removable_devices[remove_idx][1]})? (yes/no): ").lower()
+                        confirm = _ask(f"Are you sure you want to remove {selected_section} ({removable_devices[remove_idx][1]})? (yes/no): ").lower()
                         if confirm == 'yes':
-                            config.remove_section(selected_section)
+                            del config[selected_section]
+                            _invalidate_section(selected_section)
                             print(f"Removed section: {selected_section}")
                             if dev_type == 'relay':
-                                sections_to_remove_sub = []
-                                for section_name in config.sections():
-                                    if section_name.startswith(f'switch_{original_idx}_') or section_name.startswith(f'input_{original_idx}_'):
-                                        sections_to_remove_sub.append(section_name)
-                                for sub_section in sections_to_remove_sub:
-                                    config.remove_section(sub_section)
+                                for sub_section in _module_subsections.pop(original_idx, ()):
+                                    del config[sub_section]
+                                    _invalidate_section(sub_section)
                                     print(f"Removed associated section: {sub_section}")
 
-                                current_global_modules = config.getint('Global', 'numberofmodules', fallback=0)
-                                if current_global_modules > 0:
-                                    config.set('Global', 'numberofmodules', str(current_global_modules - 1))
-
-                            elif dev_type == 'temp':
-                                current_global_temp_sensors = config.getint('Global', 'numberoftempsensors', fallback=0)
-                                if current_global_temp_sensors > 0:
-                                    config.set('Global', 'numberoftempsensors', str(current_global_temp_sensors - 1))
-
-                            elif dev_type == 'tank':
-                                current_global_tank_sensors = config.getint('Global', 'numberoftanksensors', fallback=0)
-                                if current_global_tank_sensors > 0:
-                                    config.set('Global', 'numberoftanksensors', str(current_global_tank_sensors - 1))
-
-                            elif dev_type == 'pv':
-                                current_global_pv_chargers = config.getint('Global', 'numberofpvchargers', fallback=0)
-                                if current_global_pv_chargers > 0:
-                                    config.set('Global', 'numberofpvchargers', str(current_global_pv_chargers - 1))
-
-                            elif dev_type == 'battery':
-                                current_global_virtual_batteries = config.getint('Global', 'numberofvirtualbatteries', fallback=0)
-                                if current_global_virtual_batteries > 0:
-                                    config.set('Global', 'numberofvirtualbatteries', str(current_global_virtual_batteries - 1))
-
-                            # Auto-save after removal
-                            with open(config_path, 'w') as configfile:
-                                config.write(configfile)
-                            print("Configuration auto-saved after removal.")
-
-                            load_existing_config_data() # Reload data after removal
+                            config_dirty = True
+                            refresh_loaded_state(state, config) # Update device lists after removal
                             break 
                         else:
                             print("Removal cancelled.")
@@ -1518,6 +1607,10 @@ def create_or_edit_config():
                     print("Invalid input. Please enter a number.")
 
         elif main_menu_choice == '5': # Exit
+            # Also writes a new configuration nobody changed, so the service has a file to read
+            config_dirty = flush_if_dirty(config, config_path, config_dirty or not os.path.exists(config_path))
+            print("Configuration saved.")
+            close_mqtt_client()
             service_options_menu()
             return
 
@@ -8,36 +8,192 @@ import random
 import configparser
 import time
 import paho.mqtt.client as mqtt
-import threading
 import json
 import re
 import dbus.bus
 import traceback
+import signal
 
 logger = logging.getLogger()
 
-for handler in logger.handlers[:]:
-    logger.removeHandler(handler)
+# Set up the root logger once per process, even if this module is imported again
+if not getattr(logger, '_external_devices_configured', False):
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
 
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setFormatter(formatter)
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(formatter)
 
-logger.addHandler(console_handler)
-logger.setLevel(logging.DEBUG) # Default to DEBUG for better visibility
+    logger.addHandler(console_handler)
+    logger.setLevel(logging.DEBUG) # Default to DEBUG for better visibility
+    logger._external_devices_configured = True
 
 CONFIG_FILE_PATH = '/data/apps/external_devices/config.ini'
+CONFIG_FLUSH_DELAY_MS = 500 # Changes arriving within this window are written to the file together
+PUBLISH_COALESCE_MS = 20 # Switch commands issued within this window are published in one burst
+DBUS_UPDATE_COALESCE_MS = 20 # MQTT values arriving within this window are applied to D-Bus together, last value per path wins
+MQTT_MISC_INTERVAL_S = 1 # How often the MQTT client's keepalive/reconnect housekeeping runs on the main loop
+MQTT_RECONNECT_MIN_DELAY_S = 1 # Reconnect back-off bounds, same as paho's loop_start() defaults
+MQTT_RECONNECT_MAX_DELAY_S = 120
+MQTT_CONNECT_TIMEOUT_S = 2 # Socket connect timeout (reconnects block the main loop); leaves room for one SYN retransmit
+
+# Config section names, matched case-insensitively against the lowercased section name
+_SWITCH_SUBSECTION_RE = re.compile(r'^switch_\d+_\d+$') # [switch_X_Y] outputs belong to their Relay_Module_X
+_DEVICE_SECTION_RE = re.compile(r'^(relay_module|temp_sensor|tank_sensor|virtual_battery|input|pv_charger)_')
+_DEVICE_INDEX_RE = re.compile(r'_(\d+)')
+
+# Config file state shared by all services for saving D-Bus setting changes. The file is parsed
+# once, at startup, and again only if it was modified by someone else (e.g. config.py) since we
+# last read or wrote it; changes only update it in memory and schedule a write.
+_CONFIG = None
+_config_mtime = None # mtime of CONFIG_FILE_PATH when _CONFIG was last read from or written to it
+_pending_config_values = {} # (section, key) -> value set since the last write, re-applied after a re-read
+_config_flush_source = None # GLib source id of the pending _flush_config() call
+
+# Values received over MQTT are queued per (service, path) and applied to D-Bus in batches, so a
+# burst of messages costs one main loop callback and only the latest value is set. MQTT callbacks
+# run on the main loop too (see _mqtt_loop_misc), so none of this state needs locking.
+_pending_dbus_updates = {}
+_dbus_updates_scheduled = False
+
+VELIB_PATH = "/opt/victronenergy/dbus-systemcalc-py/ext/velib_python"
 
 try:
-    sys.path.insert(1, "/opt/victronenergy/dbus-systemcalc-py/ext/velib_python")
+    if VELIB_PATH not in sys.path:
+        sys.path.insert(1, VELIB_PATH)
     from vedbus import VeDbusService
 except ImportError:
     logger.critical("Cannot find vedbus library. Please ensure it's in the correct path.")
     sys.exit(1)
 
-def get_json_attribute(data, path):
-    parts = path.split('.')
+# Decoder for incoming MQTT payloads. orjson is used when installed; its JSONDecodeError
+# subclasses json.JSONDecodeError, so the except clauses below work with either decoder.
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+def _config_file_mtime():
+    try:
+        return os.stat(CONFIG_FILE_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+def _get_config():
+    """
+    Returns the shared config, (re)reading CONFIG_FILE_PATH on first use and whenever the file changed
+    since it was last read or written. Values saved but not yet written are re-applied after a re-read.
+    """
+    global _CONFIG, _config_mtime
+    mtime = _config_file_mtime()
+    if _CONFIG is None or mtime != _config_mtime:
+        if _CONFIG is not None:
+            logger.info(f"Config file {CONFIG_FILE_PATH} was modified externally, re-reading it.")
+        config = configparser.ConfigParser()
+        config.read(CONFIG_FILE_PATH)
+        for (section, key), value in _pending_config_values.items():
+            if not config.has_section(section):
+                config.add_section(section)
+            config.set(section, key, value)
+        _CONFIG = config
+        _config_mtime = mtime
+    return _CONFIG
+
+def save_config_value(section, key, value):
+    """Sets one option in the shared config and (re)schedules writing the file. Unchanged values are not written."""
+    global _config_flush_source
+    value = str(value)
+    config = _get_config()
+    if not config.has_section(section):
+        config.add_section(section)
+    elif config.get(section, key, raw=True, fallback=None) == value:
+        return
+    config.set(section, key, value)
+    _pending_config_values[(section, key)] = value
+    if _config_flush_source is not None:
+        GLib.source_remove(_config_flush_source)
+    _config_flush_source = GLib.timeout_add(CONFIG_FLUSH_DELAY_MS, _flush_config)
+
+def _flush_config():
+    """
+    Writes the shared config to CONFIG_FILE_PATH. Runs once per batch of changes.
+    The file is written to a temporary file first and then swapped in, so a power loss
+    mid-write never leaves a truncated config.ini behind.
+    """
+    global _config_flush_source, _config_mtime
+    _config_flush_source = None
+    tmp_path = CONFIG_FILE_PATH + '.tmp'
+    try:
+        config = _get_config() # Picks up edits made to the file since it was read, so they aren't overwritten
+        with open(tmp_path, 'w') as configfile:
+            config.write(configfile)
+            configfile.flush()
+            os.fsync(configfile.fileno())
+        os.replace(tmp_path, CONFIG_FILE_PATH)
+        _config_mtime = _config_file_mtime()
+        _pending_config_values.clear()
+        logger.debug(f"Config file written: {CONFIG_FILE_PATH}")
+    except Exception as e:
+        logger.error(f"Failed to write config file {CONFIG_FILE_PATH}: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
+        # Don't leave a half-written temporary file next to the config; config.ini itself is untouched
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    return False # Run only once
+
+def save_config_change(section, key, value):
+    """Saves one setting changed over D-Bus; failures are logged, never raised into the D-Bus callback."""
+    try:
+        save_config_value(section, key, value)
+        logger.debug(f"Saved config: Section=[{section}], Key='{key}', Value='{value}'")
+    except Exception as e:
+        logger.error(f"Failed to save config change for key '{key}' in section '{section}': {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
+
+def flush_pending_config():
+    """Writes out a scheduled config write immediately, e.g. on shutdown."""
+    if _config_flush_source is not None:
+        GLib.source_remove(_config_flush_source)
+        _flush_config()
+
+def queue_dbus_update(service, path, value):
+    """
+    Schedules service.update_dbus_from_mqtt(path, value) on the main loop, replacing any value still pending for path.
+    Updates are applied in one batch DBUS_UPDATE_COALESCE_MS after the first one, so bursts cost one main loop wakeup.
+    """
+    global _dbus_updates_scheduled
+    _pending_dbus_updates[(service, path)] = value
+    if _dbus_updates_scheduled:
+        return
+    _dbus_updates_scheduled = True
+    GLib.timeout_add(DBUS_UPDATE_COALESCE_MS, _apply_pending_dbus_updates)
+
+def _apply_pending_dbus_updates():
+    global _pending_dbus_updates, _dbus_updates_scheduled
+    pending, _pending_dbus_updates = _pending_dbus_updates, {}
+    _dbus_updates_scheduled = False
+    for (service, path), value in pending.items():
+        try:
+            service.update_dbus_from_mqtt(path, value)
+        except Exception as e:
+            logger.error(f"Error updating D-Bus path '{path}' for {service.service_name}: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
+    return False # Run only once
+
+def tank_level_from_raw(raw_value, raw_empty, raw_full):
+    """Tank level in % (clamped to 0-100, 2 decimals) for a raw reading between the empty and full calibration values."""
+    if raw_full == raw_empty:
+        return 0.0
+    return round(max(0.0, min(100.0, (raw_value - raw_empty) / (raw_full - raw_empty) * 100.0)), 2)
+
+def tank_remaining_from_level(level, capacity):
+    """Remaining tank contents (same unit as capacity, 2 decimals) for a level in %."""
+    return round(level / 100.0 * capacity, 2)
+
+def get_json_attribute(data, parts):
+    """Follows a dotted attribute path, pre-split into its parts (e.g. ('status', 'output')), into decoded JSON."""
     current = data
     for part in parts:
         if isinstance(current, dict) and part in current:
@@ -50,14 +206,26 @@ def get_json_attribute(data, path):
 # DbusSwitch Class
 # ====================================================================
 class DbusSwitch(VeDbusService):
+    # Fixed per-instance fields, kept out of the instance __dict__ (VeDbusService still has one for its own state)
+    __slots__ = (
+        'service_name', 'config_section_name', 'device_index', '_switch_section_prefix', 'custom_name', 'mqtt_client',
+        'mqtt_on_state_payload_raw', 'mqtt_off_state_payload_raw', 'mqtt_on_command_payload', 'mqtt_off_command_payload',
+        'mqtt_on_state_payload_json', 'mqtt_off_state_payload_json',
+        '_on_state_raw_lc', '_off_state_raw_lc', '_on_json_attr_parts', '_on_json_val_lc', '_off_json_attr_parts', '_off_json_val_lc',
+        'dbus_path_to_state_topic_map', 'dbus_path_to_command_topic_map', 'state_topic_to_dbus_path', 'mqtt_subscriptions',
+        '_pending_publishes', '_publish_flush_source'
+    )
+
     def __init__(self, service_name, device_config, output_configs, serial_number, mqtt_client,
                  mqtt_on_state_payload, mqtt_off_state_payload, mqtt_on_command_payload, mqtt_off_command_payload, bus):
         # Pass the bus instance to the parent constructor
         super().__init__(service_name, bus=bus, register=False) 
 
         self.service_name = service_name # Store service_name for logging
-        self.device_config = device_config
+        self.config_section_name = device_config.name # Section the module's CustomName is saved to
         self.device_index = device_config.getint('DeviceIndex')
+        # Built from the DeviceIndex string, like main() does, so e.g. [Relay_Module_01] saves to [switch_01_Y]
+        self._switch_section_prefix = f"switch_{device_config.get('DeviceIndex')}_"
         self.mqtt_on_state_payload_raw = mqtt_on_state_payload
         self.mqtt_off_state_payload_raw = mqtt_off_state_payload
         self.mqtt_on_command_payload = mqtt_on_command_payload
@@ -79,13 +247,29 @@ class DbusSwitch(VeDbusService):
         except json.JSONDecodeError:
             pass
 
+        # Payload matchers for on_mqtt_message_specific(), prepared once instead of per message
+        # Raw matchers are lowercased bytes so plain payloads can be compared without decoding them
+        self._on_state_raw_lc = mqtt_on_state_payload.encode().lower()
+        self._off_state_raw_lc = mqtt_off_state_payload.encode().lower()
+        self._on_json_attr_parts = self._on_json_val_lc = None
+        self._off_json_attr_parts = self._off_json_val_lc = None
+        if self.mqtt_on_state_payload_json:
+            on_json_attr, on_json_val = next(iter(self.mqtt_on_state_payload_json.items()))
+            self._on_json_attr_parts = tuple(on_json_attr.split('.'))
+            self._on_json_val_lc = str(on_json_val).lower()
+        if self.mqtt_off_state_payload_json:
+            off_json_attr, off_json_val = next(iter(self.mqtt_off_state_payload_json.items()))
+            self._off_json_attr_parts = tuple(off_json_attr.split('.'))
+            self._off_json_val_lc = str(off_json_val).lower()
+
         self.add_path('/Mgmt/ProcessName', 'dbus-victron-virtual')
         self.add_path('/Mgmt/ProcessVersion', '0.1.19')
         self.add_path('/Mgmt/Connection', 'Virtual')
-        self.add_path('/DeviceInstance', self.device_config.getint('DeviceInstance'))
+        self.add_path('/DeviceInstance', device_config.getint('DeviceInstance'))
         self.add_path('/ProductId', 49257)
         self.add_path('/ProductName', 'Virtual switch')
-        self.add_path('/CustomName', self.device_config.get('CustomName'), writeable=True, onchangecallback=self.handle_dbus_change)
+        self.custom_name = device_config.get('CustomName') # Cached for log messages on the MQTT path
+        self.add_path('/CustomName', self.custom_name, writeable=True, onchangecallback=self.handle_dbus_change)
         self.add_path('/Serial', serial_number)
         self.add_path('/State', 256)
         self.add_path('/FirmwareVersion', 0)
@@ -97,19 +281,23 @@ class DbusSwitch(VeDbusService):
 
         self.dbus_path_to_state_topic_map = {}
         self.dbus_path_to_command_topic_map = {}
-        self.mqtt_subscriptions = set() # Store topics this instance cares about
+        self.state_topic_to_dbus_path = {} # Reverse of dbus_path_to_state_topic_map, for incoming messages
+        self._pending_publishes = [] # (topic, payload) commands waiting for _flush_publishes()
+        self._publish_flush_source = None
 
         for output_data in output_configs:
             self.add_output(output_data)
 
         self.register() # Register all D-Bus paths at once
-        logger.info(f"Service '{service_name}' for device '{self['/CustomName']}' registered on D-Bus.")
+        logger.info(f"Service '{service_name}' for device '{self.custom_name}' registered on D-Bus.")
 
-        # Collect all unique topics this instance needs to subscribe to
-        for dbus_path, topic in self.dbus_path_to_state_topic_map.items():
-            if topic:
-                self.mqtt_subscriptions.add(topic)
-                logger.debug(f"DbusSwitch '{self['/CustomName']}' will subscribe to topic: {topic}")
+        # Collect all unique topics this instance needs to subscribe to (fixed from here on)
+        self.mqtt_subscriptions = frozenset(self.state_topic_to_dbus_path) # add_output() only maps valid topics
+        for topic in self.mqtt_subscriptions:
+            logger.debug(f"DbusSwitch '{self.custom_name}' will subscribe to topic: {topic}")
+        if not self.mqtt_subscriptions:
+            # main() only wires topic callbacks for mqtt_subscriptions, so this service never sees MQTT traffic
+            logger.warning(f"No valid MQTT topics for '{self.custom_name}'. Outputs will not update from or publish to MQTT.")
 
 
     def add_output(self, output_data):
@@ -122,6 +310,7 @@ class DbusSwitch(VeDbusService):
         if state_topic and 'path/to/mqtt' not in state_topic and command_topic and 'path/to/mqtt' not in command_topic:
             self.dbus_path_to_state_topic_map[dbus_state_path] = state_topic
             self.dbus_path_to_command_topic_map[dbus_state_path] = command_topic
+            self.state_topic_to_dbus_path.setdefault(state_topic, dbus_state_path)
         else:
             logger.warning(f"MQTT topics for {dbus_state_path} in DbusSwitch are invalid. Ignoring.")
 
@@ -136,66 +325,63 @@ class DbusSwitch(VeDbusService):
         self.add_path(f'{settings_prefix}/ShowUIControl', output_data.get('ShowUIControl'), writeable=True, onchangecallback=self.handle_dbus_change)
 
     def on_mqtt_message_specific(self, client, userdata, msg):
-        if msg.topic not in self.mqtt_subscriptions:
-            return # Not for this instance
-
-        logger.debug(f"DbusSwitch specific MQTT callback triggered for {self['/CustomName']} on topic '{msg.topic}'")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"DbusSwitch specific MQTT callback triggered for {self.custom_name} on topic '{msg.topic}'")
         try:
-            payload_str = msg.payload.decode().strip()
+            payload = msg.payload.strip()
             topic = msg.topic
             new_state = None
-            try:
-                incoming_json = json.loads(payload_str)
-                if self.mqtt_on_state_payload_json:
-                    on_attr, on_val = list(self.mqtt_on_state_payload_json.items())[0]
-                    extracted_on_value = get_json_attribute(incoming_json, on_attr)
-                    if extracted_on_value is not None and str(extracted_on_value).lower() == str(on_val).lower():
-                        new_state = 1
-                if new_state is None and self.mqtt_off_state_payload_json:
-                    off_attr, off_val = list(self.mqtt_off_state_payload_json.items())[0]
-                    extracted_off_value = get_json_attribute(incoming_json, off_attr)
-                    if extracted_off_value is not None and str(extracted_off_value).lower() == str(off_val).lower():
-                        new_state = 0
-                if new_state is None: # Fallback if JSON key/value not matched, try value in JSON as string
-                    processed_payload_value = str(incoming_json.get("value", payload_str)).lower()
-            except json.JSONDecodeError:
-                # If not JSON, process as raw string
-                processed_payload_value = payload_str.lower()
+            processed_payload_value = payload.lower() # Raw bytes unless a JSON object says otherwise
+            # Only a JSON object can match the JSON payload settings or carry a "value" key, so plain
+            # payloads skip the decoder (and its exception) and go straight to raw matching
+            if payload.startswith(b'{'):
+                try:
+                    incoming_json = json_loads(payload)
+                    if self.mqtt_on_state_payload_json:
+                        extracted_on_value = get_json_attribute(incoming_json, self._on_json_attr_parts)
+                        if extracted_on_value is not None and str(extracted_on_value).lower() == self._on_json_val_lc:
+                            new_state = 1
+                    if new_state is None and self.mqtt_off_state_payload_json:
+                        extracted_off_value = get_json_attribute(incoming_json, self._off_json_attr_parts)
+                        if extracted_off_value is not None and str(extracted_off_value).lower() == self._off_json_val_lc:
+                            new_state = 0
+                    if new_state is None and "value" in incoming_json: # Fallback if JSON key/value not matched, try value in JSON as string
+                        processed_payload_value = str(incoming_json["value"]).encode().lower()
+                except json.JSONDecodeError:
+                    pass # Not JSON after all, process as raw string
             
             if new_state is None: # If not determined by JSON parsing, try raw string matching
-                if processed_payload_value == self.mqtt_on_state_payload_raw.lower():
+                if processed_payload_value == self._on_state_raw_lc:
                     new_state = 1
-                elif processed_payload_value == self.mqtt_off_state_payload_raw.lower():
+                elif processed_payload_value == self._off_state_raw_lc:
                     new_state = 0
                 else:
-                    logger.warning(f"DbusSwitch: Unrecognized payload '{payload_str}' for topic '{topic}'. Expected '{self.mqtt_on_state_payload_raw}' or '{self.mqtt_off_state_payload_raw}'.")
+                    logger.warning(f"DbusSwitch: Unrecognized payload '{payload.decode(errors='replace')}' for topic '{topic}'. Expected '{self.mqtt_on_state_payload_raw}' or '{self.mqtt_off_state_payload_raw}'.")
                     return # Exit if state not determined
 
-            dbus_path = next((k for k, v in self.dbus_path_to_state_topic_map.items() if v == topic), None)
-            if dbus_path and self[dbus_path] != new_state:
-                logger.debug(f"DbusSwitch: Updating D-Bus path '{dbus_path}' to {new_state} for '{self['/CustomName']}'.")
-                GLib.idle_add(self.update_dbus_from_mqtt, dbus_path, new_state)
-            elif dbus_path:
-                logger.debug(f"DbusSwitch: D-Bus path '{dbus_path}' already {new_state}. No update needed.")
+            dbus_path = self.state_topic_to_dbus_path.get(topic)
+            if dbus_path:
+                # Always queued, even if D-Bus already shows new_state: a different value may still be pending
+                # for this path (e.g. ON then OFF within one batch). update_dbus_from_mqtt skips unchanged values.
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"DbusSwitch: Queuing D-Bus path '{dbus_path}' = {new_state} for '{self.custom_name}'.")
+                queue_dbus_update(self, dbus_path, new_state)
 
         except Exception as e:
-            logger.error(f"Error processing MQTT message for DbusSwitch {self.service_name} on topic {msg.topic}: {e}")
-            traceback.print_exc()
+            logger.error(f"Error processing MQTT message for DbusSwitch {self.service_name} on topic {msg.topic}: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
 
     def handle_dbus_change(self, path, value):
         # Determine the correct section name for saving config
         if "/SwitchableOutput/output_" in path:
             try:
                 # Extract output index from path (e.g., /SwitchableOutput/output_1/State -> 1)
-                match = re.search(r'/output_(\d+)/', path)
-                output_index = match.group(1) if match else None
-                if output_index is None:
+                output_index, sep, _ = path.partition('/output_')[2].partition('/')
+                if not sep or not output_index.isdigit():
                     logger.error(f"Failed to parse output index from D-Bus path: {path}")
                     return False
 
                 # This instance represents a Relay_Module, saving to its child switch_X_Y section
-                parent_device_index = self.device_config.get('DeviceIndex') # From Relay_Module_X
-                section_name = f'switch_{parent_device_index}_{output_index}'
+                section_name = f'{self._switch_section_prefix}{output_index}' # Parent index from Relay_Module_X
                 
                 key_name = path.split('/')[-1]
 
@@ -206,63 +392,65 @@ class DbusSwitch(VeDbusService):
                         return True
                     return False
                 elif "/Settings" in path:
-                    self.save_config_change(section_name, key_name, value)
+                    save_config_change(section_name, key_name, value)
                     return True
             except Exception as e:
-                logger.error(f"Error handling D-Bus change for switch output {path}: {e}")
-                traceback.print_exc()
+                logger.error(f"Error handling D-Bus change for switch output {path}: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
                 return False
         elif path == '/CustomName':
             # This handles the CustomName of the main DbusSwitch service itself (the Relay_Module)
-            # The section name to save to is the one that created this service.
-            self.save_config_change(self.device_config.name, 'CustomName', value)
+            self.custom_name = value
+            save_config_change(self.config_section_name, 'CustomName', value)
             return True
         return False
 
-    def save_config_change(self, section, key, value):
-        config = configparser.ConfigParser()
-        try:
-            config.read(CONFIG_FILE_PATH)
-            if not config.has_section(section):
-                config.add_section(section)
-            config.set(section, key, str(value))
-            with open(CONFIG_FILE_PATH, 'w') as configfile:
-                config.write(configfile)
-            logger.debug(f"Saved config: Section=[{section}], Key='{key}', Value='{value}'")
-        except Exception as e:
-            logger.error(f"Failed to save config file changes for key '{key}': {e}")
-            traceback.print_exc()
-
     def publish_mqtt_command(self, path, value):
+        # Checked first: outputs without a (valid) command topic never need the client
+        command_topic = self.dbus_path_to_command_topic_map.get(path)
+        if command_topic is None:
+            logger.warning(f"No command topic mapped for D-Bus path '{path}' in {self.service_name}.")
+            return
         if not self.mqtt_client or not self.mqtt_client.is_connected():
             logger.warning(f"MQTT client not connected, cannot publish command for {self.service_name}.")
             return
-        if path not in self.dbus_path_to_command_topic_map:
-            logger.warning(f"No command topic mapped for D-Bus path '{path}' in {self.service_name}.")
-            return
-        try:
-            command_topic = self.dbus_path_to_command_topic_map[path]
-            mqtt_payload = self.mqtt_on_command_payload if value == 1 else self.mqtt_off_command_payload
-            self.mqtt_client.publish(command_topic, mqtt_payload, retain=False)
-            logger.debug(f"Published MQTT command '{mqtt_payload}' to topic '{command_topic}' for {self.service_name}.")
-        except Exception as e:
-            logger.error(f"Error during MQTT publish for {self.service_name}: {e}")
-            traceback.print_exc()
+        mqtt_payload = self.mqtt_on_command_payload if value == 1 else self.mqtt_off_command_payload
+        # Queue the command so that several outputs switched together (e.g. a UI group) go out in one burst
+        self._pending_publishes.append((command_topic, mqtt_payload))
+        if self._publish_flush_source is None:
+            self._publish_flush_source = GLib.timeout_add(PUBLISH_COALESCE_MS, self._flush_publishes)
+
+    def _flush_publishes(self):
+        self._publish_flush_source = None
+        pending, self._pending_publishes = self._pending_publishes, []
+        for command_topic, mqtt_payload in pending:
+            try:
+                self.mqtt_client.publish(command_topic, mqtt_payload, retain=False)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Published MQTT command '{mqtt_payload}' to topic '{command_topic}' for {self.service_name}.")
+            except Exception as e:
+                logger.error(f"Error during MQTT publish for {self.service_name}: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
+        return False # Run only once
 
     def update_dbus_from_mqtt(self, path, value):
         try:
             if self[path] != value:
                 self[path] = value
-                logger.debug(f"DbusSwitch: D-Bus path '{path}' updated to {value}.")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"DbusSwitch: D-Bus path '{path}' updated to {value}.")
         except Exception as e:
-            logger.error(f"Error updating D-Bus path '{path}' in DbusSwitch: {e}")
-            traceback.print_exc()
+            logger.error(f"Error updating D-Bus path '{path}' in DbusSwitch: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
         return False # Run only once
 
 # ====================================================================
 # DbusDigitalInput Class
 # ====================================================================
 class DbusDigitalInput(VeDbusService):
+    # Fixed per-instance fields, kept out of the instance __dict__ (VeDbusService still has one for its own state)
+    __slots__ = (
+        'service_name', 'config_section_name', 'custom_name', 'mqtt_client',
+        'mqtt_state_topic', 'mqtt_on_payload', 'mqtt_off_payload', '_on_payload_lc', '_off_payload_lc', 'mqtt_subscriptions'
+    )
+
     # Added mapping for text to integer conversion
     DIGITAL_INPUT_TYPES = {
         'disabled': 0,
@@ -277,42 +465,67 @@ class DbusDigitalInput(VeDbusService):
         'generator': 9,
         'touch input control': 10
     }
+    DIGITAL_INPUT_TYPE_NAMES = {num: name for name, num in DIGITAL_INPUT_TYPES.items()} # Reverse mapping for saving /Type
+
+    # /Type -> (D-Bus State when active, D-Bus State when inactive)
+    TYPE_STATE_VALUES = {
+        2: (7, 6), # door alarm: 7=alarm, 6=normal
+        3: (3, 2), # bilge pump: 3=on, 2=off
+        4: (9, 8), # bilge alarm: 9=alarm, 8=normal
+        5: (9, 8), # burglar alarm
+        6: (9, 8), # smoke alarm
+        7: (9, 8), # fire alarm
+        8: (9, 8)  # co2 alarm
+    }
 
     def __init__(self, service_name, device_config, serial_number, mqtt_client, bus):
         # Pass the bus instance to the parent constructor
         super().__init__(service_name, bus=bus, register=False)
 
-        self.device_config = device_config
         # The section name itself (e.g., 'input_1_1') is used for saving
         self.config_section_name = device_config.name 
         self.service_name = service_name # Store service_name for logging
 
+        # Read every setting from the section once
+        cfg = device_config
+        device_instance = cfg.getint('DeviceInstance')
+        custom_name = cfg.get('CustomName', 'Digital Input')
+        count = cfg.getint('Count', 0)
+        state = cfg.getint('State', 0)
+        type_str = cfg.get('Type', 'disabled').lower()
+        invert_translation = cfg.getint('InvertTranslation', 0)
+        invert_alarm = cfg.getint('InvertAlarm', 0)
+        alarm_setting = cfg.getint('AlarmSetting', 0)
+        mqtt_state_topic = cfg.get('MqttStateTopic')
+        mqtt_on_payload = cfg.get('mqtt_on_state_payload', 'ON')
+        mqtt_off_payload = cfg.get('mqtt_off_state_payload', 'OFF')
+
         # General device settings
         self.add_path('/Mgmt/ProcessName', 'dbus-victron-virtual')
         self.add_path('/Mgmt/ProcessVersion', '0.1.19')
         self.add_path('/Mgmt/Connection', 'Virtual')
         
         # Paths from config
-        self.add_path('/DeviceInstance', self.device_config.getint('DeviceInstance'))
+        self.add_path('/DeviceInstance', device_instance)
         self.add_path('/ProductId', 41318) # From user example
         self.add_path('/ProductName', 'Virtual digital input')
         self.add_path('/Serial', serial_number)
 
         # Writable paths with callbacks
-        self.add_path('/CustomName', self.device_config.get('CustomName', 'Digital Input'), writeable=True, onchangecallback=self.handle_dbus_change)
-        self.add_path('/Count', self.device_config.getint('Count', 0), writeable=True, onchangecallback=self.handle_dbus_change)
-        self.add_path('/State', self.device_config.getint('State', 0), writeable=True, onchangecallback=self.handle_dbus_change)
+        self.custom_name = custom_name # Cached for log messages on the MQTT path
+        self.add_path('/CustomName', custom_name, writeable=True, onchangecallback=self.handle_dbus_change)
+        self.add_path('/Count', count, writeable=True, onchangecallback=self.handle_dbus_change)
+        self.add_path('/State', state, writeable=True, onchangecallback=self.handle_dbus_change)
         
         # Modified: Convert text 'Type' from config to integer for D-Bus
-        initial_type_str = self.device_config.get('Type', 'disabled').lower() # Get as string, make lowercase
-        initial_type_int = self.DIGITAL_INPUT_TYPES.get(initial_type_str, self.DIGITAL_INPUT_TYPES['disabled']) # Convert to int, default to disabled
+        initial_type_int = self.DIGITAL_INPUT_TYPES.get(type_str, self.DIGITAL_INPUT_TYPES['disabled']) # Convert to int, default to disabled
         self.add_path('/Type', initial_type_int, writeable=True, onchangecallback=self.handle_dbus_change)
         
         # Settings paths
-        self.add_path('/Settings/InvertTranslation', self.device_config.getint('InvertTranslation', 0), writeable=True, onchangecallback=self.handle_dbus_change)
+        self.add_path('/Settings/InvertTranslation', invert_translation, writeable=True, onchangecallback=self.handle_dbus_change)
         # Added new D-Bus paths for InvertAlarm and AlarmSetting
-        self.add_path('/Settings/InvertAlarm', self.device_config.getint('InvertAlarm', 0), writeable=True, onchangecallback=self.handle_dbus_change)
-        self.add_path('/Settings/AlarmSetting', self.device_config.getint('AlarmSetting', 0), writeable=True, onchangecallback=self.handle_dbus_change)
+        self.add_path('/Settings/InvertAlarm', invert_alarm, writeable=True, onchangecallback=self.handle_dbus_change)
+        self.add_path('/Settings/AlarmSetting', alarm_setting, writeable=True, onchangecallback=self.handle_dbus_change)
 
         # Read-only paths updated by the service
         self.add_path('/Connected', 1)
@@ -322,49 +535,50 @@ class DbusDigitalInput(VeDbusService):
         # Use the global MQTT client passed in
         self.mqtt_client = mqtt_client
 
-        self.mqtt_state_topic = self.device_config.get('MqttStateTopic')
-        self.mqtt_on_payload = self.device_config.get('mqtt_on_state_payload', 'ON')
-        self.mqtt_off_payload = self.device_config.get('mqtt_off_state_payload', 'OFF')
+        self.mqtt_state_topic = mqtt_state_topic
+        self.mqtt_on_payload = mqtt_on_payload
+        self.mqtt_off_payload = mqtt_off_payload
+        # Lowercased bytes, compared against the payload without decoding it
+        self._on_payload_lc = self.mqtt_on_payload.encode().lower()
+        self._off_payload_lc = self.mqtt_off_payload.encode().lower()
 
-        self.mqtt_subscriptions = set() # Store topics this instance cares about
         if self.mqtt_state_topic and 'path/to/mqtt' not in self.mqtt_state_topic:
-            self.mqtt_subscriptions.add(self.mqtt_state_topic)
-            logger.debug(f"DbusDigitalInput '{self['/CustomName']}' will subscribe to topic: {self.mqtt_state_topic}")
+            self.mqtt_subscriptions = frozenset((self.mqtt_state_topic,)) # Store topics this instance cares about
+            logger.debug(f"DbusDigitalInput '{self.custom_name}' will subscribe to topic: {self.mqtt_state_topic}")
         else:
-            logger.warning(f"No valid MqttStateTopic for '{self['/CustomName']}'. State will not update from MQTT.")
+            logger.warning(f"No valid MqttStateTopic for '{self.custom_name}'. State will not update from MQTT.")
+            self.mqtt_subscriptions = frozenset()
 
         self.register() # Register D-Bus paths
 
-        logger.info(f"Service '{service_name}' for device '{self['/CustomName']}' registered on D-Bus.")
+        logger.info(f"Service '{service_name}' for device '{self.custom_name}' registered on D-Bus.")
 
     # Specific message handler for this digital input
+    # main() registers it as the paho callback for mqtt_state_topic only, so the topic is not checked again here
     def on_mqtt_message_specific(self, client, userdata, msg):
-        if msg.topic not in self.mqtt_subscriptions:
-            return # Not for this instance
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"DbusDigitalInput specific MQTT callback triggered for {self.custom_name} on topic '{msg.topic}'")
 
-        logger.debug(f"DbusDigitalInput specific MQTT callback triggered for {self['/CustomName']} on topic '{msg.topic}'")
-        
-        if msg.topic != self.mqtt_state_topic:
-            logger.debug(f"DbusDigitalInput: Received message on non-matching topic '{msg.topic}'. Expected '{self.mqtt_state_topic}'.")
-            return
-        
         try:
-            payload_str = msg.payload.decode().strip()
-            logger.debug(f"DbusDigitalInput: Received MQTT message on topic '{msg.topic}': {payload_str}")
+            payload = msg.payload.strip()
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"DbusDigitalInput: Received MQTT message on topic '{msg.topic}': {payload.decode(errors='replace')}")
 
             raw_state = None
-            if payload_str.lower() == self.mqtt_on_payload.lower():
+            payload_lc = payload.lower()
+            if payload_lc == self._on_payload_lc:
                 raw_state = 1
-            elif payload_str.lower() == self.mqtt_off_payload.lower():
+            elif payload_lc == self._off_payload_lc:
                 raw_state = 0
             
             if raw_state is None:
-                logger.warning(f"DbusDigitalInput: Invalid MQTT payload '{payload_str}' received for '{self['/CustomName']}'. Expected '{self.mqtt_on_payload}' or '{self.mqtt_off_payload}'.")
+                logger.warning(f"DbusDigitalInput: Invalid MQTT payload '{payload.decode(errors='replace')}' received for '{self.custom_name}'. Expected '{self.mqtt_on_payload}' or '{self.mqtt_off_payload}'.")
                 return
 
             # InputState always reflects the actual (raw) state
             if self['/InputState'] != raw_state:
-                logger.debug(f"DbusDigitalInput: Updating /InputState for '{self['/CustomName']}' to {raw_state}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"DbusDigitalInput: Updating /InputState for '{self.custom_name}' to {raw_state}")
                 GLib.idle_add(self.update_dbus_input_state, raw_state)
 
             # Apply inversion for the main State D-Bus path
@@ -374,32 +588,26 @@ class DbusDigitalInput(VeDbusService):
             # Get the D-Bus State value based on the Type setting
             dbus_state = self._get_dbus_state_for_type(final_state)
 
-            # Schedule D-Bus update for the main State in main thread
+            # Schedule D-Bus update for the main State on the main loop
             if self['/State'] != dbus_state:
-                logger.debug(f"DbusDigitalInput: Updating /State for '{self['/CustomName']}' to {dbus_state}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"DbusDigitalInput: Updating /State for '{self.custom_name}' to {dbus_state}")
                 GLib.idle_add(self.update_dbus_state, dbus_state)
 
         except Exception as e:
-            logger.error(f"Error processing MQTT message for Digital Input {self.service_name} on topic {msg.topic}: {e}")
-            traceback.print_exc()
+            logger.error(f"Error processing MQTT message for Digital Input {self.service_name} on topic {msg.topic}: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
 
     def _get_dbus_state_for_type(self, logical_state):
         """
         Maps the logical state (0 or 1) to the specific D-Bus State value
         based on the currently configured Type.
         """
-        current_type = self['/Type']
-        
-        if current_type == 2:  # 'door alarm'
-            return 7 if logical_state == 1 else 6  # 7=alarm, 6=normal
-        elif current_type == 3: # 'bilge pump'
-            return 3 if logical_state == 1 else 2  # 3=on, 2=off
-        elif 4 <= current_type <= 8: # bilge alarm, burglar alarm, smoke alarm, fire alarm, co2 alarm
-            return 9 if logical_state == 1 else 8  # 9=alarm, 8=normal
-        
-        # For other types (disabled, pulse meter, generator, touch input control, or unmapped),
-        # return the logical state directly (0 or 1)
-        return logical_state
+        on_off = self.TYPE_STATE_VALUES.get(self['/Type'])
+        # Types without an entry (disabled, pulse meter, generator, touch input control, or unmapped)
+        # report the logical state directly (0 or 1)
+        if on_off is None:
+            return logical_state
+        return on_off[0] if logical_state == 1 else on_off[1]
 
     def update_dbus_input_state(self, new_raw_state):
         self['/InputState'] = new_raw_state
@@ -416,11 +624,13 @@ class DbusDigitalInput(VeDbusService):
             
             value_to_save = value
             if path == '/Type':
-                value_to_save = next((name for name, num in self.DIGITAL_INPUT_TYPES.items() if num == value), 'disabled')
+                value_to_save = self.DIGITAL_INPUT_TYPE_NAMES.get(value, 'disabled')
+            elif path == '/CustomName':
+                self.custom_name = value
             
             # Special handling for Alarm settings as they are under /Settings
             if path.startswith('/Settings/'):
-                self.save_config_change(self.config_section_name, key_name, value)
+                save_config_change(self.config_section_name, key_name, value)
                 if path == '/Settings/InvertTranslation':
                     # Recalculate and update /State immediately when InvertTranslation changes
                     current_raw_state = self['/InputState']
@@ -429,31 +639,23 @@ class DbusDigitalInput(VeDbusService):
                     new_dbus_state_value = self._get_dbus_state_for_type(final_state_after_inversion)
                     GLib.idle_add(self.update_dbus_state, new_dbus_state_value)
             else: # For paths directly under the device root (CustomName, Count, State, Type)
-                self.save_config_change(self.config_section_name, key_name, value_to_save)
+                save_config_change(self.config_section_name, key_name, value_to_save)
             return True
         except Exception as e:
-            logger.error(f"Failed to handle D-Bus change for {path}: {e}")
-            traceback.print_exc()
+            logger.error(f"Failed to handle D-Bus change for {path}: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
             return False
 
-    def save_config_change(self, section, key, value):
-        config = configparser.ConfigParser()
-        try:
-            config.read(CONFIG_FILE_PATH)
-            if not config.has_section(section):
-                config.add_section(section)
-            config.set(section, key, str(value))
-            with open(CONFIG_FILE_PATH, 'w') as configfile:
-                config.write(configfile)
-            logger.debug(f"Saved config: Section=[{section}], Key='{key}', Value='{value}'")
-        except Exception as e:
-            logger.error(f"Failed to save config file changes for key '{key}' in section '{section}': {e}")
-            traceback.print_exc()
-
 # ====================================================================
 # DbusTempSensor Class
 # ====================================================================
 class DbusTempSensor(VeDbusService):
+    # Fixed per-instance fields, kept out of the instance __dict__ (VeDbusService still has one for its own state)
+    __slots__ = (
+        'service_name', 'device_index', 'custom_name', 'mqtt_client',
+        'dbus_path_to_state_topic_map', 'state_topic_to_dbus_path', 'mqtt_subscriptions', '_last_values',
+        'max_inactivity_seconds', 'last_valid_update_time'
+    )
+
     TEMPERATURE_TYPES = {
         'battery': 0,
         'fridge': 1,
@@ -463,46 +665,51 @@ class DbusTempSensor(VeDbusService):
         'water heater': 5,
         'freezer': 6
     }
+    TEMPERATURE_TYPE_NAMES = {num: name for name, num in TEMPERATURE_TYPES.items()} # Reverse mapping for saving /TemperatureType
+
+    # Read-only paths whose initial value does not depend on the device config
+    _STATIC_PATHS = (
+        ('/Mgmt/ProcessName', 'dbus-victron-virtual'),
+        ('/Mgmt/ProcessVersion', '0.1.19'),
+        ('/Mgmt/Connection', 'Virtual'),
+        ('/ProductId', 49248), # Product ID for virtual temperature sensor
+        ('/ProductName', 'Virtual temperature'),
+        ('/Status', 0), # 0 for OK
+        ('/Connected', 1),
+        ('/Temperature', 0.0),
+    )
 
     def __init__(self, service_name, device_config, serial_number, mqtt_client, bus):
         # Pass the bus instance to the parent constructor
         super().__init__(service_name, bus=bus, register=False)
 
-        self.device_config = device_config
         self.device_index = device_config.getint('DeviceIndex')
         self.service_name = service_name # Store service_name for logging
 
         # General device settings
-        self.add_path('/Mgmt/ProcessName', 'dbus-victron-virtual')
-        self.add_path('/Mgmt/ProcessVersion', '0.1.19')
-        self.add_path('/Mgmt/Connection', 'Virtual')
-        
-        self.add_path('/DeviceInstance', self.device_config.getint('DeviceInstance'))
-        self.add_path('/ProductId', 49248) # Product ID for virtual temperature sensor
-        self.add_path('/ProductName', 'Virtual temperature') # Fixed product name
-        self.add_path('/CustomName', self.device_config.get('CustomName'), writeable=True, onchangecallback=self.handle_dbus_change)
-        self.add_path('/Serial', serial_number)
-        
-        self.add_path('/Status', 0) # 0 for OK
-        self.add_path('/Connected', 1) # 1 for connected
+        for path, initial_value in self._STATIC_PATHS:
+            self.add_path(path, initial_value)
 
-        # Temperature specific paths
-        self.add_path('/Temperature', 0.0) # Initial temperature
+        self.add_path('/DeviceInstance', device_config.getint('DeviceInstance'))
+        self.custom_name = device_config.get('CustomName') # Cached for log messages on the MQTT path
+        self.add_path('/CustomName', self.custom_name, writeable=True, onchangecallback=self.handle_dbus_change)
+        self.add_path('/Serial', serial_number)
         
         def is_valid_topic(topic):
             return topic is not None and topic != '' and 'path/to/mqtt' not in topic
 
         # Conditionally add battery and humidity paths based on valid topics
-        battery_topic = self.device_config.get('BatteryStateTopic')
+        temperature_topic = device_config.get('TemperatureStateTopic')
+        battery_topic = device_config.get('BatteryStateTopic')
         if is_valid_topic(battery_topic):
             self.add_path('/BatteryVoltage', 0.0) # Initial BatteryVoltage
 
-        humidity_topic = self.device_config.get('HumidityStateTopic')
+        humidity_topic = device_config.get('HumidityStateTopic')
         if is_valid_topic(humidity_topic):
             self.add_path('/Humidity', 0.0) # Initial Humidity
 
         # TemperatureType mapping and D-Bus path
-        initial_type_str = self.device_config.get('Type', 'generic').lower()
+        initial_type_str = device_config.get('Type', 'generic').lower()
         initial_type_int = self.TEMPERATURE_TYPES.get(initial_type_str, self.TEMPERATURE_TYPES['generic'])
         self.add_path('/TemperatureType', initial_type_int, writeable=True, onchangecallback=self.handle_dbus_change)
 
@@ -510,9 +717,9 @@ class DbusTempSensor(VeDbusService):
         self.mqtt_client = mqtt_client
         
         self.dbus_path_to_state_topic_map = {
-            '/Temperature': self.device_config.get('TemperatureStateTopic'),
-            '/Humidity': self.device_config.get('HumidityStateTopic'),
-            '/BatteryVoltage': self.device_config.get('BatteryStateTopic')
+            '/Temperature': temperature_topic,
+            '/Humidity': humidity_topic,
+            '/BatteryVoltage': battery_topic
         }
 
         # Remove None, empty, or 'path/to/mqtt' values from the map
@@ -521,9 +728,13 @@ class DbusTempSensor(VeDbusService):
             if v is not None and v != '' and 'path/to/mqtt' not in v
         }
 
-        self.mqtt_subscriptions = set(self.dbus_path_to_state_topic_map.values()) # Store topics this instance cares about
+        # Topic -> D-Bus path for incoming messages (reversed so the first path wins if two share a topic)
+        self.state_topic_to_dbus_path = {topic: path for path, topic in reversed(self.dbus_path_to_state_topic_map.items())}
+        self.mqtt_subscriptions = frozenset(self.state_topic_to_dbus_path) # Topics this instance cares about
+        # Last value handed to D-Bus per MQTT-driven path, so repeated values are dropped without reading D-Bus
+        self._last_values = {path: self[path] for path in self.dbus_path_to_state_topic_map}
         for topic in self.mqtt_subscriptions:
-            logger.debug(f"DbusTempSensor '{self['/CustomName']}' will subscribe to topic: {topic}")
+            logger.debug(f"DbusTempSensor '{self.custom_name}' will subscribe to topic: {topic}")
 
         # --- Added for Time-Delayed Fault ---
         self.max_inactivity_seconds = 300 # 5 minutes
@@ -533,7 +744,7 @@ class DbusTempSensor(VeDbusService):
 
         self.register() # Register D-Bus paths
 
-        logger.info(f"Service '{service_name}' for device '{self['/CustomName']}' registered on D-Bus.")
+        logger.info(f"Service '{service_name}' for device '{self.custom_name}' registered on D-Bus.")
 
     def _check_for_timeout(self):
         elapsed = time.time() - self.last_valid_update_time
@@ -541,7 +752,7 @@ class DbusTempSensor(VeDbusService):
         # Check for timeout and if the status is currently OK (0)
         if elapsed > self.max_inactivity_seconds and self['/Status'] == 0:
             logger.warning(
-                f"DbusTempSensor: No valid data received for {self['/CustomName']} "
+                f"DbusTempSensor: No valid data received for {self.custom_name} "
                 f"in {elapsed:.0f} seconds. Setting /Status to 1 (Error)."
             )
             GLib.idle_add(self.update_dbus_from_mqtt, '/Status', 1)
@@ -550,82 +761,79 @@ class DbusTempSensor(VeDbusService):
 
     # Specific message handler for this temp sensor
     def on_mqtt_message_specific(self, client, userdata, msg):
-        if msg.topic not in self.mqtt_subscriptions:
-            return # Not for this instance
-
-        logger.debug(f"DbusTempSensor specific MQTT callback triggered for {self['/CustomName']} on topic '{msg.topic}'")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"DbusTempSensor specific MQTT callback triggered for {self.custom_name} on topic '{msg.topic}'")
         try:
-            payload_str = msg.payload.decode().strip()
+            payload = msg.payload.strip() # bytes; decoded only for log messages
             topic = msg.topic
-            dbus_path = next((k for k, v in self.dbus_path_to_state_topic_map.items() if v == topic), None)
+            dbus_path = self.state_topic_to_dbus_path.get(topic)
             
             if not dbus_path:
-                logger.debug(f"DbusTempSensor: Received message on non-matching topic '{msg.topic}'. Not mapped for this sensor.")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"DbusTempSensor: Received message on non-matching topic '{msg.topic}'. Not mapped for this sensor.")
                 return
 
             value = None
-            try:
-                # Attempt JSON parsing
-                incoming_json = json.loads(payload_str)
+            # The first byte tells JSON from a plain number, so neither path has to fail first
+            if payload.startswith((b'{', b'[')):
+                try:
+                    incoming_json = json_loads(payload)
+                except json.JSONDecodeError:
+                    # Invalid payload, but DO NOT update the timer or status. Just warn and exit.
+                    logger.warning(f"DbusTempSensor: Payload '{payload.decode(errors='replace')}' for topic '{topic}' is not valid float or JSON.")
+                    return # Exit on parsing error
                 if isinstance(incoming_json, dict) and "value" in incoming_json:
-                    value = float(incoming_json["value"])
+                    try:
+                        value = float(incoming_json["value"])
+                    except (TypeError, ValueError):
+                        # Bad content, not a bug: warn without a traceback
+                        logger.warning(f"DbusTempSensor: JSON 'value' for topic '{topic}' is not a number. Ignoring message.")
+                        return
                 else:
                     logger.warning(f"DbusTempSensor: JSON payload for topic '{topic}' does not contain 'value' key or is not a dict. Ignoring message.")
                     return # Exit on bad JSON structure
-            except json.JSONDecodeError:
-                # Attempt float parsing
+            else:
                 try:
-                    value = float(payload_str)
+                    value = float(payload)
                 except ValueError:
                     # Invalid payload, but DO NOT update the timer or status. Just warn and exit.
-                    logger.warning(f"DbusTempSensor: Payload '{payload_str}' for topic '{topic}' is not valid float or JSON.")
+                    logger.warning(f"DbusTempSensor: Payload '{payload.decode(errors='replace')}' for topic '{topic}' is not valid float or JSON.")
                     return # Exit on parsing error
             
             if value is None: 
-                logger.warning(f"DbusTempSensor: Could not extract valid numerical value from payload '{payload_str}' for topic '{topic}'. Ignoring message.")
+                logger.warning(f"DbusTempSensor: Could not extract valid numerical value from payload '{payload.decode(errors='replace')}' for topic '{topic}'. Ignoring message.")
                 return
             
             # --- Timer Management: Only on successful value extraction ---
             self.last_valid_update_time = time.time()
             if self['/Status'] != 0:
-                GLib.idle_add(self.update_dbus_from_mqtt, '/Status', 0)
+                queue_dbus_update(self, '/Status', 0)
             # -----------------------------------------------------------
             
-            if self[dbus_path] != value:
-                logger.debug(f"DbusTempSensor: Updating D-Bus path '{dbus_path}' to {value} for '{self['/CustomName']}'.")
-                GLib.idle_add(self.update_dbus_from_mqtt, dbus_path, value)
+            if self._last_values[dbus_path] != value:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"DbusTempSensor: Updating D-Bus path '{dbus_path}' to {value} for '{self.custom_name}'.")
+                self._last_values[dbus_path] = value
+                queue_dbus_update(self, dbus_path, value)
             else:
-                logger.debug(f"DbusTempSensor: D-Bus path '{dbus_path}' already {value}. No update needed.")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"DbusTempSensor: D-Bus path '{dbus_path}' already {value}. No update needed.")
 
         except Exception as e:
-            logger.error(f"Error processing MQTT message for TempSensor {self.service_name} on topic {msg.topic}: {e}")
-            traceback.print_exc()
+            logger.error(f"Error processing MQTT message for TempSensor {self.service_name} on topic {msg.topic}: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
             
     def handle_dbus_change(self, path, value):
         section_name = f'Temp_Sensor_{self.device_index}'
         if path == '/CustomName':
-            self.save_config_change(section_name, 'CustomName', value)
+            self.custom_name = value
+            save_config_change(section_name, 'CustomName', value)
             return True
         elif path == '/TemperatureType':
-            type_str = next((k for k, v in self.TEMPERATURE_TYPES.items() if v == value), 'generic')
-            self.save_config_change(section_name, 'Type', type_str)
+            type_str = self.TEMPERATURE_TYPE_NAMES.get(value, 'generic')
+            save_config_change(section_name, 'Type', type_str)
             return True
         return False
 
-    def save_config_change(self, section, key, value):
-        config = configparser.ConfigParser()
-        try:
-            config.read(CONFIG_FILE_PATH)
-            if not config.has_section(section):
-                config.add_section(section)
-            config.set(section, key, str(value))
-            with open(CONFIG_FILE_PATH, 'w') as configfile:
-                config.write(configfile)
-            logger.debug(f"Saved config: Section=[{section}], Key='{key}', Value='{value}'")
-        except Exception as e:
-            logger.error(f"Failed to save config file changes for TempSensor key '{key}': {e}")
-            traceback.print_exc()
-
     def update_dbus_from_mqtt(self, path, value):
         self[path] = value
         return False
@@ -634,47 +842,64 @@ class DbusTempSensor(VeDbusService):
 # DbusTankSensor Class
 # ====================================================================
 class DbusTankSensor(VeDbusService):
+    # Fixed per-instance fields, kept out of the instance __dict__ (VeDbusService still has one for its own state)
+    __slots__ = (
+        'service_name', 'device_index', 'custom_name', 'mqtt_client',
+        'dbus_path_to_state_topic_map', 'state_topic_to_dbus_path', 'mqtt_subscriptions', '_last_values',
+        'max_inactivity_seconds', 'last_valid_update_time', 'is_level_direct', '_capacity', '_raw_empty', '_raw_full'
+    )
+
     FLUID_TYPES = {
         'fuel': 0, 'fresh water': 1, 'waste water': 2, 'live well': 3, 'oil': 4,
         'black water': 5, 'gasoline': 6, 'diesel': 7, 'lpg': 8, 'lng': 9,
         'hydraulic oil': 10, 'raw water': 11
     }
+    FLUID_TYPE_NAMES = {num: name for name, num in FLUID_TYPES.items()} # Reverse mapping for saving /FluidType
+
+    # Read-only paths whose initial value does not depend on the device config
+    _STATIC_PATHS = (
+        ('/Mgmt/ProcessName', 'dbus-victron-virtual'),
+        ('/Mgmt/ProcessVersion', '0.1.19'),
+        ('/Mgmt/Connection', 'Virtual'),
+        ('/ProductId', 49251),
+        ('/ProductName', 'Virtual tank'),
+        ('/Status', 0),
+        ('/Connected', 1),
+        ('/Level', 0.0),
+        ('/Remaining', 0.0),
+        ('/RawValue', 0.0),
+        ('/Shape', 0), # Not yet implemented via MQTT
+    )
 
     def __init__(self, service_name, device_config, serial_number, mqtt_client, bus):
         # Pass the bus instance to the parent constructor
         super().__init__(service_name, bus=bus, register=False)
-        self.device_config = device_config
         self.device_index = device_config.getint('DeviceIndex')
         self.service_name = service_name # Store service_name for logging
 
-        self.add_path('/Mgmt/ProcessName', 'dbus-victron-virtual')
-        self.add_path('/Mgmt/ProcessVersion', '0.1.19')
-        self.add_path('/Mgmt/Connection', 'Virtual')
-        
-        self.add_path('/DeviceInstance', self.device_config.getint('DeviceInstance'))
-        self.add_path('/ProductId', 49251)
-        self.add_path('/ProductName', 'Virtual tank')
-        self.add_path('/CustomName', self.device_config.get('CustomName'), writeable=True, onchangecallback=self.handle_dbus_change)
+        for path, initial_value in self._STATIC_PATHS:
+            self.add_path(path, initial_value)
+
+        self.add_path('/DeviceInstance', device_config.getint('DeviceInstance'))
+        self.custom_name = device_config.get('CustomName') # Cached for log messages on the MQTT path
+        self.add_path('/CustomName', self.custom_name, writeable=True, onchangecallback=self.handle_dbus_change)
         self.add_path('/Serial', serial_number)
-        
-        self.add_path('/Status', 0)
-        self.add_path('/Connected', 1)
 
-        self.add_path('/Capacity', self.device_config.getfloat('Capacity', 0.2), writeable=True, onchangecallback=self.handle_dbus_change)
+        self._capacity = device_config.getfloat('Capacity', 0.2) # Mirrors /Capacity like the calibration endpoints below
+        self.add_path('/Capacity', self._capacity, writeable=True, onchangecallback=self.handle_dbus_change)
         
-        initial_fluid_type_str = self.device_config.get('FluidType', 'fresh water').lower()
+        initial_fluid_type_str = device_config.get('FluidType', 'fresh water').lower()
         initial_fluid_type_int = self.FLUID_TYPES.get(initial_fluid_type_str, self.FLUID_TYPES['fresh water'])
         self.add_path('/FluidType', initial_fluid_type_int, writeable=True, onchangecallback=self.handle_dbus_change)
         
-        self.add_path('/Level', 0.0)
-        self.add_path('/Remaining', 0.0)
-        self.add_path('/RawValue', 0.0)
-        self.add_path('/RawValueEmpty', self.device_config.getfloat('RawValueEmpty', 0.0), writeable=True, onchangecallback=self.handle_dbus_change)
-        self.add_path('/RawValueFull', self.device_config.getfloat('RawValueFull', 0.0), writeable=True, onchangecallback=self.handle_dbus_change)
+        # Calibration endpoints are mirrored in attributes so level calculations don't read them back from D-Bus
+        self._raw_empty = device_config.getfloat('RawValueEmpty', 0.0)
+        self._raw_full = device_config.getfloat('RawValueFull', 0.0)
+        self.add_path('/RawValueEmpty', self._raw_empty, writeable=True, onchangecallback=self.handle_dbus_change)
+        self.add_path('/RawValueFull', self._raw_full, writeable=True, onchangecallback=self.handle_dbus_change)
         
         # Other paths not yet implemented via MQTT
-        self.add_path('/RawUnit', self.device_config.get('RawUnit', ''))
-        self.add_path('/Shape', 0)
+        self.add_path('/RawUnit', device_config.get('RawUnit', ''))
 
         # Use the global MQTT client passed in
         self.mqtt_client = mqtt_client
@@ -685,35 +910,39 @@ class DbusTankSensor(VeDbusService):
         def is_valid_topic(topic):
             return topic and 'path/to/mqtt' not in topic
 
-        level_topic = self.device_config.get('LevelStateTopic')
-        raw_topic = self.device_config.get('RawValueStateTopic')
+        level_topic = device_config.get('LevelStateTopic')
+        raw_topic = device_config.get('RawValueStateTopic')
 
         if is_valid_topic(raw_topic):
             self.dbus_path_to_state_topic_map['/RawValue'] = raw_topic
-            logger.debug(f"Tank '{self['/CustomName']}' will use RawValue topic: {raw_topic}")
+            logger.debug(f"Tank '{self.custom_name}' will use RawValue topic: {raw_topic}")
         elif is_valid_topic(level_topic):
             self.is_level_direct = True
             self.dbus_path_to_state_topic_map['/Level'] = level_topic
-            logger.debug(f"Tank '{self['/CustomName']}' will use direct Level topic: {level_topic}")
+            logger.debug(f"Tank '{self.custom_name}' will use direct Level topic: {level_topic}")
         else:
-            logger.warning(f"Tank '{self['/CustomName']}': Neither RawValueStateTopic nor LevelStateTopic are valid. Tank level will not update from MQTT.")
+            logger.warning(f"Tank '{self.custom_name}': Neither RawValueStateTopic nor LevelStateTopic are valid. Tank level will not update from MQTT.")
         
         # Add other topics if they exist and create their D-Bus paths
-        temp_topic = self.device_config.get('TemperatureStateTopic')
+        temp_topic = device_config.get('TemperatureStateTopic')
         if is_valid_topic(temp_topic):
             self.add_path('/Temperature', 0.0)
             self.dbus_path_to_state_topic_map['/Temperature'] = temp_topic
-            logger.debug(f"Tank '{self['/CustomName']}' also subscribing to Temperature topic: {temp_topic}")
+            logger.debug(f"Tank '{self.custom_name}' also subscribing to Temperature topic: {temp_topic}")
         
-        battery_topic = self.device_config.get('BatteryStateTopic')
+        battery_topic = device_config.get('BatteryStateTopic')
         if is_valid_topic(battery_topic):
             self.add_path('/BatteryVoltage', 0.0)
             self.dbus_path_to_state_topic_map['/BatteryVoltage'] = battery_topic
-            logger.debug(f"Tank '{self['/CustomName']}' also subscribing to BatteryVoltage topic: {battery_topic}")
+            logger.debug(f"Tank '{self.custom_name}' also subscribing to BatteryVoltage topic: {battery_topic}")
 
-        self.mqtt_subscriptions = set(self.dbus_path_to_state_topic_map.values()) # Store topics this instance cares about
+        # Topic -> D-Bus path for incoming messages (reversed so the first path wins if two share a topic)
+        self.state_topic_to_dbus_path = {topic: path for path, topic in reversed(self.dbus_path_to_state_topic_map.items())}
+        self.mqtt_subscriptions = frozenset(self.state_topic_to_dbus_path) # Topics this instance cares about
+        # Last value handed to D-Bus per MQTT-driven path, so repeated values are dropped without reading D-Bus
+        self._last_values = {path: self[path] for path in self.dbus_path_to_state_topic_map}
         for topic in self.mqtt_subscriptions:
-            logger.debug(f"DbusTankSensor '{self['/CustomName']}' will subscribe to topic: {topic}")
+            logger.debug(f"DbusTankSensor '{self.custom_name}' will subscribe to topic: {topic}")
 
         # --- Added for Time-Delayed Fault ---
         self.max_inactivity_seconds = 300 # 5 minutes
@@ -723,12 +952,13 @@ class DbusTankSensor(VeDbusService):
 
         self.register() # Register D-Bus paths
 
-        logger.info(f"Service '{service_name}' for device '{self['/CustomName']}' registered on D-Bus.") 
+        logger.info(f"Service '{service_name}' for device '{self.custom_name}' registered on D-Bus.") 
 
         # Initial calculations
         if not self.is_level_direct:
-            self._calculate_level_from_raw_value()
-        self._calculate_remaining_from_level()
+            self._recalculate_level_and_remaining()
+        else:
+            self._calculate_remaining_from_level()
 
     def _check_for_timeout(self):
         elapsed = time.time() - self.last_valid_update_time
@@ -736,7 +966,7 @@ class DbusTankSensor(VeDbusService):
         # Check for timeout and if the status is currently OK (0)
         if elapsed > self.max_inactivity_seconds and self['/Status'] == 0:
             logger.warning(
-                f"DbusTankSensor: No valid data received for {self['/CustomName']} "
+                f"DbusTankSensor: No valid data received for {self.custom_name} "
                 f"in {elapsed:.0f} seconds. Setting /Status to 1 (Error)."
             )
             GLib.idle_add(self.update_dbus_from_mqtt, '/Status', 1)
@@ -745,38 +975,46 @@ class DbusTankSensor(VeDbusService):
 
     # Specific message handler for this tank sensor
     def on_mqtt_message_specific(self, client, userdata, msg):
-        if msg.topic not in self.mqtt_subscriptions:
-            return # Not for this instance
-
-        logger.debug(f"DbusTankSensor specific MQTT callback triggered for {self['/CustomName']} on topic '{msg.topic}'")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"DbusTankSensor specific MQTT callback triggered for {self.custom_name} on topic '{msg.topic}'")
         try:
-            payload_str = msg.payload.decode().strip()
+            payload = msg.payload.strip() # bytes; decoded only for log messages
             topic = msg.topic
-            dbus_path = next((k for k, v in self.dbus_path_to_state_topic_map.items() if v == topic), None)
+            dbus_path = self.state_topic_to_dbus_path.get(topic)
             if not dbus_path: 
-                logger.debug(f"DbusTankSensor: Received message on non-matching topic '{msg.topic}'. Not mapped for this sensor.")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"DbusTankSensor: Received message on non-matching topic '{msg.topic}'. Not mapped for this sensor.")
                 return
 
             value = None
-            try:
-                # Attempt JSON parsing
-                incoming_json = json.loads(payload_str)
+            # The first byte tells JSON from a plain number, so neither path has to fail first
+            if payload.startswith((b'{', b'[')):
+                try:
+                    incoming_json = json_loads(payload)
+                except json.JSONDecodeError:
+                    # Invalid payload, but DO NOT update the timer or status. Just warn and exit.
+                    logger.warning(f"DbusTankSensor: Payload '{payload.decode(errors='replace')}' for topic '{topic}' is not valid float or JSON.")
+                    return # Exit on parsing error
                 if isinstance(incoming_json, dict) and "value" in incoming_json:
-                    value = float(incoming_json["value"])
+                    try:
+                        value = float(incoming_json["value"])
+                    except (TypeError, ValueError):
+                        # Bad content, not a bug: warn without a traceback
+                        logger.warning(f"DbusTankSensor: JSON 'value' for topic '{topic}' is not a number. Ignoring message.")
+                        return
                 else:
                     logger.warning(f"DbusTankSensor: JSON payload for topic '{topic}' does not contain 'value' key or is not a dict. Ignoring message.")
                     return # Exit on bad JSON structure
-            except json.JSONDecodeError:
-                # Attempt float parsing
-                try: 
-                    value = float(payload_str)
-                except ValueError: 
+            else:
+                try:
+                    value = float(payload)
+                except ValueError:
                     # Invalid payload, but DO NOT update the timer or status. Just warn and exit.
-                    logger.warning(f"DbusTankSensor: Payload '{payload_str}' for topic '{topic}' is not valid float or JSON.")
+                    logger.warning(f"DbusTankSensor: Payload '{payload.decode(errors='replace')}' for topic '{topic}' is not valid float or JSON.")
                     return # Exit on parsing error
             
             if value is None: 
-                logger.warning(f"DbusTankSensor: Could not extract valid numerical value from payload '{payload_str}' for topic '{topic}'. Ignoring message.")
+                logger.warning(f"DbusTankSensor: Could not extract valid numerical value from payload '{payload.decode(errors='replace')}' for topic '{topic}'. Ignoring message.")
                 return
 
             # --- New: Update the last valid update time on success ---
@@ -784,32 +1022,39 @@ class DbusTankSensor(VeDbusService):
             # -----------------------------------------------------------
             
             if dbus_path == '/RawValue' and not self.is_level_direct:
-                if self['/RawValue'] != value:
-                    logger.debug(f"DbusTankSensor: Updating /RawValue to {value} and recalculating for '{self['/CustomName']}'.")
-                    GLib.idle_add(self._update_raw_value_and_recalculate, value)
+                if self._last_values['/RawValue'] != value:
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(f"DbusTankSensor: Updating /RawValue to {value} and recalculating for '{self.custom_name}'.")
+                    self._last_values['/RawValue'] = value
+                    queue_dbus_update(self, '/RawValue', value)
                 else:
-                    logger.debug(f"DbusTankSensor: /RawValue already {value}. No update needed.")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(f"DbusTankSensor: /RawValue already {value}. No update needed.")
             elif dbus_path == '/Level' and self.is_level_direct:
-                if 0.0 <= value <= 100.0 and self['/Level'] != round(value, 2):
-                    logger.debug(f"DbusTankSensor: Updating /Level to {value} and recalculating for '{self['/CustomName']}'.")
-                    GLib.idle_add(self._update_level_and_recalculate, value)
+                if 0.0 <= value <= 100.0 and self._last_values['/Level'] != round(value, 2):
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(f"DbusTankSensor: Updating /Level to {value} and recalculating for '{self.custom_name}'.")
+                    self._last_values['/Level'] = round(value, 2)
+                    queue_dbus_update(self, '/Level', value)
                 else:
-                    logger.debug(f"DbusTankSensor: /Level already {value} or value out of range. No update needed.")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(f"DbusTankSensor: /Level already {value} or value out of range. No update needed.")
             else: # For /Temperature or /BatteryVoltage
-                if self[dbus_path] != value:
-                    logger.debug(f"DbusTankSensor: Updating D-Bus path '{dbus_path}' to {value} for '{self['/CustomName']}'.")
-                    GLib.idle_add(self.update_dbus_from_mqtt, dbus_path, value)
+                if self._last_values[dbus_path] != value:
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(f"DbusTankSensor: Updating D-Bus path '{dbus_path}' to {value} for '{self.custom_name}'.")
+                    self._last_values[dbus_path] = value
+                    queue_dbus_update(self, dbus_path, value)
                 else:
-                    logger.debug(f"DbusTankSensor: D-Bus path '{dbus_path}' already {value}. No update needed.")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(f"DbusTankSensor: D-Bus path '{dbus_path}' already {value}. No update needed.")
 
         except Exception as e:
-            logger.error(f"Error processing MQTT message for Tank {self.service_name} on topic {msg.topic}: {e}")
-            traceback.print_exc()
+            logger.error(f"Error processing MQTT message for Tank {self.service_name} on topic {msg.topic}: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
 
     def _update_raw_value_and_recalculate(self, raw_value):
         self['/RawValue'] = raw_value
-        self._calculate_level_from_raw_value()
-        self._calculate_remaining_from_level()
+        self._recalculate_level_and_remaining()
         # --- New: Reset Status ---
         if self['/Status'] != 0: self['/Status'] = 0
         return False
@@ -822,21 +1067,21 @@ class DbusTankSensor(VeDbusService):
             if self['/Status'] != 0: self['/Status'] = 0
         return False
 
-    def _calculate_level_from_raw_value(self):
-        raw_value = self['/RawValue']
-        raw_empty = self['/RawValueEmpty']
-        raw_full = self['/RawValueFull']
-        level = 0.0
-        if raw_full != raw_empty:
-            level = ((raw_value - raw_empty) / (raw_full - raw_empty)) * 100.0
-            level = max(0.0, min(100.0, level))
-        self['/Level'] = round(level, 2)
-        logger.debug(f"Tank '{self['/CustomName']}' calculated Level: {self['/Level']}")
+    def _recalculate_level_and_remaining(self):
+        # Level and Remaining computed in one pass, without reading the new Level back from D-Bus
+        level = tank_level_from_raw(self['/RawValue'], self._raw_empty, self._raw_full)
+        remaining = tank_remaining_from_level(level, self._capacity)
+        self['/Level'] = level
+        self['/Remaining'] = remaining
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Tank '{self.custom_name}' calculated Level: {level}, Remaining: {remaining}")
+        return False # Run only once when scheduled with GLib.idle_add
 
     def _calculate_remaining_from_level(self):
-        remaining = (self['/Level'] / 100.0) * self['/Capacity']
-        self['/Remaining'] = round(remaining, 2)
-        logger.debug(f"Tank '{self['/CustomName']}' calculated Remaining: {self['/Remaining']}")
+        remaining = tank_remaining_from_level(self['/Level'], self._capacity)
+        self['/Remaining'] = remaining
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Tank '{self.custom_name}' calculated Remaining: {remaining}")
 
 
     def handle_dbus_change(self, path, value):
@@ -846,33 +1091,32 @@ class DbusTankSensor(VeDbusService):
         value_to_save = value
         if key_name == 'FluidType':
             # Convert integer back to string for saving to config
-            value_to_save = next((k for k, v in self.FLUID_TYPES.items() if v == value), 'fresh water')
+            value_to_save = self.FLUID_TYPE_NAMES.get(value, 'fresh water')
             logger.debug(f"Tank: Converting FluidType {value} to string '{value_to_save}' for saving.")
+        elif path == '/CustomName':
+            self.custom_name = value
+        elif path == '/RawValueEmpty':
+            self._raw_empty = float(value)
+        elif path == '/RawValueFull':
+            self._raw_full = float(value)
+        elif path == '/Capacity':
+            self._capacity = float(value)
 
-        self.save_config_change(section_name, key_name, value_to_save)
+        save_config_change(section_name, key_name, value_to_save)
 
         if path in ['/RawValueEmpty', '/RawValueFull'] and not self.is_level_direct:
-            GLib.idle_add(self._calculate_level_from_raw_value)
-            GLib.idle_add(self._calculate_remaining_from_level)
+            GLib.idle_add(self._recalculate_level_and_remaining)
         elif path == '/Capacity': # Capacity also affects Remaining
             GLib.idle_add(self._calculate_remaining_from_level)
         
         return True
 
-    def save_config_change(self, section, key, value):
-        config = configparser.ConfigParser()
-        try:
-            config.read(CONFIG_FILE_PATH)
-            if not config.has_section(section): config.add_section(section)
-            config.set(section, key, str(value))
-            with open(CONFIG_FILE_PATH, 'w') as f:
-                config.write(f)
-            logger.debug(f"Saved config: Section=[{section}], Key='{key}', Value='{value}'")
-        except Exception as e:
-            logger.error(f"Failed to save config change for Tank: {e}")
-            traceback.print_exc()
-
     def update_dbus_from_mqtt(self, path, value):
+        # RawValue and Level also recalculate the paths derived from them (and reset /Status themselves)
+        if path == '/RawValue':
+            return self._update_raw_value_and_recalculate(value)
+        if path == '/Level':
+            return self._update_level_and_recalculate(value)
         self[path] = value
         # --- New: Reset Status for other paths (/Temperature, /BatteryVoltage) ---
         if path != '/Status' and self['/Status'] != 0:
@@ -883,129 +1127,142 @@ class DbusTankSensor(VeDbusService):
 # DbusBattery Class
 # ====================================================================
 class DbusBattery(VeDbusService):
+    # Fixed per-instance fields, kept out of the instance __dict__ (VeDbusService still has one for its own state)
+    __slots__ = (
+        'service_name', 'device_index', 'custom_name', 'mqtt_client',
+        'dbus_path_to_state_topic_map', 'state_topic_to_dbus_path', 'mqtt_subscriptions', '_last_values'
+    )
+
+    # Read-only paths whose initial value does not depend on the device config
+    _STATIC_PATHS = (
+        ('/Mgmt/ProcessName', 'dbus-victron-virtual'),
+        ('/Mgmt/ProcessVersion', '0.1.19'),
+        ('/Mgmt/Connection', 'Virtual'),
+        ('/ProductId', 49253),
+        ('/ProductName', 'Virtual battery'),
+        ('/Connected', 1),
+        ('/Soc', 0.0),
+        ('/Dc/0/Current', 0.0),
+        ('/Dc/0/Power', 0.0),
+        ('/Dc/0/Voltage', 0.0),
+        ('/ErrorCode', 0),
+    )
+    # Paths only added when a state topic is configured for them, like the optional sensor paths
+    _OPTIONAL_PATHS = (
+        ('/Soh', 0.0),
+        ('/Dc/0/Temperature', 0.0),
+        ('/Info/MaxChargeCurrent', 0),
+        ('/Info/MaxDischargeCurrent', 0),
+        ('/Info/MaxChargeVoltage', 0.),
+    )
+
     def __init__(self, service_name, device_config, serial_number, mqtt_client, bus):
         # Pass the bus instance to the parent constructor
         super().__init__(service_name, bus=bus, register=False)
-        self.device_config = device_config
         self.device_index = device_config.getint('DeviceIndex')
         self.service_name = service_name # Store service_name for logging
 
-        self.add_path('/Mgmt/ProcessName', 'dbus-victron-virtual')
-        self.add_path('/Mgmt/ProcessVersion', '0.1.19')
-        self.add_path('/Mgmt/Connection', 'Virtual')
-        
-        self.add_path('/DeviceInstance', self.device_config.getint('DeviceInstance'))
-        self.add_path('/ProductId', 49253)
-        self.add_path('/ProductName', 'Virtual battery')
-        self.add_path('/CustomName', self.device_config.get('CustomName'), writeable=True, onchangecallback=self.handle_dbus_change)
+        for path, initial_value in self._STATIC_PATHS:
+            self.add_path(path, initial_value)
+
+        self.add_path('/DeviceInstance', device_config.getint('DeviceInstance'))
+        self.custom_name = device_config.get('CustomName') # Cached for log messages on the MQTT path
+        self.add_path('/CustomName', self.custom_name, writeable=True, onchangecallback=self.handle_dbus_change)
         self.add_path('/Serial', serial_number)
-        
-        self.add_path('/Connected', 1)
-        self.add_path('/Soc', 0.0)
-        self.add_path('/Soh', 0.0)
-        self.add_path('/Capacity', self.device_config.getfloat('CapacityAh'), writeable=True, onchangecallback=self.handle_dbus_change)
-        self.add_path('/Dc/0/Current', 0.0)
-        self.add_path('/Dc/0/Power', 0.0)
-        self.add_path('/Dc/0/Temperature', 0.0)
-        self.add_path('/Dc/0/Voltage', 0.0)
-        
-        # Other paths
-        self.add_path('/ErrorCode', 0)
-        self.add_path('/Info/MaxChargeCurrent', 0)
-        self.add_path('/Info/MaxDischargeCurrent', 0)
-        self.add_path('/Info/MaxChargeVoltage', 0.)
+        self.add_path('/Capacity', device_config.getfloat('CapacityAh'), writeable=True, onchangecallback=self.handle_dbus_change)
 
         # Use the global MQTT client passed in
         self.mqtt_client = mqtt_client
         
         self.dbus_path_to_state_topic_map = {
-            '/Dc/0/Current': self.device_config.get('CurrentStateTopic'),
-            '/Dc/0/Power': self.device_config.get('PowerStateTopic'),
-            '/Dc/0/Temperature': self.device_config.get('TemperatureStateTopic'),
-            '/Dc/0/Voltage': self.device_config.get('VoltageStateTopic'),
-            '/Soc': self.device_config.get('SocStateTopic'),
-            '/Soh': self.device_config.get('SohStateTopic'),
-            '/Info/MaxChargeCurrent': self.device_config.get('MaxChargeCurrentStateTopic'),
-            '/Info/MaxDischargeCurrent': self.device_config.get('MaxDischargeCurrentStateTopic'),
-            '/Info/MaxChargeVoltage': self.device_config.get('MaxChargeVoltageStateTopic'),
+            '/Dc/0/Current': device_config.get('CurrentStateTopic'),
+            '/Dc/0/Power': device_config.get('PowerStateTopic'),
+            '/Dc/0/Temperature': device_config.get('TemperatureStateTopic'),
+            '/Dc/0/Voltage': device_config.get('VoltageStateTopic'),
+            '/Soc': device_config.get('SocStateTopic'),
+            '/Soh': device_config.get('SohStateTopic'),
+            '/Info/MaxChargeCurrent': device_config.get('MaxChargeCurrentStateTopic'),
+            '/Info/MaxDischargeCurrent': device_config.get('MaxDischargeCurrentStateTopic'),
+            '/Info/MaxChargeVoltage': device_config.get('MaxChargeVoltageStateTopic'),
         }
         self.dbus_path_to_state_topic_map = {k: v for k, v in self.dbus_path_to_state_topic_map.items() if v and 'path/to/mqtt' not in v}
+        for path, initial_value in self._OPTIONAL_PATHS:
+            if path in self.dbus_path_to_state_topic_map:
+                self.add_path(path, initial_value)
         
-        self.mqtt_subscriptions = set(self.dbus_path_to_state_topic_map.values()) # Store topics this instance cares about
+        # Topic -> D-Bus path for incoming messages (reversed so the first path wins if two share a topic)
+        self.state_topic_to_dbus_path = {topic: path for path, topic in reversed(self.dbus_path_to_state_topic_map.items())}
+        self.mqtt_subscriptions = frozenset(self.state_topic_to_dbus_path) # Topics this instance cares about
+        # Last value handed to D-Bus per MQTT-driven path, so repeated values are dropped without reading D-Bus
+        self._last_values = {path: self[path] for path in self.dbus_path_to_state_topic_map}
         for topic in self.mqtt_subscriptions:
-            logger.debug(f"DbusBattery '{self['/CustomName']}' will subscribe to topic: {topic}")
+            logger.debug(f"DbusBattery '{self.custom_name}' will subscribe to topic: {topic}")
 
         self.register() # Register D-Bus paths
 
-        logger.info(f"Service '{service_name}' for device '{self['/CustomName']}' registered on D-Bus.")
+        logger.info(f"Service '{service_name}' for device '{self.custom_name}' registered on D-Bus.")
 
     # Specific message handler for this battery
     def on_mqtt_message_specific(self, client, userdata, msg):
-        if msg.topic not in self.mqtt_subscriptions:
-            return # Not for this instance
-
-        logger.debug(f"DbusBattery specific MQTT callback triggered for {self['/CustomName']} on topic '{msg.topic}'")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"DbusBattery specific MQTT callback triggered for {self.custom_name} on topic '{msg.topic}'")
         try:
-            payload_str = msg.payload.decode().strip()
+            payload = msg.payload.strip() # bytes; decoded only for log messages
             topic = msg.topic
-            dbus_path = next((k for k, v in self.dbus_path_to_state_topic_map.items() if v == topic), None)
+            dbus_path = self.state_topic_to_dbus_path.get(topic)
             if not dbus_path: 
-                logger.debug(f"DbusBattery: Received message on non-matching topic '{msg.topic}'. Not mapped for this battery.")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"DbusBattery: Received message on non-matching topic '{msg.topic}'. Not mapped for this battery.")
                 return
 
             value = None
-            try:
-                incoming_json = json.loads(payload_str)
+            # The first byte tells JSON from a plain number, so neither path has to fail first
+            if payload.startswith((b'{', b'[')):
+                try:
+                    incoming_json = json_loads(payload)
+                except json.JSONDecodeError:
+                    logger.warning(f"DbusBattery: Payload '{payload.decode(errors='replace')}' for topic '{topic}' is not valid float or JSON.")
+                    return
                 if isinstance(incoming_json, dict) and "value" in incoming_json:
                     value = incoming_json["value"]
                 else:
                     logger.warning(f"DbusBattery: JSON payload for topic '{topic}' does not contain 'value' key or is not a dict.")
                     return
-            except json.JSONDecodeError:
-                try: value = float(payload_str)
+            else:
+                try: value = float(payload)
                 except ValueError: 
-                    logger.warning(f"DbusBattery: Payload '{payload_str}' for topic '{topic}' is not valid float or JSON.")
+                    logger.warning(f"DbusBattery: Payload '{payload.decode(errors='replace')}' for topic '{topic}' is not valid float or JSON.")
                     return
             
             if value is None: 
-                logger.warning(f"DbusBattery: Could not extract valid numerical value from payload '{payload_str}' for topic '{topic}'.")
+                logger.warning(f"DbusBattery: Could not extract valid numerical value from payload '{payload.decode(errors='replace')}' for topic '{topic}'.")
                 return
             
             # Note: No time-delayed fault is implemented here. It still fails on a single bad payload.
             
-            if self[dbus_path] != value:
-                logger.debug(f"DbusBattery: Updating D-Bus path '{dbus_path}' to {value} for '{self['/CustomName']}'.")
-                GLib.idle_add(self.update_dbus_from_mqtt, dbus_path, value)
+            if self._last_values[dbus_path] != value:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"DbusBattery: Updating D-Bus path '{dbus_path}' to {value} for '{self.custom_name}'.")
+                self._last_values[dbus_path] = value
+                queue_dbus_update(self, dbus_path, value)
             else:
-                logger.debug(f"DbusBattery: D-Bus path '{dbus_path}' already {value}. No update needed.")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"DbusBattery: D-Bus path '{dbus_path}' already {value}. No update needed.")
             
         except Exception as e:
-            logger.error(f"Error processing MQTT message for Battery {self.service_name} on topic {msg.topic}: {e}")
-            traceback.print_exc()
+            logger.error(f"Error processing MQTT message for Battery {self.service_name} on topic {msg.topic}: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
 
     def handle_dbus_change(self, path, value):
         section_name = f'Virtual_Battery_{self.device_index}'
         if path == '/CustomName':
-            self.save_config_change(section_name, 'CustomName', value)
+            self.custom_name = value
+            save_config_change(section_name, 'CustomName', value)
             return True
         elif path == '/Capacity':
-            self.save_config_change(section_name, 'CapacityAh', value)
+            save_config_change(section_name, 'CapacityAh', value)
             return True
         return False
 
-    def save_config_change(self, section, key, value):
-        config = configparser.ConfigParser()
-        try:
-            config.read(CONFIG_FILE_PATH)
-            if not config.has_section(section): config.add_section(section)
-            config.set(section, key, str(value))
-            with open(CONFIG_FILE_PATH, 'w') as f:
-                config.write(f)
-            logger.debug(f"Saved config: Section=[{section}], Key='{key}', Value='{value}'")
-        except Exception as e:
-            logger.error(f"Failed to save config change for Battery: {e}")
-            traceback.print_exc()
-            
     def update_dbus_from_mqtt(self, path, value):
         self[path] = value
         return False
@@ -1014,9 +1271,29 @@ class DbusBattery(VeDbusService):
 # DbusPvCharger Class (NEW)
 # ====================================================================
 class DbusPvCharger(VeDbusService):
+    # Fixed per-instance fields, kept out of the instance __dict__ (VeDbusService still has one for its own state)
+    __slots__ = (
+        'service_name', 'device_index', 'custom_name', 'mqtt_client',
+        'dbus_path_to_state_topic_map', 'state_topic_to_dbus_path', 'mqtt_subscriptions', '_last_values'
+    )
+
+    # Lowercased state words accepted on the state topics, besides plain integers
+    STATE_WORDS = {
+        '/State': {b'off': 0, b'bulk': 3, b'absorption': 4, b'float': 5},
+        '/Load/State': {b'off': 0, b'on': 1},
+    }
+    # Paths only added when a state topic is configured for them; an unused /Load/State would make
+    # the GUI show a load output the charger doesn't have
+    _OPTIONAL_PATHS = (
+        ('/Link/ChargeVoltage', None),
+        ('/Link/ChargeCurrent', None),
+        ('/Load/State', None),
+        ('/Yield/User', 0.0),
+        ('/Yield/System', 0.0),
+    )
+
     def __init__(self, service_name, device_config, serial_number, mqtt_client, bus):
         super().__init__(service_name, bus=bus, register=False)
-        self.device_config = device_config
         self.device_index = device_config.getint('DeviceIndex')
         self.service_name = service_name
 
@@ -1024,10 +1301,11 @@ class DbusPvCharger(VeDbusService):
         self.add_path('/Mgmt/ProcessVersion', '0.0.1')
         self.add_path('/Mgmt/Connection', 'Virtual')
 
-        self.add_path('/DeviceInstance', self.device_config.getint('DeviceInstance'))
+        self.add_path('/DeviceInstance', device_config.getint('DeviceInstance'))
         self.add_path('/ProductId', 41318)
         self.add_path('/ProductName', 'Virtual MPPT')
-        self.add_path('/CustomName', self.device_config.get('CustomName'), writeable=True, onchangecallback=self.handle_dbus_change)
+        self.custom_name = device_config.get('CustomName') # Cached for log messages on the MQTT path
+        self.add_path('/CustomName', self.custom_name, writeable=True, onchangecallback=self.handle_dbus_change)
         self.add_path('/Serial', serial_number)
 
         self.add_path('/Connected', 1)
@@ -1036,121 +1314,105 @@ class DbusPvCharger(VeDbusService):
         self.add_path('/Dc/0/Current', 0.0)
         self.add_path('/Dc/0/Voltage', 0.0)
 
-        # Link Paths
-        self.add_path('/Link/ChargeVoltage', None)
-        self.add_path('/Link/ChargeCurrent', None)
-
-        # Load Path
-        self.add_path('/Load/State', None)
-        
         # Charger State
         self.add_path('/State', 0) # 0=Off, 3=Bulk, 4=Absorption, 5=Float
 
-        # PV Paths
+        # PV Paths (Link, Load and the yield totals are added below if they have a topic)
         self.add_path('/Pv/V', 0.0)
         self.add_path('/Yield/Power', 0.0)
-        self.add_path('/Yield/User', 0.0)
-        self.add_path('/Yield/System', 0.0)
         
         self.mqtt_client = mqtt_client
 
         self.dbus_path_to_state_topic_map = {
-            '/Dc/0/Current': self.device_config.get('BatteryCurrentStateTopic'),
-            '/Dc/0/Voltage': self.device_config.get('BatteryVoltageStateTopic'),
-            '/Link/ChargeVoltage': self.device_config.get('MaxChargeVoltageStateTopic'),
-            '/Link/ChargeCurrent': self.device_config.get('MaxChargeCurrentStateTopic'),
-            '/Load/State': self.device_config.get('LoadStateTopic'),
-            '/State': self.device_config.get('ChargerStateTopic'),
-            '/Pv/V': self.device_config.get('PvVoltageStateTopic'),
-            '/Yield/Power': self.device_config.get('PvPowerStateTopic'),
-            '/Yield/User': self.device_config.get('TotalYield'),
-            '/Yield/System': self.device_config.get('SystemYield')
+            '/Dc/0/Current': device_config.get('BatteryCurrentStateTopic'),
+            '/Dc/0/Voltage': device_config.get('BatteryVoltageStateTopic'),
+            '/Link/ChargeVoltage': device_config.get('MaxChargeVoltageStateTopic'),
+            '/Link/ChargeCurrent': device_config.get('MaxChargeCurrentStateTopic'),
+            '/Load/State': device_config.get('LoadStateTopic'),
+            '/State': device_config.get('ChargerStateTopic'),
+            '/Pv/V': device_config.get('PvVoltageStateTopic'),
+            '/Yield/Power': device_config.get('PvPowerStateTopic'),
+            '/Yield/User': device_config.get('TotalYield'),
+            '/Yield/System': device_config.get('SystemYield')
         }
         self.dbus_path_to_state_topic_map = {k: v for k, v in self.dbus_path_to_state_topic_map.items() if v and 'path/to/mqtt' not in v}
-
-        self.mqtt_subscriptions = set(self.dbus_path_to_state_topic_map.values()) # Store topics this instance cares about
+        for path, initial_value in self._OPTIONAL_PATHS:
+            if path in self.dbus_path_to_state_topic_map:
+                self.add_path(path, initial_value)
+
+        # Topic -> D-Bus path for incoming messages (reversed so the first path wins if two share a topic)
+        self.state_topic_to_dbus_path = {topic: path for path, topic in reversed(self.dbus_path_to_state_topic_map.items())}
+        self.mqtt_subscriptions = frozenset(self.state_topic_to_dbus_path) # Topics this instance cares about
+        # Last value handed to D-Bus per MQTT-driven path, so repeated values are dropped without reading D-Bus
+        self._last_values = {path: self[path] for path in self.dbus_path_to_state_topic_map}
         for topic in self.mqtt_subscriptions:
-            logger.debug(f"DbusPvCharger '{self['/CustomName']}' will subscribe to topic: {topic}")
+            logger.debug(f"DbusPvCharger '{self.custom_name}' will subscribe to topic: {topic}")
 
         self.register()
 
-        logger.info(f"Service '{service_name}' for device '{self['/CustomName']}' registered on D-Bus.")
+        logger.info(f"Service '{service_name}' for device '{self.custom_name}' registered on D-Bus.")
 
     def on_mqtt_message_specific(self, client, userdata, msg):
         # Check if the topic is one this instance is interested in
-        if msg.topic not in self.mqtt_subscriptions:
-            return # Not for this instance
-
-        logger.debug(f"DbusPvCharger specific MQTT callback triggered for {self['/CustomName']} on topic '{msg.topic}'")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"DbusPvCharger specific MQTT callback triggered for {self.custom_name} on topic '{msg.topic}'")
         try:
-            payload_str = msg.payload.decode().strip()
+            payload = msg.payload.strip() # bytes; decoded only for log messages
             topic = msg.topic
-            dbus_path = next((k for k, v in self.dbus_path_to_state_topic_map.items() if v == topic), None)
+            dbus_path = self.state_topic_to_dbus_path.get(topic)
             if not dbus_path:
                 return
 
             value = None
-            try:
+            # The first byte tells JSON from a plain value, so neither path has to fail first
+            if payload.startswith((b'{', b'[')):
                 # Attempt to parse as JSON with a "value" key
-                incoming_json = json.loads(payload_str)
-                if isinstance(incoming_json, dict) and "value" in incoming_json:
-                    value = incoming_json["value"]
-                else: # Fallback for plain numeric JSON
-                    value = float(payload_str)
-            except (json.JSONDecodeError, ValueError):
-                # If not JSON, handle as plain string or number
-                if dbus_path == '/State':
-                    state_map = {'off': 0, 'bulk': 3, 'absorption': 4, 'float': 5}
-                    try: value = int(payload_str)
-                    except ValueError: value = state_map.get(payload_str.lower())
-                elif dbus_path == '/Load/State':
-                    state_map = {'off': 0, 'on': 1}
-                    try: value = int(payload_str)
-                    except ValueError: value = state_map.get(payload_str.lower())
-                else:
-                    try: value = float(payload_str)
-                    except ValueError:
-                        logger.warning(f"DbusPvCharger: Payload '{payload_str}' for topic '{topic}' is not a valid float or recognized state string.")
-                        return
+                try:
+                    incoming_json = json_loads(payload)
+                except json.JSONDecodeError:
+                    incoming_json = None
+                if isinstance(incoming_json, dict):
+                    value = incoming_json.get("value")
+            # If not JSON, handle as plain string or number
+            elif dbus_path in self.STATE_WORDS:
+                # State words are looked up first so they don't go through a failing int()
+                value = self.STATE_WORDS[dbus_path].get(payload.lower())
+                if value is None:
+                    try: value = int(payload)
+                    except ValueError: pass
+            else:
+                try: value = float(payload)
+                except ValueError:
+                    logger.warning(f"DbusPvCharger: Payload '{payload.decode(errors='replace')}' for topic '{topic}' is not a valid float or recognized state string.")
+                    return
 
             if value is None:
-                logger.warning(f"DbusPvCharger: Could not extract a valid value from payload '{payload_str}' for topic '{topic}'.")
+                logger.warning(f"DbusPvCharger: Could not extract a valid value from payload '{payload.decode(errors='replace')}' for topic '{topic}'.")
                 return
 
-            if self[dbus_path] != value:
-                logger.debug(f"DbusPvCharger: Updating D-Bus path '{dbus_path}' to {value} for '{self['/CustomName']}'.")
-                GLib.idle_add(self.update_dbus_from_mqtt, dbus_path, value)
+            # Rounded before the comparison, so changes below the published resolution don't reach D-Bus
+            if isinstance(value, (float, int)):
+                value = round(value, 2)
+
+            if self._last_values[dbus_path] != value:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"DbusPvCharger: Updating D-Bus path '{dbus_path}' to {value} for '{self.custom_name}'.")
+                self._last_values[dbus_path] = value
+                queue_dbus_update(self, dbus_path, value)
 
         except Exception as e:
-            logger.error(f"Error processing MQTT message for PV Charger {self.service_name} on topic {msg.topic}: {e}")
-            traceback.print_exc()
+            logger.error(f"Error processing MQTT message for PV Charger {self.service_name} on topic {msg.topic}: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
 
     def handle_dbus_change(self, path, value):
         section_name = f'Pv_Charger_{self.device_index}'
         if path == '/CustomName':
-            self.save_config_change(section_name, 'CustomName', value)
+            self.custom_name = value
+            save_config_change(section_name, 'CustomName', value)
             return True
         return False
 
-    def save_config_change(self, section, key, value):
-        config = configparser.ConfigParser()
-        try:
-            config.read(CONFIG_FILE_PATH)
-            if not config.has_section(section):
-                config.add_section(section)
-            config.set(section, key, str(value))
-            with open(CONFIG_FILE_PATH, 'w') as f:
-                config.write(f)
-            logger.debug(f"Saved config: Section=[{section}], Key='{key}', Value='{value}'")
-        except Exception as e:
-            logger.error(f"Failed to save config change for PV Charger: {e}")
-            traceback.print_exc()
-
     def update_dbus_from_mqtt(self, path, value):
-        if isinstance(value, (float, int)):
-            self[path] = round(value, 2)
-        else:
-            self[path] = value
+        self[path] = value # Already rounded by on_mqtt_message_specific()
         return False
 
 # ====================================================================
@@ -1158,24 +1420,35 @@ class DbusPvCharger(VeDbusService):
 # ====================================================================
 # --- Improved Global MQTT Connect Callback ---
 def on_mqtt_connect_global(client, userdata, flags, rc, properties):
+    global _mqtt_reconnect_delay
     if rc == 0:
         logger.info("Successfully connected to MQTT Broker!")
+        # Like paho's own loop, only a CONNACK accepting the connection resets the reconnect back-off
+        _mqtt_reconnect_delay = MQTT_RECONNECT_MIN_DELAY_S
         # Userdata should contain the set of topics to subscribe to
         if userdata:
             logger.info("Re-subscribing to topics...")
-            for topic in userdata:
-                client.subscribe(topic)
-                logger.debug(f"Subscribed to topic: {topic}")
+            # One SUBSCRIBE packet for all topics, QoS 0: values are only ever the latest reading
+            client.subscribe([(topic, 0) for topic in userdata])
+            if logger.isEnabledFor(logging.DEBUG):
+                for topic in userdata:
+                    logger.debug(f"Subscribed to topic: {topic}")
     else:
         logger.error(f"Failed to connect to MQTT Broker, return code {rc}")
 
 # --- Global MQTT Message Dispatcher ---
+# Messages for subscribed topics are routed by paho straight to the owning service (see
+# message_callback_add() in main), so only messages without a topic callback end up here.
 def on_mqtt_message_dispatcher(client, userdata, msg):
-    logger.debug(f"GLOBAL MQTT MESSAGE RECEIVED: Topic='{msg.topic}', Payload='{msg.payload.decode()}'")
-    # Iterate through all active services and dispatch the message
-    for service in active_services:
-        # Each service will internally check if the message is relevant to its subscriptions
-        service.on_mqtt_message_specific(client, userdata, msg)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"MQTT message on topic '{msg.topic}' has no matching service. Ignoring.")
+
+def make_topic_fan_out(handlers):
+    """Returns a single paho topic callback that passes each message to several services sharing a topic."""
+    def fan_out(client, userdata, msg):
+        for handler in handlers:
+            handler(client, userdata, msg)
+    return fan_out
 
 # --- ADDED: Global MQTT Disconnect Callback ---
 def on_mqtt_disconnect(client, userdata, rc, properties=None, reason=None): # Added properties and reason
@@ -1185,6 +1458,55 @@ def on_mqtt_disconnect(client, userdata, rc, properties=None, reason=None): # Ad
 def on_mqtt_subscribe(client, userdata, mid, granted_qos, properties=None):
     logger.debug(f"MQTT Subscription acknowledged by broker. Message ID: {mid}, Granted QoS: {granted_qos}")
 
+# --- MQTT network I/O on the GLib main loop ---
+# The client's socket is watched by GLib instead of running paho's own network thread (loop_start()),
+# so MQTT callbacks run on the main loop like the D-Bus callbacks. paho reports socket changes through
+# the on_socket_* callbacks below; keepalive and reconnects are driven by _mqtt_loop_misc().
+_mqtt_io_sources = {} # 'read' / 'write' -> GLib watch on the client's socket
+_mqtt_reconnect_delay = MQTT_RECONNECT_MIN_DELAY_S
+_mqtt_next_reconnect = 0.0
+
+def _on_mqtt_socket_io(fd, condition, handler):
+    handler()
+    return True # paho removes the watch itself (on_socket_close/on_socket_unregister_write) when done
+
+def on_mqtt_socket_open(client, userdata, sock):
+    _mqtt_io_sources['read'] = GLib.io_add_watch(sock.fileno(), GLib.PRIORITY_DEFAULT, GLib.IO_IN | GLib.IO_ERR | GLib.IO_HUP,
+                                                 _on_mqtt_socket_io, client.loop_read)
+
+def on_mqtt_socket_close(client, userdata, sock):
+    for source_id in _mqtt_io_sources.values():
+        GLib.source_remove(source_id)
+    _mqtt_io_sources.clear()
+
+def on_mqtt_socket_register_write(client, userdata, sock):
+    if 'write' not in _mqtt_io_sources:
+        _mqtt_io_sources['write'] = GLib.io_add_watch(sock.fileno(), GLib.PRIORITY_DEFAULT, GLib.IO_OUT,
+                                                      _on_mqtt_socket_io, client.loop_write)
+
+def on_mqtt_socket_unregister_write(client, userdata, sock):
+    source_id = _mqtt_io_sources.pop('write', None)
+    if source_id is not None:
+        GLib.source_remove(source_id)
+
+def _mqtt_loop_misc(client):
+    """Periodic MQTT housekeeping: keepalive pings while connected, reconnects with back-off while not."""
+    global _mqtt_reconnect_delay, _mqtt_next_reconnect
+    if client.socket() is not None:
+        client.loop_misc()
+        return True # Keep the timer running
+    now = time.monotonic()
+    if now >= _mqtt_next_reconnect:
+        # The next attempt waits for the back-off even if this one opens the socket: the broker can still
+        # refuse the CONNECT (e.g. bad credentials). on_mqtt_connect_global resets the delay once it accepts.
+        _mqtt_next_reconnect = now + _mqtt_reconnect_delay
+        try:
+            client.reconnect() # on_mqtt_connect_global re-subscribes once the broker accepts the connection
+        except Exception as e:
+            logger.warning(f"Reconnecting to MQTT broker failed: {e}. Retrying in {_mqtt_reconnect_delay}s.")
+        _mqtt_reconnect_delay = min(_mqtt_reconnect_delay * 2, MQTT_RECONNECT_MAX_DELAY_S)
+    return True # Keep the timer running
+
 
 # ====================================================================
 # Main Launcher (Refactored to run all services in one process)
@@ -1212,6 +1534,11 @@ def main():
     except configparser.Error as e:
         logger.critical(f"Error parsing config file: {e}")
         sys.exit(1)
+
+    # Load the shared config used for saving D-Bus setting changes now, so the first change made
+    # from the GUI doesn't parse the file inside a D-Bus callback. It is a separate parser from
+    # 'config' because DeviceIndex gets injected into the latter and must never be written back.
+    _get_config()
     
     # Configure logging level based on config
     log_level = logging.INFO
@@ -1235,6 +1562,7 @@ def main():
     
     # This set will be populated BEFORE we connect
     all_topics_to_subscribe = set()
+    topic_handlers = {} # topic -> message handlers of the services subscribed to it
     mqtt_client.user_data_set(all_topics_to_subscribe)
 
     # Assign global callbacks
@@ -1242,6 +1570,13 @@ def main():
     mqtt_client.on_message = on_mqtt_message_dispatcher
     mqtt_client.on_subscribe = on_mqtt_subscribe
     mqtt_client.on_disconnect = on_mqtt_disconnect
+    mqtt_client.on_socket_open = on_mqtt_socket_open
+    mqtt_client.on_socket_close = on_mqtt_socket_close
+    mqtt_client.on_socket_register_write = on_mqtt_socket_register_write
+    mqtt_client.on_socket_unregister_write = on_mqtt_socket_unregister_write
+    # Reconnects run on the main loop and stall every D-Bus service while the socket connects, so don't
+    # wait paho's default 5s for an unreachable broker. Name resolution of BrokerAddress still blocks.
+    mqtt_client.connect_timeout = MQTT_CONNECT_TIMEOUT_S
     
     if MQTT_USERNAME and MQTT_PASSWORD:
         mqtt_client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
@@ -1249,45 +1584,47 @@ def main():
     
     # MODIFICATION: Connection logic is MOVED to after the device setup loop.
 
-    device_type_map = {
-        'relay_module_': DbusSwitch,
-        'temp_sensor_': DbusTempSensor,
-        'tank_sensor_': DbusTankSensor,
-        'virtual_battery_': DbusBattery,
-        'input_': DbusDigitalInput,
-        'pv_charger_': DbusPvCharger # Added PV Charger
+    device_type_map = { # Keys are the section prefixes matched by _DEVICE_SECTION_RE
+        'relay_module': DbusSwitch,
+        'temp_sensor': DbusTempSensor,
+        'tank_sensor': DbusTankSensor,
+        'virtual_battery': DbusBattery,
+        'input': DbusDigitalInput,
+        'pv_charger': DbusPvCharger # Added PV Charger
+    }
+    service_type_map = { # Device type -> service type in com.victronenergy.<type>.external_<serial>
+        'relay_module': 'switch',
+        'temp_sensor': 'temperature',
+        'tank_sensor': 'tank',
+        'virtual_battery': 'battery',
+        'input': 'digitalinput',
+        'pv_charger': 'solarcharger'
     }
 
-    sections_to_process = []
     for section in config.sections():
         section_lower = section.lower()
-        if section_lower in ['global', 'mqtt']:
+        if section_lower in ('global', 'mqtt'):
             continue
         # RE-ENABLED: This correctly skips [switch_X_Y] sections from being processed as top-level devices
-        if section_lower.startswith('switch_') and re.match(r'^switch_\d+_\d+$', section_lower):
+        if _SWITCH_SUBSECTION_RE.match(section_lower):
             logger.debug(f"Section '{section}' appears to be a switch output configuration. It will be processed by its parent Relay_Module. Skipping direct device creation.")
             continue
-        sections_to_process.append(section)
 
-
-    for section in sections_to_process:
-        section_lower = section.lower()
         device_class = None
         device_type_string = None 
 
-        for prefix, cls in device_type_map.items():
-            if section_lower.startswith(prefix): # This is the key comparison for identifying the device type
-                device_class = cls
-                device_type_string = prefix.strip('_')
-                logger.debug(f"Section '{section}' matched device type '{device_type_string}' (prefix '{prefix}').")
-                break
+        device_type_match = _DEVICE_SECTION_RE.match(section_lower) # Identifies the device type by section prefix
+        if device_type_match:
+            device_type_string = device_type_match.group(1)
+            device_class = device_type_map[device_type_string]
+            logger.debug(f"Section '{section}' matched device type '{device_type_string}' (prefix '{device_type_string}_').")
         
         if device_class:
             try:
                 device_config = config[section]
                 
                 # Determine device_index for the current section
-                device_index_match = re.search(r'_(\d+)', section)
+                device_index_match = _DEVICE_INDEX_RE.search(section)
                 device_index = device_index_match.group(1) if device_index_match else '0'
                 device_config['DeviceIndex'] = device_index # Inject DeviceIndex into config for class access
 
@@ -1302,15 +1639,7 @@ def main():
                 device_bus = dbus.bus.BusConnection(dbus.Bus.TYPE_SYSTEM)
                 
                 # Default service name uses 'external_' prefix and device type
-                base_service_name_type = device_type_string.replace("_", "")
-                if base_service_name_type == 'relaymodule': base_service_name_type = 'switch'
-                elif base_service_name_type == 'input': base_service_name_type = 'digitalinput'
-                elif base_service_name_type == 'tanksensor': base_service_name_type = 'tank'
-                elif base_service_name_type == 'tempsensor': base_service_name_type = 'temperature'
-                elif base_service_name_type == 'virtualbattery': base_service_name_type = 'battery'
-                elif base_service_name_type == 'pvcharger': base_service_name_type = 'solarcharger' # Added for PV Charger
-                
-                service_name = f'com.victronenergy.{base_service_name_type}.external_{serial_number}'
+                service_name = f'com.victronenergy.{service_type_map[device_type_string]}.external_{serial_number}'
 
                 if device_class == DbusSwitch:
                     # This branch is now ONLY for Relay_Module_X sections (multi-output switch modules)
@@ -1350,6 +1679,8 @@ def main():
 
                 # Collect topics to subscribe to centrally
                 all_topics_to_subscribe.update(service.mqtt_subscriptions)
+                for topic in service.mqtt_subscriptions:
+                    topic_handlers.setdefault(topic, []).append(service.on_mqtt_message_specific)
 
             except Exception as e:
                 logger.error(f"Failed to initialize D-Bus service for [{section}] ({device_type_string}): {e}")
@@ -1357,28 +1688,41 @@ def main():
         else:
             logger.warning(f"Section '{section}' does not match any known device type prefix. Skipping.")
 
+    # Let paho route each topic directly to its service(s) instead of offering every message to every service
+    for topic, handlers in topic_handlers.items():
+        mqtt_client.message_callback_add(topic, handlers[0] if len(handlers) == 1 else make_topic_fan_out(handlers))
+
     # MODIFICATION: Now that all topics are known, connect to the broker.
     # The on_connect callback will fire and subscribe to everything in the populated set.
     try:
-        mqtt_client.connect(MQTT_HOST, MQTT_PORT, 60)
-        mqtt_client.loop_start() # Start the MQTT network loop in a separate thread
-        logger.info(f"Connecting to MQTT broker at {MQTT_HOST}:{MQTT_PORT}...")
+        mqtt_client.connect_async(MQTT_HOST, MQTT_PORT, 60) # Only validates and stores the broker settings
     except Exception as e:
-        logger.critical(f"Initial connection to MQTT broker failed: {e}. Exiting.")
+        logger.critical(f"Invalid MQTT broker settings: {e}. Exiting.")
         traceback.print_exc()
         sys.exit(1)
+    logger.info(f"Connecting to MQTT broker at {MQTT_HOST}:{MQTT_PORT}...")
+    try:
+        mqtt_client.reconnect()
+    except Exception as e:
+        # Handled like a dropped connection: the D-Bus services stay up and _mqtt_loop_misc keeps retrying with back-off
+        logger.error(f"Initial connection to MQTT broker failed: {e}. Retrying in the background.")
+    GLib.timeout_add_seconds(MQTT_MISC_INTERVAL_S, _mqtt_loop_misc, mqtt_client) # Network I/O itself is driven by the socket watches
     
     if not active_services:
         logger.warning("No device services were started. Exiting.")
         if mqtt_client:
-            mqtt_client.loop_stop()
             mqtt_client.disconnect()
+            mqtt_client.loop_write() # The main loop isn't running, so send the DISCONNECT packet directly
         sys.exit(0)
 
     logger.info('All identified external device services created. Starting GLib.MainLoop().')
     
     # Keep the main loop running to maintain D-Bus services and MQTT client
     mainloop = GLib.MainLoop()
+    # The service is normally stopped with SIGTERM (svc -d/-t, shutdown). Quit the main loop instead of dying
+    # outright, so the finally block below still writes pending config changes and disconnects cleanly.
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        GLib.unix_signal_add(GLib.PRIORITY_HIGH, signum, mainloop.quit)
     try:
         mainloop.run()
     except KeyboardInterrupt:
@@ -1387,10 +1731,11 @@ def main():
         logger.error(f"An unexpected error occurred in the main loop: {e}")
         traceback.print_exc()
     finally:
+        flush_pending_config()
         # Cleanup: Disconnect MQTT client cleanly
         if mqtt_client:
-            mqtt_client.loop_stop()
             mqtt_client.disconnect()
+            mqtt_client.loop_write() # The main loop has stopped, so send the DISCONNECT packet directly
             logger.debug("MQTT client disconnected.")
         logger.debug("Script finished.")
 